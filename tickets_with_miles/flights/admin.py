@@ -1,6 +1,19 @@
 from django.contrib import admin
-from .models import Airport
+from .models import Airport, PriceAlert, Watch
 
 @admin.register(Airport)
 class AirportAdmin(admin.ModelAdmin):
-    list_display = ('name', 'iata_code', 'state_code', 'country_code', 'country_name')
\ No newline at end of file
+    list_display = ('name', 'iata_code', 'state_code', 'country_code', 'country_name')
+
+
+@admin.register(Watch)
+class WatchAdmin(admin.ModelAdmin):
+    list_display = ('email', 'origin', 'destination', 'flight_date', 'max_miles', 'active', 'last_checked_at', 'alerted_miles')
+    list_filter = ('active',)
+    search_fields = ('email', 'origin', 'destination')
+
+
+@admin.register(PriceAlert)
+class PriceAlertAdmin(admin.ModelAdmin):
+    list_display = ('watch', 'miles', 'airline', 'stops', 'triggered_at')
+    list_select_related = ('watch',)
@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .airport_index import AirportIndex, get_airport_index
+
+# Airports served by each metropolitan area, under its IATA city code.
+DEFAULT_AIRPORT_GROUPS: Dict[str, Tuple[str, ...]] = {
+    'BHZ': ('CNF', 'PLU'),
+    'RIO': ('GIG', 'SDU'),
+    'SAO': ('GRU', 'CGH', 'VCP'),
+    'BUE': ('EZE', 'AEP'),
+    'CHI': ('ORD', 'MDW'),
+    'LON': ('LHR', 'LGW', 'STN', 'LTN', 'LCY'),
+    'MIL': ('MXP', 'LIN', 'BGY'),
+    'NYC': ('JFK', 'EWR', 'LGA'),
+    'PAR': ('CDG', 'ORY'),
+    'ROM': ('FCO', 'CIA'),
+    'TYO': ('HND', 'NRT'),
+    'WAS': ('IAD', 'DCA', 'BWI'),
+}
+
+_REGION = re.compile(r'^[A-Z]{2}(-[A-Z0-9]{1,3})?$')
+
+
+def get_airport_groups() -> Dict[str, Tuple[str, ...]]:
+    """
+    Returns the metropolitan airport groups, from the FLIGHT_AIRPORT_GROUPS setting or the defaults.
+    """
+    return getattr(settings, 'FLIGHT_AIRPORT_GROUPS', DEFAULT_AIRPORT_GROUPS)
+
+
+def resolve_airports(spec: str, index: Optional[AirportIndex] = None) -> Tuple[str, ...]:
+    """
+    Expands an origin or destination typed in a search into its IATA codes.
+
+    The spec is a comma-separated list of any of: an airport code ('GRU'), a city
+    group code ('SAO'), a country code ('BR') or a state within a country ('BR-SP').
+    Groups take precedence over airports sharing their code, and only the group's
+    airports in the index are kept.
+
+    Plain airport codes are returned as they are, without the index, so resolving
+    them never queries the database.
+
+    Args:
+        spec: The text typed, in any case.
+        index: The airport index, by default the process-wide one, used for groups and regions.
+
+    Returns:
+        The IATA codes, without duplicates, in the order given.
+
+    Raises:
+        ValueError: If part of the spec is empty or names an unknown region.
+    """
+    groups = get_airport_groups()
+    codes: List[str] = []
+    for part in spec.upper().split(','):
+        part = part.strip()
+        if not part:
+            raise ValueError(f"Empty airport in {spec!r}")
+        if part in groups:
+            index = index or get_airport_index()
+            codes.extend(code for code in groups[part] if code in index)
+        elif _REGION.match(part):
+            index = index or get_airport_index()
+            airports = index.airports_in(part)
+            if not airports:
+                raise ValueError(f"Unknown region: {part!r}")
+            codes.extend(airports)
+        else:
+            codes.append(part)
+    return tuple(dict.fromkeys(codes))
+
+
+def is_airport_code(spec: str, index: Optional[AirportIndex] = None) -> bool:
+    """
+    Returns whether the spec is a single airport of the index, as an uppercase IATA
+    code, rather than a group, a region or a list, even one resolving to one airport.
+    """
+    try:
+        airports = resolve_airports(spec, index)
+    except ValueError:
+        return False
+    return airports == (spec,) and spec in (index or get_airport_index())
+
+
+def needs_airport_index(spec: str) -> bool:
+    """
+    Returns whether resolving the spec reads the airport index, which may load it from
+    the database: whether it names a group or a region rather than only airports.
+    """
+    groups = get_airport_groups()
+    return any(
+        part.strip() in groups or _REGION.match(part.strip())
+        for part in spec.upper().split(',')
+    )
+
+
+def resolve_routes(origin: str, destination: str, index: Optional[AirportIndex] = None) -> List[Tuple[str, str]]:
+    """
+    Returns every (origin, destination) pair of airports of two specs, skipping pairs
+    of the same airport.
+
+    Args:
+        origin: The origin spec, as taken by `resolve_airports`.
+        destination: The destination spec.
+        index: The airport index, by default the process-wide one.
+
+    Returns:
+        The routes, origins in the order given, each once.
+    """
+    origins = resolve_airports(origin, index)
+    destinations = resolve_airports(destination, index)
+    return [(start, end) for start in origins for end in destinations if start != end]
+
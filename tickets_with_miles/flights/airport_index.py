@@ -0,0 +1,110 @@
+import csv
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .models import Airport
+
+
+class AirportIndex:
+    """
+    Immutable set of known IATA codes, used to validate searches without querying the database.
+
+    The codes are also grouped by region: by country ('BR') and by state within a
+    country ('BR-SP'), so searches can cover every airport of a region.
+    """
+
+    CSV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'airports.csv')
+
+    def __init__(self, iata_codes: Iterable[str], regions: Optional[Dict[str, Iterable[str]]] = None):
+        self.iata_codes: FrozenSet[str] = frozenset(code.upper() for code in iata_codes)
+        self.regions: Dict[str, Tuple[str, ...]] = {
+            region.upper(): tuple(sorted(code.upper() for code in codes))
+            for region, codes in (regions or {}).items()
+        }
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[str, str, str]]) -> 'AirportIndex':
+        """
+        Builds the index from (iata_code, state_code, country_code) rows.
+        """
+        iata_codes = []
+        regions: Dict[str, List[str]] = defaultdict(list)
+        for iata_code, state_code, country_code in rows:
+            iata_codes.append(iata_code)
+            if country_code:
+                regions[country_code].append(iata_code)
+                if state_code:
+                    regions[f'{country_code}-{state_code}'].append(iata_code)
+        return cls(iata_codes, regions)
+
+    @classmethod
+    def from_database(cls) -> 'AirportIndex':
+        """
+        Builds the index from the Airport table.
+        """
+        return cls.from_rows(Airport.objects.values_list('iata_code', 'state_code', 'country_code'))
+
+    @classmethod
+    def from_csv(cls, csv_path: Optional[str] = None) -> 'AirportIndex':
+        """
+        Builds the index from an airports CSV file, by default the bundled dataset.
+        """
+        with open(csv_path or cls.CSV_PATH, 'r', encoding='utf-8') as file:
+            return cls.from_rows(
+                (row['iata_code'], row['state_code'], row['country_code'])
+                for row in csv.DictReader(file)
+            )
+
+    def airports_in(self, region: str) -> Tuple[str, ...]:
+        """
+        Returns the IATA codes of a country ('BR') or state ('BR-SP'), or none if it is unknown.
+        """
+        return self.regions.get(region.upper(), ())
+
+    def __contains__(self, iata_code: str) -> bool:
+        return iata_code.upper() in self.iata_codes
+
+    def __len__(self) -> int:
+        return len(self.iata_codes)
+
+
+_airport_index: Optional[AirportIndex] = None
+_airport_index_lock = threading.Lock()
+
+
+def get_airport_index() -> AirportIndex:
+    """
+    Returns the process-wide airport index, building it on first use.
+
+    The source is chosen by the FLIGHT_AIRPORT_INDEX_SOURCE setting: 'database'
+    (the Airport table) or 'csv' (the bundled airports dataset).
+
+    Returns:
+        The shared AirportIndex.
+    """
+    global _airport_index
+    index = _airport_index
+    if index is not None:
+        return index
+    with _airport_index_lock:
+        if _airport_index is None:
+            if getattr(settings, 'FLIGHT_AIRPORT_INDEX_SOURCE', 'database') == 'csv':
+                _airport_index = AirportIndex.from_csv()
+            else:
+                _airport_index = AirportIndex.from_database()
+        return _airport_index
+
+
+def invalidate_airport_index(*args, **kwargs) -> None:
+    """
+    Discards the process-wide airport index so the next lookup rebuilds it.
+
+    Accepts and ignores signal arguments so it can be connected to model signals.
+    """
+    global _airport_index
+    with _airport_index_lock:
+        _airport_index = None
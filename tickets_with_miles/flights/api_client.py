@@ -1,8 +1,33 @@
 import aiohttp
 import asyncio
-from datetime import date
-from typing import Optional, Dict, Any, List
+import atexit
+import threading
+import weakref
+from datetime import date, datetime
+from typing import Optional, Dict, Any, List, Set, Tuple, AsyncIterator, Awaitable, Callable
 from django.conf import settings
+from django.utils import timezone
+
+from .cache import SearchCache
+from .decoding import Decoder, get_response_decoder
+from .fare_history import FareHistoryRecorder
+from .metrics import UPSTREAM_FAILURES, UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, UPSTREAM_REQUESTS, UPSTREAM_RETRIES
+from .retry import RetryPolicy
+from .throttling import SharedRateLimiter, TokenBucket
+from .timing import build_trace_config, count, current_timings, span, timed, timing_mode
+
+
+class SearchResult(dict):
+    """
+    API response data annotated with the number of attempts it took to obtain.
+
+    Successful responses also carry when they were fetched, `fetched_at`.
+    """
+
+    def __init__(self, data: Dict[str, Any], attempts: int = 1, fetched_at: Optional[datetime] = None):
+        super().__init__(data)
+        self.attempts = attempts
+        self.fetched_at = fetched_at
 
 
 class FlightAPIClient:
@@ -12,17 +37,101 @@ class FlightAPIClient:
 
     BASE_URL = 'https://api-air-flightsearch-blue.smiles.com.br/v1/airlines/search'
     TIMEOUT = 30  # seconds
+    CONNECTOR_LIMIT = 100
+    KEEPALIVE_TIMEOUT = 30  # seconds
+    DNS_CACHE_TTL = 300  # seconds
+    MAX_CONCURRENCY = 10
+    RATE_LIMIT = 10.0  # requests per second
+    RATE_LIMIT_BURST = 10
+    RETRY_BUDGET = 20  # seconds of retrying allowed per search or bulk search
+
+    # One pooled session per event loop, shared by every client instance.
+    _sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+    # Tasks closing each pooled session on loop shutdown; referenced here so they aren't collected.
+    _session_watchers: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
 
-    def __init__(self, api_key: Optional[str] = None, telemetry: Optional[str] = None):
+    # Upstream calls in flight per event loop, keyed by search, so identical searches share one.
+    _in_flight: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]' = (
+        weakref.WeakKeyDictionary()
+    )
+
+    # Background refreshes of stale cached responses per event loop.
+    _refreshes: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Set[asyncio.Task]]' = (
+        weakref.WeakKeyDictionary()
+    )
+
+    # Process-wide limiter shared by every search, created on first use.
+    _rate_limiter: Optional[TokenBucket] = None
+    _rate_limiter_lock = threading.Lock()
+
+    # Limiter shared with the other processes through FLIGHT_API_RATE_LIMIT_CACHE, if set.
+    _shared_rate_limiter: Optional[SharedRateLimiter] = None
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        telemetry: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        cache: Optional[SearchCache] = None,
+        decoder: Optional[Decoder] = None,
+        rate_limit_keep: Optional[float] = None,
+        base_url: Optional[str] = None,
+        rate_limit_share: Optional[float] = None,
+        fare_history: Optional[FareHistoryRecorder] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
         """
         Initialize the FlightAPIClient with necessary headers.
 
         Args:
             api_key: The API key for authentication.
             telemetry: Akamai telemetry token.
+            max_concurrency: Maximum number of requests a bulk search keeps in flight.
+            retry_policy: Policy for retrying failed requests.
+            cache: Cache of successful responses consulted before calling the API.
+            decoder: Function decoding response bodies, by default the one chosen by
+                the FLIGHT_API_JSON_DECODER setting.
+            rate_limit_keep: If set, the client runs in the background: its requests only
+                take spare tokens from the shared rate limiters, leaving this many for
+                interactive searches, which therefore always go first.
+            base_url: URL of the search endpoint, by default the FLIGHT_API_BASE_URL
+                setting or the Smiles API, for example a local replay server.
+            rate_limit_share: If set, the client's requests are also paced by a limiter
+                of its own at this fraction of FLIGHT_API_RATE_LIMIT, so in the long run it
+                never takes more than that share of the rate, even when the shared limiters
+                have tokens to spare.
+            fare_history: Fare history the fares of every response fetched from the API
+                are recorded in, once, whatever the number of searches the cache serves it to.
+            rate_limiter: Limiter pacing the client's requests instead of the process-wide and
+                shared ones, for endpoints other than the Smiles API, such as a replay server.
+
+        Raises:
+            ValueError: If the rate limit share isn't between 0 and 1.
         """
         self.api_key = api_key or settings.FLIGHT_API_KEY
         self.telemetry = telemetry or settings.AKAMAI_TELEMETRY
+        self.max_concurrency = max_concurrency or getattr(
+            settings, 'FLIGHT_API_MAX_CONCURRENCY', self.MAX_CONCURRENCY
+        )
+        self.retry_policy = retry_policy or RetryPolicy.from_settings()
+        self.cache = cache
+        self.decoder = decoder or get_response_decoder()
+        self.rate_limit_keep = rate_limit_keep
+        self.fare_history = fare_history
+        self.rate_limiter = rate_limiter
+        self.share_limiter: Optional[TokenBucket] = None
+        if rate_limit_share is not None:
+            if not 0 < rate_limit_share <= 1:
+                raise ValueError("The rate limit share must be greater than 0 and at most 1.")
+            self.share_limiter = TokenBucket(
+                rate=getattr(settings, 'FLIGHT_API_RATE_LIMIT', self.RATE_LIMIT) * rate_limit_share,
+                capacity=max(
+                    1, getattr(settings, 'FLIGHT_API_RATE_LIMIT_BURST', self.RATE_LIMIT_BURST) * rate_limit_share
+                ),
+            )
+        self.base_url = base_url or getattr(settings, 'FLIGHT_API_BASE_URL', None) or self.BASE_URL
 
         self.headers = {
             'Accept': 'application/json, text/plain, */*',
@@ -43,28 +152,367 @@ class FlightAPIClient:
             'x-api-key': self.api_key,
         }
 
-    async def fetch(self, session: aiohttp.ClientSession, params: Dict[str, Any]) -> Dict[str, Any]:
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the pooled session bound to the running event loop, creating it if needed.
+
+        The session keeps connections alive and caches DNS lookups, so consecutive
+        searches reuse the same TCP/TLS connections to the Smiles endpoint. When
+        FLIGHT_SEARCH_TIMINGS is set, it also times the phases of each request.
+
+        Returns:
+            The shared aiohttp ClientSession for the current event loop.
+        """
+        loop = asyncio.get_running_loop()
+        self.discard_stale_sessions()
+
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=getattr(settings, 'FLIGHT_API_CONNECTOR_LIMIT', self.CONNECTOR_LIMIT),
+                keepalive_timeout=getattr(settings, 'FLIGHT_API_KEEPALIVE_TIMEOUT', self.KEEPALIVE_TIMEOUT),
+                ttl_dns_cache=getattr(settings, 'FLIGHT_API_DNS_CACHE_TTL', self.DNS_CACHE_TTL),
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[build_trace_config()] if timing_mode() else None,
+            )
+            self._sessions[loop] = session
+            # Short-lived loops (asyncio.run, async views under WSGI) cancel their pending
+            # tasks before closing, which lets this watcher close the session in time.
+            self._session_watchers[loop] = loop.create_task(
+                self.close_session_on_shutdown(loop, session)
+            )
+        return session
+
+    @classmethod
+    async def close_session_on_shutdown(
+        cls,
+        loop: asyncio.AbstractEventLoop,
+        session: aiohttp.ClientSession,
+    ) -> None:
+        """
+        Waits until cancelled by the loop shutting down, then closes the session.
+
+        Args:
+            loop: The event loop the session is bound to.
+            session: The pooled session to close.
+        """
+        try:
+            await loop.create_future()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if cls._sessions.get(loop) is session:
+                del cls._sessions[loop]
+                cls._session_watchers.pop(loop, None)
+            await session.close()
+
+    @classmethod
+    async def close_session(cls) -> None:
+        """
+        Closes the pooled session bound to the running event loop, if any.
+
+        Pending background refreshes on this loop are cancelled first.
+        """
+        loop = asyncio.get_running_loop()
+        refreshes = cls._refreshes.pop(loop, set())
+        for task in refreshes:
+            task.cancel()
+        await asyncio.gather(*refreshes, return_exceptions=True)
+
+        watcher = cls._session_watchers.pop(loop, None)
+        if watcher is not None:
+            watcher.cancel()
+        session = cls._sessions.pop(loop, None)
+        if session is not None:
+            await session.close()
+
+    @classmethod
+    def discard_stale_sessions(cls) -> None:
+        """
+        Drops sessions whose event loop has already been closed.
+
+        Their transports died with the loop, so the session is only detached.
+        """
+        for loop in [loop for loop in cls._sessions if loop.is_closed()]:
+            cls._sessions.pop(loop).detach()
+            cls._session_watchers.pop(loop, None)
+
+    @classmethod
+    def close_all_sessions(cls) -> None:
+        """
+        Closes every pooled session. Registered to run when the process exits.
+        """
+        cls.discard_stale_sessions()
+        for loop, session in list(cls._sessions.items()):
+            watcher = cls._session_watchers.pop(loop, None)
+            if loop.is_running():
+                session.detach()
+                continue
+            if watcher is not None:
+                watcher.cancel()
+                loop.run_until_complete(watcher)
+            loop.run_until_complete(session.close())
+        cls._sessions.clear()
+
+    @classmethod
+    def get_rate_limiter(cls) -> TokenBucket:
+        """
+        Returns the process-wide token bucket that paces requests to the Smiles API.
+
+        Returns:
+            The shared TokenBucket.
+        """
+        with cls._rate_limiter_lock:
+            if cls._rate_limiter is None:
+                cls._rate_limiter = TokenBucket(
+                    rate=getattr(settings, 'FLIGHT_API_RATE_LIMIT', cls.RATE_LIMIT),
+                    capacity=getattr(settings, 'FLIGHT_API_RATE_LIMIT_BURST', cls.RATE_LIMIT_BURST),
+                )
+            return cls._rate_limiter
+
+    @classmethod
+    def get_shared_rate_limiter(cls) -> Optional[SharedRateLimiter]:
+        """
+        Returns the limiter shared by every process through the FLIGHT_API_RATE_LIMIT_CACHE setting.
+
+        Returns:
+            The SharedRateLimiter, or None if the setting isn't set and each process
+            only paces itself.
+        """
+        alias = getattr(settings, 'FLIGHT_API_RATE_LIMIT_CACHE', None)
+        if not alias:
+            return None
+        with cls._rate_limiter_lock:
+            if cls._shared_rate_limiter is None:
+                cls._shared_rate_limiter = SharedRateLimiter(
+                    alias, rate=getattr(settings, 'FLIGHT_API_RATE_LIMIT', cls.RATE_LIMIT)
+                )
+            return cls._shared_rate_limiter
+
+    @classmethod
+    def reset_rate_limiter(cls) -> None:
+        """
+        Discards the rate limiters so the next request rebuilds them from settings.
+        """
+        with cls._rate_limiter_lock:
+            cls._rate_limiter = None
+            cls._shared_rate_limiter = None
+
+    async def wait_for_rate_limit(self) -> None:
+        """
+        Waits until the rate limiters let the client send one more request.
+
+        The client's own limiter, if it has a rate limit share, is waited on first, then
+        the process-wide one and, last, the one shared with the other processes, so its
+        budget is only taken when the request is about to be sent. A client given a
+        limiter of its own only waits on that one.
+        """
+        if self.share_limiter is not None:
+            await self.share_limiter.acquire()
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+            return
+        if self.rate_limit_keep is None:
+            await self.get_rate_limiter().acquire()
+        else:
+            await self.get_rate_limiter().acquire_spare(keep=self.rate_limit_keep)
+        shared = self.get_shared_rate_limiter()
+        if shared is not None:
+            await shared.acquire(keep=self.rate_limit_keep or 0)
+
+    async def fetch(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict[str, Any],
+        deadline: Optional[float] = None,
+    ) -> 'SearchResult':
         """
         Helper method to fetch data from the API.
 
+        Fresh responses found in the client's cache are returned without calling the API.
+        Stale ones are returned right away while a background refresh replaces them.
+        Concurrent identical searches share a single upstream call.
+
         Args:
             session: The aiohttp ClientSession.
             params: The query parameters for the API request.
+            deadline: Event loop time after which no further retries are attempted.
 
         Returns:
-            A dictionary containing the API response data.
+            A dictionary containing the API response data, or an 'error' key if every
+            attempt failed. The number of attempts is available as `attempts`.
         """
-        try:
-            async with session.get(
-                self.BASE_URL,
-                headers=self.headers,
-                params=params,
-                timeout=self.TIMEOUT
-            ) as response:
-                response.raise_for_status()
-                return await response.json()
-        except aiohttp.ClientError as e:
-            return {'error': str(e)}
+        key = SearchCache.make_key(params)
+        if self.cache is not None:
+            cached, fresh = self.cache.lookup(key)
+            if cached is not None:
+                count('cache_hit' if fresh else 'cache_stale')
+                if not fresh:
+                    self.refresh_in_background(session, params, key)
+                return cached
+        return await self.fetch_shared(session, params, key, deadline)
+
+    async def fetch_shared(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict[str, Any],
+        key: str,
+        deadline: Optional[float] = None,
+    ) -> 'SearchResult':
+        """
+        Fetches from the API, joining an identical call already in flight on this loop.
+
+        Args:
+            session: The aiohttp ClientSession.
+            params: The query parameters for the API request.
+            key: The cache key identifying the search.
+            deadline: Event loop time after which no further retries are attempted.
+
+        Returns:
+            The API response data shared by every caller of the same search.
+        """
+        in_flight = self._in_flight.setdefault(asyncio.get_running_loop(), {})
+        future = in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch_upstream(session, params, deadline))
+            in_flight[key] = future
+
+            def forget(done: asyncio.Future) -> None:
+                if in_flight.get(key) is done:
+                    del in_flight[key]
+
+            future.add_done_callback(forget)
+        # Shielded so that a cancelled caller doesn't cancel the call for the others.
+        return await asyncio.shield(future)
+
+    def refresh_in_background(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict[str, Any],
+        key: str,
+    ) -> None:
+        """
+        Schedules a refresh of a stale cached response, unless one is already in flight.
+
+        Args:
+            session: The aiohttp ClientSession.
+            params: The query parameters for the API request.
+            key: The cache key identifying the search.
+        """
+        loop = asyncio.get_running_loop()
+        if key in self._in_flight.get(loop, {}):
+            return
+        refreshes = self._refreshes.setdefault(loop, set())
+        task = loop.create_task(self.fetch_shared(session, params, key))
+        refreshes.add(task)
+        task.add_done_callback(refreshes.discard)
+
+    async def fetch_upstream(
+        self,
+        session: aiohttp.ClientSession,
+        params: Dict[str, Any],
+        deadline: Optional[float] = None,
+    ) -> 'SearchResult':
+        """
+        Calls the API, retrying transient failures, and caches a successful response.
+
+        Transient failures (retryable statuses, connection errors and timeouts) are
+        retried according to the client's retry policy while the deadline allows it.
+
+        Args:
+            session: The aiohttp ClientSession.
+            params: The query parameters for the API request.
+            deadline: Event loop time after which no further retries are attempted.
+
+        Returns:
+            A dictionary containing the API response data, or an 'error' key if every
+            attempt failed. The number of attempts is available as `attempts`.
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            attempt += 1
+            with span('rate_limit'):
+                await self.wait_for_rate_limit()
+            UPSTREAM_IN_FLIGHT.inc()
+            started = loop.time()
+            # Left as is if the request is cancelled or fails unexpectedly.
+            outcome = 'aborted'
+            try:
+                async with session.get(
+                    self.base_url,
+                    headers=self.headers,
+                    params=params,
+                    timeout=self.TIMEOUT
+                ) as response:
+                    response.raise_for_status()
+                    decoder = self.decoder if current_timings() is None else timed('decode', self.decoder)
+                    # The body span covers reading the response and decoding it.
+                    with span('body'):
+                        result = SearchResult(
+                            await response.json(loads=decoder), attempts=attempt, fetched_at=timezone.now()
+                        )
+                    outcome = 'ok'
+                    if self.cache is not None:
+                        self.cache.set(SearchCache.make_key(params), result)
+                    if self.fare_history is not None:
+                        self.record_fares(params, result)
+                    return result
+            except aiohttp.ClientResponseError as e:
+                outcome = str(e.status)
+                error = e
+                delay = self.retry_policy.get_delay(attempt, e.status, e.headers)
+            except asyncio.TimeoutError as e:
+                outcome = 'timeout'
+                error = e
+                delay = self.retry_policy.get_delay(attempt)
+            except aiohttp.ClientConnectionError as e:
+                outcome = 'connection_error'
+                error = e
+                delay = self.retry_policy.get_delay(attempt)
+            except aiohttp.ClientError as e:
+                outcome = 'client_error'
+                UPSTREAM_FAILURES.inc()
+                return SearchResult({'error': str(e)}, attempts=attempt)
+            finally:
+                UPSTREAM_IN_FLIGHT.dec()
+                UPSTREAM_REQUESTS.inc(outcome)
+                UPSTREAM_LATENCY.observe(loop.time() - started)
+
+            if delay is None or (deadline is not None and loop.time() + delay > deadline):
+                UPSTREAM_FAILURES.inc()
+                return SearchResult({'error': str(error) or type(error).__name__}, attempts=attempt)
+            UPSTREAM_RETRIES.inc()
+            with span('retry_wait'):
+                await asyncio.sleep(delay)
+
+    def record_fares(self, params: Dict[str, Any], result: 'SearchResult') -> None:
+        """
+        Queues the flights of a response just fetched in the fare history.
+
+        The outbound flights are recorded under the searched route and departure date
+        and, for a round trip, the return flights under the reverse route and return date.
+
+        Args:
+            params: The query parameters of the request.
+            result: The response fetched.
+        """
+        origin, destination = params['originAirportCode'], params['destinationAirportCode']
+        routes = [(origin, destination, params['departureDate'])]
+        if params.get('returnDate'):
+            routes.append((destination, origin, params['returnDate']))
+        for (route_origin, route_destination, day), segment in zip(
+            routes, result.get('requestedFlightSegmentList') or []
+        ):
+            self.fare_history.record_flights(
+                route_origin,
+                route_destination,
+                date.fromisoformat(day),
+                result.fetched_at,
+                segment.get('flightList') or [],
+            )
 
     async def search_flights(
         self,
@@ -75,6 +523,7 @@ class FlightAPIClient:
         adults: int = 1,
         children: int = 0,
         infants: int = 0,
+        time_budget: Optional[float] = None,
     ) -> Dict[str, Any]:
         """
         Searches for flights using the Smiles API.
@@ -87,6 +536,8 @@ class FlightAPIClient:
             adults: Number of adult passengers.
             children: Number of child passengers.
             infants: Number of infant passengers.
+            time_budget: Seconds after which a failed request is no longer retried,
+                by default the FLIGHT_API_RETRY_BUDGET setting.
 
         Returns:
             A dictionary containing the API response data.
@@ -110,20 +561,29 @@ class FlightAPIClient:
         if return_date:
             params['returnDate'] = return_date.strftime('%Y-%m-%d')
 
-        async with aiohttp.ClientSession() as session:
-            return await self.fetch(session, params)
+        if time_budget is None:
+            time_budget = getattr(settings, 'FLIGHT_API_RETRY_BUDGET', self.RETRY_BUDGET)
+        deadline = asyncio.get_running_loop().time() + time_budget
+        session = await self.get_session()
+        return await self.fetch(session, params, deadline)
 
     async def search_flights_bulk(
         self,
         searches: List[Dict[str, Any]],
+        time_budget: Optional[float] = None,
     ) -> List[Dict[str, Any]]:
         """
         Searches for flights using the Smiles API in parallel.
 
+        At most `max_concurrency` requests are in flight at once, and every request
+        also waits on the process-wide rate limiter. Failed requests are retried until
+        the time budget of the whole bulk search is spent.
+
         Args:
             searches: A list of dictionaries containing search parameters. Each dictionary should
                       have keys: 'origin', 'destination', 'departure_date', and optionally
                       'return_date', 'adults', 'children', 'infants'.
+            time_budget: Seconds after which failed requests are no longer retried.
 
         Returns:
             A list of dictionaries containing the API response data for each search.
@@ -131,25 +591,91 @@ class FlightAPIClient:
         Raises:
             aiohttp.ClientError: An error occurred while making the API requests.
         """
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            for search in searches:
-                params = {
-                    'cabin': 'ALL',
-                    'originAirportCode': search['origin'],
-                    'destinationAirportCode': search['destination'],
-                    'departureDate': search['departure_date'].strftime('%Y-%m-%d'),
-                    'adults': search.get('adults', 1),
-                    'children': search.get('children', 0),
-                    'infants': search.get('infants', 0),
-                    'forceCongener': 'false',
-                    'cookies': '_gid%3Dundefined%3B',
-                    'memberNumber': '',
-                }
-                if search.get('return_date'):
-                    params['returnDate'] = search['return_date'].strftime('%Y-%m-%d')
-
-                tasks.append(self.fetch(session, params))
-
-            results = await asyncio.gather(*tasks)
-            return results
+        bounded_fetch = await self.bulk_fetcher(time_budget)
+        results = await asyncio.gather(*[bounded_fetch(search) for search in searches])
+        return results
+
+    async def search_flights_as_completed(
+        self,
+        searches: List[Dict[str, Any]],
+        time_budget: Optional[float] = None,
+    ) -> AsyncIterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Searches for flights like `search_flights_bulk`, yielding each response as soon as it arrives.
+
+        Args:
+            searches: A list of dictionaries containing search parameters, as in `search_flights_bulk`.
+            time_budget: Seconds after which failed requests are no longer retried.
+
+        Yields:
+            Tuples of (search, API response data), in completion order.
+        """
+        bounded_fetch = await self.bulk_fetcher(time_budget)
+
+        async def fetch_with_search(search: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+            return search, await bounded_fetch(search)
+
+        tasks = [asyncio.ensure_future(fetch_with_search(search)) for search in searches]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                yield await completed
+        finally:
+            # The consumer may stop early (e.g. the browser disconnected).
+            for task in tasks:
+                task.cancel()
+
+    async def bulk_fetcher(
+        self,
+        time_budget: Optional[float] = None,
+    ) -> Callable[[Dict[str, Any]], Awaitable['SearchResult']]:
+        """
+        Prepares the fetch function shared by the searches of one bulk request.
+
+        The function uses the pooled session, never exceeds `max_concurrency` requests
+        in flight and stops retrying once the bulk request's time budget is spent.
+
+        Args:
+            time_budget: Seconds after which failed requests are no longer retried.
+
+        Returns:
+            A coroutine function taking one search dictionary and returning its response data.
+        """
+        session = await self.get_session()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        if time_budget is None:
+            time_budget = getattr(settings, 'FLIGHT_API_RETRY_BUDGET', self.RETRY_BUDGET)
+        deadline = asyncio.get_running_loop().time() + time_budget
+
+        async def bounded_fetch(search: Dict[str, Any]) -> 'SearchResult':
+            async with semaphore:
+                return await self.fetch(session, self.build_bulk_params(search), deadline)
+
+        return bounded_fetch
+
+    def build_bulk_params(self, search: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Builds the API query parameters of one search of a bulk request.
+
+        Args:
+            search: A dictionary with the search parameters.
+
+        Returns:
+            The query parameters for the API request.
+        """
+        params = {
+            'cabin': 'ALL',
+            'originAirportCode': search['origin'],
+            'destinationAirportCode': search['destination'],
+            'departureDate': search['departure_date'].strftime('%Y-%m-%d'),
+            'adults': search.get('adults', 1),
+            'children': search.get('children', 0),
+            'infants': search.get('infants', 0),
+            'forceCongener': 'false',
+            'cookies': '_gid%3Dundefined%3B',
+            'memberNumber': '',
+        }
+        if search.get('return_date'):
+            params['returnDate'] = search['return_date'].strftime('%Y-%m-%d')
+        return params
+
+atexit.register(FlightAPIClient.close_all_sessions)
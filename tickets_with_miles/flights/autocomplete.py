@@ -0,0 +1,251 @@
+import csv
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from .models import Airport
+
+# (iata_code, name, country_name)
+AirportRecord = Tuple[str, str, str]
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercases the text and strips accents and punctuation, so 'São Paulo' matches 'sao paulo'.
+    """
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', stripped.casefold()).strip()
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Returns the character trigrams of each word of a normalized text, padded at word edges.
+    """
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class AirportAutocomplete:
+    """
+    Prebuilt in-memory index answering airport type-ahead queries.
+
+    Prefix matches come from a sorted array of every word of the IATA code, name and
+    country (a flattened trie searched with bisect). Prefixes matching too many
+    airports to rank per keystroke (the first characters typed, and the words
+    most airports share) have their results ranked at build time. Queries with no
+    prefix match fall back to a trigram index of the names, which tolerates typos.
+
+    Results are ranked by: exact IATA code, IATA code prefix, name starting with the
+    query, any word starting with the query, then trigram similarity.
+    """
+
+    EXACT_CODE, CODE_PREFIX, NAME_PREFIX, WORD_PREFIX, FUZZY = range(5)
+    SHORT_PREFIX_LENGTH = 3
+    COMMON_WORD_SIZE = 200
+    MAX_LIMIT = 50
+    MIN_FUZZY_SIMILARITY = 0.5
+    DEFAULT_LIMIT = 10
+
+    def __init__(self, records: Iterable[AirportRecord]):
+        """
+        Build the prefix and trigram indexes.
+
+        Args:
+            records: (iata_code, name, country_name) tuples.
+        """
+        self.records: List[AirportRecord] = []
+        self.names: List[str] = []
+        words: Dict[str, Set[int]] = defaultdict(set)
+        trigram_index: Dict[str, List[int]] = defaultdict(list)
+        short_prefixes: Dict[str, Dict[int, int]] = defaultdict(dict)
+
+        for record_id, (iata_code, name, country_name) in enumerate(records):
+            self.records.append((iata_code.upper(), name, country_name))
+            code = iata_code.lower()
+            normalized_name = normalize(name)
+            self.names.append(normalized_name)
+            record_words = f'{code} {normalized_name} {normalize(country_name)}'.split()
+            for word in record_words:
+                words[word].add(record_id)
+            for gram in trigrams(normalized_name):
+                trigram_index[gram].append(record_id)
+
+            for length in range(1, self.SHORT_PREFIX_LENGTH + 1):
+                code_category = self.EXACT_CODE if length == len(code) else self.CODE_PREFIX
+                for text, category in (
+                    [(code, code_category), (normalized_name, self.NAME_PREFIX)]
+                    + [(word, self.WORD_PREFIX) for word in record_words]
+                ):
+                    if len(text) >= length:
+                        ranked = short_prefixes[text[:length]]
+                        ranked[record_id] = min(ranked.get(record_id, category), category)
+
+        self.words: List[str] = sorted(words)
+        self.word_ids: List[Tuple[int, ...]] = [tuple(sorted(words[word])) for word in self.words]
+        self.code_ids: Dict[str, int] = {record[0]: i for i, record in enumerate(self.records)}
+        self.trigram_index: Dict[str, Tuple[int, ...]] = {
+            gram: tuple(ids) for gram, ids in trigram_index.items()
+        }
+        self.ranked_prefixes: Dict[str, List[int]] = {
+            prefix: sorted(ranked, key=lambda i: (ranked[i], len(self.names[i]), i))[:self.MAX_LIMIT]
+            for prefix, ranked in short_prefixes.items()
+        }
+        # Longer prefixes of words shared by many airports, such as 'intl' or the
+        # words of 'united states', are ranked up front as well.
+        for word, ids in zip(self.words, self.word_ids):
+            if len(ids) < self.COMMON_WORD_SIZE:
+                continue
+            for length in range(self.SHORT_PREFIX_LENGTH + 1, len(word) + 1):
+                prefix = word[:length]
+                if prefix not in self.ranked_prefixes:
+                    ranks = self._rank_prefix_matches(prefix)
+                    self.ranked_prefixes[prefix] = sorted(ranks, key=ranks.__getitem__)[:self.MAX_LIMIT]
+
+    @classmethod
+    def from_database(cls) -> 'AirportAutocomplete':
+        """
+        Builds the index from the Airport table.
+        """
+        return cls(Airport.objects.values_list('iata_code', 'name', 'country_name'))
+
+    @classmethod
+    def from_csv(cls, csv_path: Optional[str] = None) -> 'AirportAutocomplete':
+        """
+        Builds the index from an airports CSV file, by default the bundled dataset.
+        """
+        from .airport_index import AirportIndex
+
+        with open(csv_path or AirportIndex.CSV_PATH, 'r', encoding='utf-8') as file:
+            return cls(
+                (row['iata_code'], row['name'], row['country_name'])
+                for row in csv.DictReader(file)
+            )
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, str]]:
+        """
+        Returns the airports best matching the query.
+
+        Args:
+            query: Free text typed by the user, such as 'gru', 'sao pau' or 'lisboa'.
+            limit: Maximum number of results, up to MAX_LIMIT.
+
+        Returns:
+            A list of dictionaries with 'iata_code', 'name' and 'country_name', best first.
+        """
+        text = normalize(query)
+        limit = min(limit, self.MAX_LIMIT)
+        if not text or limit <= 0:
+            return []
+
+        if text in self.ranked_prefixes:
+            best = self.ranked_prefixes[text][:limit]
+        else:
+            ranks = self._rank_prefix_matches(text)
+            if not ranks and len(text) >= 3:
+                ranks = self._rank_fuzzy_matches(text)
+            best = sorted(ranks, key=ranks.__getitem__)[:limit]
+
+        return [
+            {'iata_code': iata_code, 'name': name, 'country_name': country_name}
+            for iata_code, name, country_name in (self.records[i] for i in best)
+        ]
+
+    def _rank_prefix_matches(self, text: str) -> Dict[int, Tuple]:
+        ranks: Dict[int, Tuple] = {}
+        query_words = text.split()
+        code_id = self.code_ids.get(text.upper())
+        if code_id is not None:
+            ranks[code_id] = (self.EXACT_CODE, len(self.names[code_id]), code_id)
+
+        # Every query word must prefix some word of the airport.
+        candidates: Optional[Set[int]] = None
+        for word in query_words:
+            matches = self._ids_with_prefix(word)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return ranks
+
+        for record_id in candidates:
+            if record_id in ranks:
+                continue
+            name = self.names[record_id]
+            if len(query_words) == 1 and self.records[record_id][0].lower().startswith(text):
+                category = self.CODE_PREFIX
+            elif name.startswith(text):
+                category = self.NAME_PREFIX
+            else:
+                category = self.WORD_PREFIX
+            ranks[record_id] = (category, len(name), record_id)
+        return ranks
+
+    def _rank_fuzzy_matches(self, text: str) -> Dict[int, Tuple]:
+        query_trigrams = trigrams(text)
+        shared = Counter(chain.from_iterable(
+            self.trigram_index.get(gram, ()) for gram in query_trigrams
+        ))
+        ranks: Dict[int, Tuple] = {}
+        for record_id, count in shared.items():
+            # Share of the query covered by the name, so long names aren't penalized.
+            similarity = count / len(query_trigrams)
+            if similarity >= self.MIN_FUZZY_SIMILARITY:
+                ranks[record_id] = (self.FUZZY, -similarity, len(self.names[record_id]), record_id)
+        return ranks
+
+    def _ids_with_prefix(self, prefix: str) -> Set[int]:
+        ids: Set[int] = set()
+        start = bisect_left(self.words, prefix)
+        for position in range(start, len(self.words)):
+            if not self.words[position].startswith(prefix):
+                break
+            ids.update(self.word_ids[position])
+        return ids
+
+
+_autocomplete: Optional[AirportAutocomplete] = None
+_autocomplete_lock = threading.Lock()
+
+
+def get_airport_autocomplete() -> AirportAutocomplete:
+    """
+    Returns the process-wide autocomplete index, building it on first use.
+
+    Like the airport index, it is built from the source chosen by the
+    FLIGHT_AIRPORT_INDEX_SOURCE setting.
+
+    Returns:
+        The shared AirportAutocomplete.
+    """
+    global _autocomplete
+    index = _autocomplete
+    if index is not None:
+        return index
+    with _autocomplete_lock:
+        if _autocomplete is None:
+            if getattr(settings, 'FLIGHT_AIRPORT_INDEX_SOURCE', 'database') == 'csv':
+                _autocomplete = AirportAutocomplete.from_csv()
+            else:
+                _autocomplete = AirportAutocomplete.from_database()
+        return _autocomplete
+
+
+def invalidate_airport_autocomplete(*args, **kwargs) -> None:
+    """
+    Discards the process-wide autocomplete index so the next lookup rebuilds it.
+
+    Accepts and ignores signal arguments so it can be connected to model signals.
+    """
+    global _autocomplete
+    with _autocomplete_lock:
+        _autocomplete = None
@@ -0,0 +1,283 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class TTLCache:
+    """
+    Thread-safe in-memory LRU cache whose entries expire after a fixed time to live.
+
+    Entries may be kept for an extra `stale_ttl` seconds after they expire, during
+    which `lookup` still returns them flagged as stale.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        stale_ttl: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize an empty cache.
+
+        Args:
+            maxsize: Maximum number of entries kept before the least recently used is evicted.
+            ttl: Seconds an entry stays fresh.
+            stale_ttl: Seconds an expired entry is still kept as stale.
+            clock: Monotonic clock returning seconds.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, key: str) -> Tuple[Optional[Any], bool]:
+        """
+        Returns the value stored under the key and whether it is still fresh.
+
+        Returns:
+            A (value, fresh) tuple, with a None value if the key is missing or too old.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            fresh_until, value = entry
+            now = self.clock()
+            if fresh_until + self.stale_ttl <= now:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, fresh_until > now
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the value stored under the key, or None if it is missing or expired.
+        """
+        value, fresh = self.lookup(key)
+        return value if fresh else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Stores the value under the key, evicting the least recently used entry if full.
+        """
+        fresh_until = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (fresh_until, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    Shared cache tier stored in one of the caches configured in Django's CACHES setting.
+    """
+
+    def __init__(self, alias: str = 'default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.cache.set(key, value, timeout=ttl)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class SearchCache:
+    """
+    Two-tier cache of Smiles search responses.
+
+    Lookups hit the in-memory LRU first and fall back to the optional shared
+    backend, whose hits are promoted to memory. Only successful responses are stored.
+    Responses stay available as stale for `stale_ttl` seconds after they expire, so
+    callers can serve them while a refresh runs in the background.
+    """
+
+    KEY_PREFIX = 'flights:search'
+    KEY_PARAMS = (
+        'originAirportCode',
+        'destinationAirportCode',
+        'departureDate',
+        'returnDate',
+        'adults',
+        'children',
+        'infants',
+    )
+
+    def __init__(
+        self,
+        ttl: float,
+        maxsize: int,
+        backend: Optional[DjangoCacheBackend] = None,
+        stale_ttl: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds a cached response stays fresh.
+            maxsize: Maximum number of responses kept in memory.
+            backend: Optional shared tier, such as a Django cache.
+            stale_ttl: Seconds an expired response may still be served as stale.
+            clock: Monotonic clock returning seconds.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.local = TTLCache(maxsize, ttl, stale_ttl, clock)
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0, 'misses': 0, 'local_hits': 0, 'backend_hits': 0, 'stale_hits': 0,
+        }
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> 'SearchCache':
+        # The cache is shared state; copies of its owners keep pointing at it.
+        return self
+
+    @classmethod
+    def make_key(cls, params: Dict[str, Any]) -> str:
+        """
+        Builds the cache key of a search from its API query parameters.
+
+        Args:
+            params: The query parameters sent to the Smiles API.
+
+        Returns:
+            A key made of the route, dates and passenger counts.
+        """
+        return ':'.join(
+            [cls.KEY_PREFIX] + [str(params.get(name, '')) for name in cls.KEY_PARAMS]
+        )
+
+    def lookup(self, key: str, count: bool = True) -> Tuple[Optional[Any], bool]:
+        """
+        Returns the cached response for the key and whether it is still fresh.
+
+        Args:
+            key: The cache key of the search.
+            count: Whether the lookup is counted in the hit and miss statistics.
+
+        Returns:
+            A (value, fresh) tuple, with a None value on a miss.
+        """
+        tally = self._count if count else lambda *counters: None
+        value, fresh = self.local.lookup(key)
+        if value is not None:
+            tally('hits', 'local_hits' if fresh else 'stale_hits')
+            return value, fresh
+
+        if self.backend is not None:
+            entry = self.backend.get(key)
+            if entry is not None:
+                fresh_until, value = entry
+                remaining = fresh_until - time.time()
+                self.local.set(key, value, ttl=remaining)
+                fresh = remaining > 0
+                tally('hits', 'backend_hits' if fresh else 'stale_hits')
+                return value, fresh
+
+        tally('misses')
+        return None, False
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns the cached response for the key, or None on a miss or if it is stale.
+        """
+        value, fresh = self.lookup(key)
+        return value if fresh else None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Stores a response in every tier, unless it is an error.
+        """
+        if 'error' in value:
+            return
+        self.local.set(key, value)
+        if self.backend is not None:
+            # The shared tier outlives this process, so freshness uses wall-clock time.
+            self.backend.set(key, (time.time() + self.ttl, value), self.ttl + self.stale_ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the hit and miss counters along with the hit ratio.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+        stats['size'] = len(self.local)
+        return stats
+
+    def clear(self) -> None:
+        """
+        Empties every tier and resets the counters.
+        """
+        self.local.clear()
+        if self.backend is not None:
+            self.backend.clear()
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _count(self, *counters: str) -> None:
+        with self._lock:
+            for counter in counters:
+                self._stats[counter] += 1
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """
+    Returns the process-wide search cache configured by the FLIGHT_SEARCH_CACHE_* settings.
+
+    Returns:
+        The shared SearchCache, or None if caching is disabled (TTL of zero).
+    """
+    global _search_cache
+    ttl = getattr(settings, 'FLIGHT_SEARCH_CACHE_TTL', 0)
+    if not ttl:
+        return None
+    with _search_cache_lock:
+        if _search_cache is None:
+            alias = getattr(settings, 'FLIGHT_SEARCH_CACHE_BACKEND', None)
+            _search_cache = SearchCache(
+                ttl=ttl,
+                maxsize=getattr(settings, 'FLIGHT_SEARCH_CACHE_MAXSIZE', 1024),
+                backend=DjangoCacheBackend(alias) if alias else None,
+                stale_ttl=getattr(settings, 'FLIGHT_SEARCH_CACHE_STALE_TTL', 0),
+            )
+        return _search_cache
+
+
+def reset_search_cache() -> None:
+    """
+    Discards the process-wide search cache so the next lookup rebuilds it from settings.
+    """
+    global _search_cache
+    with _search_cache_lock:
+        _search_cache = None
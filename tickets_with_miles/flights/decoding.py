@@ -0,0 +1,127 @@
+import json
+from typing import Any, Callable, Dict, List, Optional, TypedDict, Union
+
+from django.conf import settings
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Schema of the parts of a Smiles search response that FlightService reads. Leaves are
+# typed as Any so values come back exactly as the API sent them; only the nesting is checked.
+
+class AirportPayload(TypedDict, total=False):
+    code: Any
+
+
+class EndpointPayload(TypedDict, total=False):
+    date: Any
+    airport: AirportPayload
+
+
+class AirlinePayload(TypedDict, total=False):
+    name: Any
+
+
+class DurationPayload(TypedDict, total=False):
+    hours: Any
+    minutes: Any
+
+
+class FarePayload(TypedDict, total=False):
+    type: Any
+    miles: Any
+
+
+class FlightPayload(TypedDict, total=False):
+    airline: AirlinePayload
+    departure: EndpointPayload
+    arrival: EndpointPayload
+    duration: DurationPayload
+    stops: Any
+    fareList: List[FarePayload]
+
+
+class SegmentPayload(TypedDict, total=False):
+    flightList: List[FlightPayload]
+
+
+class SearchResponsePayload(TypedDict, total=False):
+    requestedFlightSegmentList: List[SegmentPayload]
+    error: Any
+
+
+Decoder = Callable[[Union[str, bytes]], Any]
+
+
+def decode_json(text: Union[str, bytes]) -> Any:
+    """
+    Decodes JSON with the standard library.
+    """
+    return json.loads(text)
+
+
+def decode_orjson(text: Union[str, bytes]) -> Any:
+    """
+    Decodes JSON with orjson, which is faster but still materializes the whole document.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than the standard library (NaN, for example).
+        return json.loads(text)
+
+
+_msgspec_decoder = msgspec.json.Decoder(SearchResponsePayload) if msgspec is not None else None
+
+
+def decode_msgspec(text: Union[str, bytes]) -> Any:
+    """
+    Decodes a search response with msgspec, keeping only the fields in SearchResponsePayload.
+
+    Responses that don't fit the schema, such as a flight whose airline is null, and
+    invalid JSON are decoded again in full, so the result and the errors raised are
+    the same as with the standard library.
+    """
+    try:
+        return _msgspec_decoder.decode(text)
+    except msgspec.DecodeError:
+        return (decode_orjson if orjson is not None else decode_json)(text)
+
+
+DECODERS: Dict[str, Optional[Decoder]] = {
+    'msgspec': decode_msgspec if msgspec is not None else None,
+    'orjson': decode_orjson if orjson is not None else None,
+    'json': decode_json,
+}
+
+
+def get_response_decoder(name: Optional[str] = None) -> Decoder:
+    """
+    Returns the function decoding Smiles search responses.
+
+    Args:
+        name: 'msgspec', 'orjson', 'json' or 'auto', which picks the first installed in
+            that order. Defaults to the FLIGHT_API_JSON_DECODER setting.
+
+    Returns:
+        A function turning the response body into a dictionary.
+
+    Raises:
+        ValueError: If the decoder is unknown or its library isn't installed.
+    """
+    name = name or getattr(settings, 'FLIGHT_API_JSON_DECODER', 'auto')
+    if name == 'auto':
+        return next(decoder for decoder in DECODERS.values() if decoder is not None)
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON decoder: {name!r}")
+    if DECODERS[name] is None:
+        raise ValueError(f"The {name} library isn't installed")
+    return DECODERS[name]
@@ -0,0 +1,289 @@
+import json
+import os
+from array import array
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .models import FareObservation
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+LABELS_FILE = 'labels.json'
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ValueError("The numpy library isn't installed")
+
+
+class FareColumns:
+    """
+    Fare observations held as NumPy columns, one array per field, for grouped reductions.
+
+    Text fields are dictionary-encoded: `route` and `airline` hold indexes into the
+    `routes` ('CNF-GRU') and `airlines` lists. Flight dates are days since 1970-01-01
+    and observation times are seconds since the epoch, so every column is a plain
+    integer array that can be saved as a `.npy` file and memory-mapped back. Unknown
+    stops are stored as -1 and unknown airlines as None in `airlines`.
+    """
+
+    COLUMNS = ('route', 'airline', 'flight_date', 'stops', 'miles', 'observed_at')
+    DTYPES = {
+        'route': 'int32',
+        'airline': 'int32',
+        'flight_date': 'int32',
+        'stops': 'int16',
+        'miles': 'int64',
+        'observed_at': 'int64',
+    }
+    # Type codes of the array module building each column, matching DTYPES.
+    TYPECODES = {'route': 'i', 'airline': 'i', 'flight_date': 'i', 'stops': 'h', 'miles': 'q', 'observed_at': 'q'}
+    CHUNK_SIZE = 20000  # rows fetched from the database at a time
+
+    def __init__(self, routes: Sequence[str], airlines: Sequence[str], **columns: Any):
+        """
+        Initialize the columns.
+
+        Args:
+            routes: Routes, as 'ORIGIN-DESTINATION', indexed by the `route` column.
+            airlines: Airline names, or None for unknown airlines, indexed by the `airline` column.
+            **columns: One array per name of COLUMNS, all of the same length.
+
+        Raises:
+            ValueError: If numpy isn't installed or a column is missing or of another length.
+        """
+        require_numpy()
+        if set(columns) != set(self.COLUMNS):
+            raise ValueError(f"The columns must be {self.COLUMNS}")
+        if len({len(values) for values in columns.values()}) > 1:
+            raise ValueError("The columns must have the same length")
+        self.routes = list(routes)
+        self.airlines = list(airlines)
+        for name in self.COLUMNS:
+            setattr(self, name, np.asanyarray(columns[name]))
+
+    def __len__(self) -> int:
+        return len(self.miles)
+
+    @property
+    def weekday(self):
+        """
+        Weekday of each flight date, Monday being 0 as in `date.weekday()`.
+        """
+        # 1970-01-01 was a Thursday.
+        return ((self.flight_date + 3) % 7).astype('int8')
+
+    @classmethod
+    def from_observations(cls, queryset=None, chunk_size: Optional[int] = None) -> 'FareColumns':
+        """
+        Loads fare observations from the database, streamed in chunks.
+
+        Args:
+            queryset: The FareObservation rows loaded, by default all of them.
+            chunk_size: Rows fetched at a time.
+
+        Returns:
+            The FareColumns of the rows.
+        """
+        require_numpy()
+        queryset = FareObservation.objects.all() if queryset is None else queryset
+        routes: Dict[Tuple[str, str], int] = {}
+        airlines: Dict[Optional[str], int] = {}
+        buffers = {name: array(cls.TYPECODES[name]) for name in cls.COLUMNS}
+        rows = queryset.values_list(
+            'origin', 'destination', 'airline', 'flight_date', 'stops', 'miles', 'observed_at'
+        ).iterator(chunk_size=chunk_size or cls.CHUNK_SIZE)
+        for origin, destination, airline, flight_date, stops, miles, observed_at in rows:
+            route = routes.get((origin, destination))
+            if route is None:
+                route = routes[origin, destination] = len(routes)
+            airline_index = airlines.get(airline)
+            if airline_index is None:
+                airline_index = airlines[airline] = len(airlines)
+            buffers['route'].append(route)
+            buffers['airline'].append(airline_index)
+            buffers['flight_date'].append(flight_date.toordinal() - EPOCH_ORDINAL)
+            buffers['stops'].append(-1 if stops is None else stops)
+            buffers['miles'].append(miles)
+            buffers['observed_at'].append(int(observed_at.timestamp()))
+
+        return cls(
+            [f'{origin}-{destination}' for origin, destination in routes],
+            list(airlines),
+            **{name: np.frombuffer(buffer, dtype=cls.DTYPES[name]) for name, buffer in buffers.items()},
+        )
+
+    def save(self, directory: str) -> None:
+        """
+        Writes each column to a `.npy` file of the directory, and the labels to a JSON file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.COLUMNS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
+        with open(os.path.join(directory, LABELS_FILE), 'w', encoding='utf-8') as file:
+            json.dump({'routes': self.routes, 'airlines': self.airlines}, file, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> 'FareColumns':
+        """
+        Reads columns written by `save`.
+
+        Args:
+            directory: The directory holding the files.
+            mmap: Whether the columns are memory-mapped rather than read into memory, so
+                only the pages a reduction touches are read from disk.
+
+        Returns:
+            The FareColumns.
+        """
+        require_numpy()
+        with open(os.path.join(directory, LABELS_FILE), 'r', encoding='utf-8') as file:
+            labels = json.load(file)
+        return cls(
+            labels['routes'],
+            labels['airlines'],
+            **{
+                name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r' if mmap else None)
+                for name in cls.COLUMNS
+            },
+        )
+
+    def select(self, mask) -> 'FareColumns':
+        """
+        Returns the rows where the boolean mask is true, keeping the labels.
+        """
+        return type(self)(self.routes, self.airlines, **{name: getattr(self, name)[mask] for name in self.COLUMNS})
+
+    def filter(self, route: Optional[str] = None, since: Optional[datetime] = None) -> 'FareColumns':
+        """
+        Returns the observations of one route, as 'ORIGIN-DESTINATION', or observed since a time.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if route is not None:
+            mask &= self.route == (self.routes.index(route) if route in self.routes else -1)
+        if since is not None:
+            mask &= self.observed_at >= int(since.timestamp())
+        return self.select(mask)
+
+
+def grouped_reduction(keys, values, percentiles: Sequence[float] = ()) -> Dict[str, Any]:
+    """
+    Reduces the values of each group with a single sort, without a loop over the groups.
+
+    Keys and values are packed into one int64 per row, key in the high bits, and
+    sorted together, which leaves each group contiguous and its values in order: the
+    minimum and maximum are at its ends and any percentile is read by index.
+
+    Args:
+        keys: Non-negative group key of each row, below 2**31.
+        values: Non-negative integer value of each row, below 2**32.
+        percentiles: Percentiles computed per group, from 0 to 100, with linear
+            interpolation like `numpy.percentile`.
+
+    Returns:
+        A dictionary of arrays, one entry per group in key order: 'key', 'count',
+        'min', 'max', 'mean' and one 'p<percentile>' per percentile.
+    """
+    require_numpy()
+    keys = np.asarray(keys, dtype=np.int64)
+    values = np.asarray(values, dtype=np.int64)
+    if not len(keys):
+        empty = np.empty(0, dtype=np.int64)
+        result = {'key': empty, 'count': empty, 'min': empty, 'max': empty, 'mean': np.empty(0)}
+        result.update((f'p{percentile:g}', np.empty(0)) for percentile in percentiles)
+        return result
+
+    packed = np.sort((keys << 32) | values)
+    sorted_keys = packed >> 32
+    sorted_values = packed & 0xFFFFFFFF
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    counts = np.diff(np.append(starts, len(packed)))
+    ends = starts + counts - 1
+    result = {
+        'key': sorted_keys[starts],
+        'count': counts,
+        'min': sorted_values[starts],
+        'max': sorted_values[ends],
+        'mean': np.add.reduceat(sorted_values, starts) / counts,
+    }
+    for percentile in percentiles:
+        position = starts + (counts - 1) * (percentile / 100)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.minimum(lower + 1, ends)
+        result[f'p{percentile:g}'] = (
+            sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+        )
+    return result
+
+
+# Dimensions fares can be grouped by.
+DIMENSIONS = ('route', 'weekday', 'airline', 'stops')
+
+
+def summarize(
+    columns: FareColumns,
+    by: Sequence[str] = ('route', 'weekday'),
+    percentiles: Sequence[float] = (50,),
+) -> List[Dict[str, Any]]:
+    """
+    Returns the miles of each group of fares: count, minimum, mean, maximum and percentiles.
+
+    Args:
+        columns: The fares.
+        by: Dimensions grouped by, among DIMENSIONS, such as ('route', 'weekday') for
+            the prices of each route by weekday or ('airline',) for each airline.
+        percentiles: Percentiles of the miles of each group, from 0 to 100.
+
+    Returns:
+        One row per group, in the order of the dimensions: the dimensions ('route' as
+        'ORIGIN-DESTINATION', 'weekday' with Monday as 0, 'airline', 'stops', the last
+        two None when unknown), then 'count', 'min', 'mean', 'max' and one 'p<percentile>' per percentile.
+
+    Raises:
+        ValueError: If a dimension is unknown.
+    """
+    unknown = set(by) - set(DIMENSIONS)
+    if unknown or not by:
+        raise ValueError(f"Fares are grouped by some of {DIMENSIONS}, got {tuple(by)}")
+
+    # The dimensions are combined into one key, each one a digit of a mixed-radix number.
+    dimensions = []
+    groups = 1
+    key = np.zeros(len(columns), dtype=np.int64)
+    for name in by:
+        values = columns.weekday if name == 'weekday' else getattr(columns, name)
+        size = {'route': len(columns.routes), 'weekday': 7, 'airline': len(columns.airlines)}.get(name)
+        if size is None:
+            # Shifted by one, so unknown stops (-1) are a digit too.
+            values = values + 1
+            size = int(values.max()) + 1 if len(values) else 1
+        key = key * size + values
+        dimensions.append((name, size))
+        groups *= size
+    if groups > 2 ** 31:
+        raise ValueError(f"Too many groups of fares by {tuple(by)}")
+
+    reduced = grouped_reduction(key, columns.miles, percentiles)
+    labels = {'route': columns.routes, 'airline': columns.airlines}
+    statistics = ['count', 'min', 'mean', 'max'] + [f'p{percentile:g}' for percentile in percentiles]
+    rows = []
+    for index, group_key in enumerate(reduced['key'].tolist()):
+        row: Dict[str, Any] = {}
+        for name, size in reversed(dimensions):
+            group_key, value = divmod(group_key, size)
+            if name in labels:
+                row[name] = labels[name][value]
+            elif name == 'stops':
+                row[name] = value - 1 if value else None
+            else:
+                row[name] = value
+        row = {name: row[name] for name in by}
+        for statistic in statistics:
+            value = reduced[statistic][index].item()
+            row[statistic] = round(value, 1) if isinstance(value, float) else value
+        rows.append(row)
+    return rows
@@ -0,0 +1,75 @@
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .records import FareCalendarDay
+
+
+class FareCalendarStore:
+    """
+    Caches the cheapest fare of each route and day, so overlapping calendars reuse their days.
+
+    Days are stored one per key in one of Django's caches, as (miles, airline, stops)
+    tuples, so any window of dates can be assembled from the days already searched.
+    """
+
+    KEY_PREFIX = 'flights:calendar'
+    DEFAULT_TTL = 1800  # seconds
+
+    def __init__(self, alias: Optional[str] = None, ttl: Optional[int] = None):
+        """
+        Initialize the store.
+
+        Args:
+            alias: The alias from CACHES holding the days.
+            ttl: Seconds the cheapest fare of a day is kept.
+        """
+        self.alias = alias or getattr(settings, 'FLIGHT_FARE_CALENDAR_CACHE', 'default')
+        self.ttl = ttl or getattr(settings, 'FLIGHT_FARE_CALENDAR_TTL', self.DEFAULT_TTL)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, origin: str, destination: str, day: date) -> str:
+        return f"{self.KEY_PREFIX}:{origin}:{destination}:{day.isoformat()}"
+
+    async def load(
+        self,
+        origin: str,
+        destination: str,
+        days: Iterable[date],
+    ) -> Dict[date, FareCalendarDay]:
+        """
+        Returns the cached days of a route.
+
+        Args:
+            origin: The IATA code of the origin airport.
+            destination: The IATA code of the destination airport.
+            days: The days wanted.
+
+        Returns:
+            The days found in the cache, keyed by date. Missing days are left out.
+        """
+        keys = {self.make_key(origin, destination, day): day for day in days}
+        found = await self.cache.aget_many(keys)
+        return {
+            keys[key]: FareCalendarDay(keys[key], *values)
+            for key, values in found.items()
+        }
+
+    async def save(self, origin: str, destination: str, days: Iterable[FareCalendarDay]) -> None:
+        """
+        Stores days of a route in one call to the cache.
+        """
+        await self.cache.aset_many(
+            {
+                self.make_key(origin, destination, day.date): (
+                    day.miles_cost, day.airline, day.number_of_stops
+                )
+                for day in days
+            },
+            timeout=self.ttl,
+        )
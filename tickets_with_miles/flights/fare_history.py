@@ -0,0 +1,380 @@
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FareObservation
+from .records import SMILES_FARE_TYPES, FareCalendarDay
+
+logger = logging.getLogger(__name__)
+
+# Fare of one flight: airline, stops and miles.
+Fare = Tuple[Optional[str], Optional[int], int]
+
+# Fares of one response: origin, destination, flight date, observation time and the
+# fares, or the flights of the response, whose fares are read when they are written.
+Batch = Tuple[str, str, date, datetime, Union[List[Fare], List[Dict[str, Any]]]]
+
+# Batch queued with its number of fares, at most, and whether they were already read from the flights.
+Entry = Tuple[Batch, int, bool]
+
+
+def flight_fares(flights: Iterable[Dict[str, Any]]) -> List[Fare]:
+    """
+    Returns the fares of the flights of a Smiles response, as searches parse them.
+
+    Args:
+        flights: The flights, as in the 'flightList' of a response segment.
+
+    Returns:
+        The (airline, stops, miles) of each flight with a Smiles fare, its cheapest one.
+        Airlines and stops missing from the response are None.
+    """
+    fares = []
+    for flight in flights:
+        try:
+            miles_cost = -1
+            for fare in flight.get('fareList', []):
+                if fare.get('type') in SMILES_FARE_TYPES:
+                    miles = fare.get('miles', 0)
+                    if miles > 0 and (miles_cost == -1 or miles < miles_cost):
+                        miles_cost = miles
+            if miles_cost != -1:
+                fares.append((flight.get('airline', {}).get('name'), flight.get('stops'), miles_cost))
+        except (AttributeError, TypeError):
+            continue
+    return fares
+
+
+class FareHistoryRecorder:
+    """
+    Persists the fares of search responses as FareObservation rows, off the search path.
+
+    `record` and `record_flights` only queue the fares, so a search never waits on
+    the database. A background thread writes them with `bulk_create` every
+    `flush_interval` seconds, or as soon as `batch_size` fares are waiting, reading the
+    fares of queued flights first, so searches parse their responses only once. If the
+    database falls behind, fares beyond `max_pending` are dropped rather than held in memory.
+    """
+
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_FLUSH_INTERVAL = 5.0  # seconds
+    DEFAULT_MAX_PENDING = 50000  # fares waiting to be written
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_pending: Optional[int] = None,
+        background: bool = True,
+    ):
+        """
+        Initialize the recorder.
+
+        Args:
+            batch_size: Fares written per insert.
+            flush_interval: Seconds between writes of the fares waiting.
+            max_pending: Maximum number of fares waiting to be written.
+            background: Whether a background thread writes the fares. Without it, they
+                are only written by `flush`.
+        """
+        self.batch_size = batch_size or getattr(settings, 'FLIGHT_FARE_HISTORY_BATCH_SIZE', self.DEFAULT_BATCH_SIZE)
+        self.flush_interval = flush_interval or getattr(
+            settings, 'FLIGHT_FARE_HISTORY_FLUSH_INTERVAL', self.DEFAULT_FLUSH_INTERVAL
+        )
+        self.max_pending = max_pending or getattr(settings, 'FLIGHT_FARE_HISTORY_MAX_PENDING', self.DEFAULT_MAX_PENDING)
+        self.background = background
+        self.dropped = 0
+        self._batches: Deque[Entry] = deque()
+        self._retry: List[Entry] = []  # batch whose write failed once
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._worker: Optional[threading.Thread] = None
+
+    def record(
+        self,
+        origin: str,
+        destination: str,
+        flight_date: date,
+        observed_at: datetime,
+        fares: Sequence[Fare],
+    ) -> None:
+        """
+        Queues the fares of one response to be written.
+
+        Args:
+            origin: IATA code of the origin airport searched.
+            destination: IATA code of the destination airport searched.
+            flight_date: Date searched.
+            observed_at: When the response was fetched from the API.
+            fares: The (airline, stops, miles) of each flight.
+        """
+        self._enqueue((origin, destination, flight_date, observed_at, list(fares)), len(fares), read=True)
+
+    def record_flights(
+        self,
+        origin: str,
+        destination: str,
+        flight_date: date,
+        observed_at: datetime,
+        flights: Sequence[Dict[str, Any]],
+    ) -> None:
+        """
+        Queues the fares of the flights of one response, read by `flight_fares` when written.
+
+        Args:
+            origin: IATA code of the origin airport searched.
+            destination: IATA code of the destination airport searched.
+            flight_date: Date searched.
+            observed_at: When the response was fetched from the API.
+            flights: The flights of the response, as in the 'flightList' of its segment.
+        """
+        self._enqueue((origin, destination, flight_date, observed_at, list(flights)), len(flights), read=False)
+
+    def _enqueue(self, batch: Batch, count: int, read: bool) -> None:
+        if not count:
+            return
+        with self._lock:
+            if self._pending + count > self.max_pending:
+                self.dropped += count
+                return
+            self._batches.append((batch, count, read))
+            self._pending += count
+            full = self._pending >= self.batch_size
+        if self.background:
+            self._ensure_worker()
+            if full:
+                self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Writes the fares waiting, in the calling thread, one insert of about `batch_size` fares at a time.
+
+        A batch failing to be written is logged and retried first on the next flush,
+        leaving the other batches queued; if it fails again, it is dropped. Either way
+        this flush stops, since the database is likely unavailable.
+
+        Returns:
+            The number of fares written.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                entries, retried = self._take()
+                if not entries:
+                    return written
+                batches = [
+                    batch if read else (*batch[:4], flight_fares(batch[4])) for batch, _, read in entries
+                ]
+                observations = [
+                    FareObservation(
+                        origin=origin,
+                        destination=destination,
+                        flight_date=flight_date,
+                        airline=airline,
+                        stops=stops,
+                        miles=miles,
+                        observed_at=observed_at,
+                    )
+                    for origin, destination, flight_date, observed_at, fares in batches
+                    for airline, stops, miles in fares
+                ]
+                try:
+                    FareObservation.objects.bulk_create(observations)
+                except Exception as e:
+                    if retried:
+                        self.dropped += len(observations)
+                        logger.error(
+                            f"Erro ao gravar o histórico de tarifas, {len(observations)} tarifas descartadas: {e}"
+                        )
+                    else:
+                        with self._lock:
+                            self._retry = [(batch, len(batch[4]), True) for batch in batches]
+                            self._pending += len(observations)
+                        logger.warning(f"Erro ao gravar o histórico de tarifas, nova tentativa no próximo lote: {e}")
+                    return written
+                written += len(observations)
+
+    def _take(self) -> Tuple[List[Entry], bool]:
+        """
+        Removes the next batch to write from the queue: the failed one if any, else
+        responses adding up to `batch_size` fares.
+
+        Returns:
+            The responses of the batch and whether it is a retry.
+        """
+        with self._lock:
+            if self._retry:
+                entries, self._retry = self._retry, []
+                retried = True
+            else:
+                entries, count = [], 0
+                while self._batches and count < self.batch_size:
+                    entries.append(self._batches.popleft())
+                    count += entries[-1][1]
+                retried = False
+            self._pending -= sum(count for _, count, _ in entries)
+            return entries, retried
+
+    def close(self) -> None:
+        """
+        Stops the background thread, after writing the fares still waiting.
+        """
+        self._stopped = True
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None or self._stopped:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='fare-history', daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # The thread outlives requests, so it recycles its own connection.
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erro ao gravar o histórico de tarifas: {e}")
+            if self._stopped:
+                close_old_connections()
+                return
+
+
+_fare_history: Optional[FareHistoryRecorder] = None
+_fare_history_lock = threading.Lock()
+
+
+def get_fare_history() -> Optional[FareHistoryRecorder]:
+    """
+    Returns the process-wide fare history recorder, or None if FLIGHT_FARE_HISTORY_ENABLED is off.
+    """
+    global _fare_history
+    if not getattr(settings, 'FLIGHT_FARE_HISTORY_ENABLED', True):
+        return None
+    with _fare_history_lock:
+        if _fare_history is None:
+            _fare_history = FareHistoryRecorder()
+        return _fare_history
+
+
+def reset_fare_history() -> None:
+    """
+    Writes the fares waiting and discards the process-wide recorder.
+    """
+    global _fare_history
+    with _fare_history_lock:
+        recorder, _fare_history = _fare_history, None
+    if recorder is not None:
+        recorder.close()
+
+
+atexit.register(reset_fare_history)
+
+
+def _route_observations(origin: str, destination: str):
+    return FareObservation.objects.filter(origin=origin, destination=destination)
+
+
+def _minimum_by_day(observations) -> Dict[date, int]:
+    return dict(observations.values('flight_date').annotate(miles=Min('miles')).values_list('flight_date', 'miles'))
+
+
+def cheapest_by_day(
+    origin: str,
+    destination: str,
+    start: date,
+    end: date,
+    since: Optional[datetime] = None,
+) -> Dict[date, int]:
+    """
+    Returns the fewest miles observed for each flight date of a route.
+
+    Args:
+        origin: IATA code of the origin airport.
+        destination: IATA code of the destination airport.
+        start: First flight date, inclusive.
+        end: Last flight date, inclusive.
+        since: Only fares observed from then on count, by default all of them.
+
+    Returns:
+        The minimum miles by flight date, for the dates observed.
+    """
+    observations = _route_observations(origin, destination).filter(flight_date__range=(start, end))
+    if since is not None:
+        observations = observations.filter(observed_at__gte=since)
+    return _minimum_by_day(observations)
+
+
+def price_history(origin: str, destination: str, flight_date: date) -> List[Tuple[date, int]]:
+    """
+    Returns how the cheapest fare of one flight date changed over time.
+
+    Returns:
+        (observation date, fewest miles observed that day) pairs, oldest first.
+    """
+    return list(
+        _route_observations(origin, destination)
+        .filter(flight_date=flight_date)
+        .annotate(day=TruncDate('observed_at'))
+        .values('day')
+        .annotate(miles=Min('miles'))
+        .order_by('day')
+        .values_list('day', 'miles')
+    )
+
+
+def recent_cheapest(
+    origin: str,
+    destination: str,
+    dates: Iterable[date],
+    max_age: float,
+) -> Dict[date, FareCalendarDay]:
+    """
+    Returns the cheapest fare observed recently for each date, as days of the fare calendar.
+
+    Args:
+        origin: IATA code of the origin airport.
+        destination: IATA code of the destination airport.
+        dates: The flight dates wanted.
+        max_age: Seconds an observation stays recent.
+
+    Returns:
+        FareCalendarDay by date, for the dates observed recently. Ties on miles go
+        to the fewest stops.
+    """
+    observations = _route_observations(origin, destination).filter(
+        flight_date__in=list(dates), observed_at__gte=timezone.now() - timedelta(seconds=max_age)
+    )
+    minimum = _minimum_by_day(observations)
+    if not minimum:
+        return {}
+    matching = Q()
+    for flight_date, miles in minimum.items():
+        matching |= Q(flight_date=flight_date, miles=miles)
+
+    days: Dict[date, FareCalendarDay] = {}
+    rows = observations.filter(matching).order_by('flight_date', 'stops', '-observed_at')
+    for flight_date, miles, airline, stops in rows.values_list('flight_date', 'miles', 'airline', 'stops'):
+        if flight_date not in days:
+            days[flight_date] = FareCalendarDay(flight_date, miles, airline or None, stops)
+    return days
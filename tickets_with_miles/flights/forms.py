@@ -1,22 +1,32 @@
 from django import forms
 from django.core.exceptions import ValidationError
 from datetime import datetime, date, timedelta
-from .models import Airport
+from typing import Optional
+from .airport_groups import resolve_airports, resolve_routes
+from .airport_index import get_airport_index
 
 class FlightSearchForm(forms.Form):
     """
     A form to validate and process flight search inputs.
     """
     ORIGIN_PLACEHOLDER = 'Ex.: CNF'
-    DESTINATION_PLACEHOLDER = 'Ex.: GRU'
+    DESTINATION_PLACEHOLDER = 'Ex.: GRU, SAO ou BR-SP'
     ALLOWED_FORWARD_SEARCH_DAYS = 329
+    MAX_RESULTS_LIMIT = 500
+    ALLOW_AIRPORT_SETS = True
+    MAX_AIRPORTS = 15  # per origin or destination
+    MAX_SEARCHES = 150  # upstream searches, one per route and date
     DATE_INPUT_FORMATS = ['%Y-%m-%d', '%d/%m/%Y']
 
     ERROR_MESSAGES = {
         'origin': "O código da origem não é válido.",
         'destination': "O código do destino não é válido.",
         'date_past': "A data não pode ser no passado.",
-        'very_future_date': "A data está muito distante."
+        'very_future_date': "A data está muito distante.",
+        'return_before_departure': "A volta não pode ser antes da ida.",
+        'too_many_airports': f"Escolha no máximo {MAX_AIRPORTS} aeroportos.",
+        'same_airports': "A origem e o destino precisam ter aeroportos diferentes.",
+        'too_many_searches': "A busca é grande demais. Reduza os aeroportos ou a flexibilidade.",
     }
 
     FLEXIBILITY_CHOICES = [
@@ -29,14 +39,14 @@ class FlightSearchForm(forms.Form):
 
     origin = forms.CharField(
         label='Origem',
-        max_length=3,
-        min_length=3,
+        max_length=64,
+        min_length=2,
         widget=forms.TextInput(attrs={'placeholder': ORIGIN_PLACEHOLDER}),
     )
     destination = forms.CharField(
         label='Destino',
-        max_length=3,
-        min_length=3,
+        max_length=64,
+        min_length=2,
         widget=forms.TextInput(attrs={'placeholder': DESTINATION_PLACEHOLDER}),
     )
     date = forms.DateField(
@@ -50,32 +60,144 @@ class FlightSearchForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'}),
         initial=0,
     )
+    return_date = forms.DateField(
+        label='Volta',
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date'}),
+        input_formats=DATE_INPUT_FORMATS,
+    )
+    return_flexibility = forms.TypedChoiceField(
+        label='Flexibilidade da volta',
+        choices=FLEXIBILITY_CHOICES,
+        coerce=int,
+        required=False,
+        empty_value=0,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+        initial=0,
+    )
+    limit = forms.IntegerField(
+        label='Resultados',
+        required=False,
+        min_value=1,
+        max_value=MAX_RESULTS_LIMIT,
+        widget=forms.HiddenInput,
+    )
 
     def clean_origin(self) -> str:
         """
-        Validates that the origin IATA code exists in the database.
+        Validates that every airport of the origin exists in the airport index.
         """
-        origin = self.cleaned_data['origin'].upper()
-        if not Airport.objects.filter(iata_code=origin).exists():
-            raise ValidationError(self.ERROR_MESSAGES['origin'])
-        return origin
+        return self.clean_airports('origin')
 
     def clean_destination(self) -> str:
         """
-        Validates that the destination IATA code exists in the database.
+        Validates that every airport of the destination exists in the airport index.
         """
-        destination = self.cleaned_data['destination'].upper()
-        if not Airport.objects.filter(iata_code=destination).exists():
-            raise ValidationError(self.ERROR_MESSAGES['destination'])
-        return destination
+        return self.clean_airports('destination')
+
+    def clean_airports(self, field: str) -> str:
+        """
+        Validates an origin or destination: an IATA code or, if the form allows it, a
+        set of airports as taken by `resolve_airports`, such as 'SAO' or 'BR-SP'.
+
+        Without sets, only a plain IATA code is accepted, so groups, regions and lists
+        resolving to a single airport, such as 'BR-AP' or 'GRU,GRU', are rejected too.
+
+        Returns:
+            The value uppercased and without spaces.
+        """
+        spec = self.cleaned_data[field].upper().replace(' ', '')
+        index = get_airport_index()
+        try:
+            airports = resolve_airports(spec, index)
+        except ValueError:
+            raise ValidationError(self.ERROR_MESSAGES[field])
+        if (
+            not airports
+            or any(code not in index for code in airports)
+            or (not self.ALLOW_AIRPORT_SETS and airports != (spec,))
+        ):
+            raise ValidationError(self.ERROR_MESSAGES[field])
+        if len(airports) > self.MAX_AIRPORTS:
+            raise ValidationError(self.ERROR_MESSAGES['too_many_airports'])
+        return spec
 
     def clean_date(self) -> datetime.date:
         """
         Validates that the departure date is not in the past nor too distant.
         """
         departure_date = self.cleaned_data['date']
-        if departure_date < date.today():
+        self.validate_search_date(departure_date)
+        return departure_date
+
+    def clean_return_date(self) -> Optional[datetime.date]:
+        """
+        Validates the optional return date like the departure date.
+        """
+        return_date = self.cleaned_data.get('return_date')
+        if return_date is not None:
+            self.validate_search_date(return_date)
+        return return_date
+
+    def clean(self):
+        """
+        Validates that the return, if any, isn't before the departure, and that the
+        search has some route and isn't too large.
+        """
+        cleaned_data = super().clean()
+        departure_date = cleaned_data.get('date')
+        return_date = cleaned_data.get('return_date')
+        if departure_date and return_date and return_date < departure_date:
+            self.add_error('return_date', self.ERROR_MESSAGES['return_before_departure'])
+
+        if cleaned_data.get('origin') and cleaned_data.get('destination'):
+            routes = len(resolve_routes(cleaned_data['origin'], cleaned_data['destination'], get_airport_index()))
+            dates = max(int(cleaned_data.get('flexibility') or 0), 1)
+            if return_date:
+                dates += max(cleaned_data.get('return_flexibility') or 0, 1)
+            if not routes:
+                self.add_error('destination', self.ERROR_MESSAGES['same_airports'])
+            elif routes * dates > self.MAX_SEARCHES:
+                self.add_error(None, self.ERROR_MESSAGES['too_many_searches'])
+        return cleaned_data
+
+    def validate_search_date(self, search_date: date) -> None:
+        """
+        Raises a ValidationError if the date is in the past or too distant.
+        """
+        if search_date < date.today():
             raise ValidationError(self.ERROR_MESSAGES['date_past'])
-        elif departure_date > date.today() + timedelta(days=self.ALLOWED_FORWARD_SEARCH_DAYS):
+        elif search_date > date.today() + timedelta(days=self.ALLOWED_FORWARD_SEARCH_DAYS):
             raise ValidationError(self.ERROR_MESSAGES['very_future_date'])
-        return departure_date
\ No newline at end of file
+
+
+class FareCalendarForm(FlightSearchForm):
+    """
+    A form to validate fare calendar requests: a route, its first day and a number of days.
+    """
+    DEFAULT_DAYS = 30
+    MAX_DAYS = 62
+    ALLOW_AIRPORT_SETS = False
+
+    flexibility = None
+    return_date = None
+    return_flexibility = None
+    limit = None
+    days = forms.IntegerField(
+        label='Dias',
+        required=False,
+        min_value=1,
+        max_value=MAX_DAYS,
+    )
+
+    def clean(self):
+        """
+        Defaults the number of days and stops the window at the last day that can be searched.
+        """
+        cleaned_data = super().clean()
+        start = cleaned_data.get('date')
+        if start is not None and not self.errors:
+            last_day = date.today() + timedelta(days=self.ALLOWED_FORWARD_SEARCH_DAYS)
+            days = cleaned_data.get('days') or self.DEFAULT_DAYS
+            cleaned_data['days'] = min(days, (last_day - start).days + 1)
+        return cleaned_data
@@ -0,0 +1,244 @@
+import asyncio
+import math
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+
+from .api_client import FlightAPIClient
+from .cache import SearchCache, reset_search_cache
+from .services import FlightService
+from .throttling import TokenBucket
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Returns the nearest-rank percentile of values sorted in ascending order.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+@dataclass
+class LoadReport:
+    """
+    Outcome of a load test: the latency of each successful operation and the failures.
+    """
+
+    layer: str
+    concurrency: int
+    elapsed: float  # seconds of wall-clock time
+    latencies: List[float] = field(default_factory=list)  # seconds, one per successful operation
+    errors: int = 0
+
+    @property
+    def operations(self) -> int:
+        return len(self.latencies) + self.errors
+
+    @property
+    def throughput(self) -> float:
+        """
+        Operations completed per second.
+        """
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the throughput and latency percentiles, in milliseconds.
+        """
+        latencies = sorted(self.latencies)
+        return {
+            'layer': self.layer,
+            'concurrency': self.concurrency,
+            'operations': self.operations,
+            'errors': self.errors,
+            'throughput': round(self.throughput, 2),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        }
+
+
+class LoadTest:
+    """
+    Drives searches through one layer of the application at a fixed concurrency.
+
+    The layers are 'client' (one upstream search through FlightAPIClient), 'service'
+    (a flexible search through FlightService, ranked and merged) and 'view' (a search
+    form posted to the search view, through Django's request handling). Searches pick
+    random dates of a window, so the search cache sees a realistic mix of hits and misses.
+
+    Client and service searches use a client of their own, given the endpoint, cache
+    and rate limiter, which records no fares. Views build their service from settings,
+    so view searches run with settings overridden to the same effect.
+    """
+
+    LAYERS = ('client', 'service', 'view')
+
+    def __init__(
+        self,
+        layer: str,
+        concurrency: int,
+        operations: int,
+        origin: str = 'CNF',
+        destination: str = 'GRU',
+        days: int = 30,
+        flexibility: int = 0,
+        seed: Optional[int] = None,
+        base_url: Optional[str] = None,
+        cache: Optional[SearchCache] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
+        """
+        Initialize the load test.
+
+        Args:
+            layer: One of LAYERS.
+            concurrency: Number of operations in flight at once.
+            operations: Number of operations run in total.
+            origin: Origin searched, as typed in the search form.
+            destination: Destination searched.
+            days: Number of days, from tomorrow, the searched dates are drawn from.
+            flexibility: Flexibility of service and view searches, in days.
+            seed: Seed of the random dates, for repeatable runs.
+            base_url: Search endpoint called, such as a replay server's.
+            cache: Search cache of the searches, kept apart from the process-wide one,
+                or None to call the endpoint for every search.
+            rate_limiter: Limiter pacing the calls to the endpoint, by default one at
+                FLIGHT_API_RATE_LIMIT.
+
+        Raises:
+            ValueError: If the layer is unknown or a number isn't positive.
+        """
+        if layer not in self.LAYERS:
+            raise ValueError(f"Unknown layer: {layer!r}")
+        if concurrency <= 0 or operations <= 0 or days <= 0:
+            raise ValueError("The concurrency, operations and days must be positive.")
+        self.layer = layer
+        self.concurrency = concurrency
+        self.operations = operations
+        self.origin = origin
+        self.destination = destination
+        self.days = days
+        self.flexibility = flexibility
+        self.random = random.Random(seed)
+        self.base_url = base_url
+        self.cache = cache
+        self.rate_limiter = rate_limiter or TokenBucket(
+            rate=getattr(settings, 'FLIGHT_API_RATE_LIMIT', FlightAPIClient.RATE_LIMIT),
+            capacity=getattr(settings, 'FLIGHT_API_RATE_LIMIT_BURST', FlightAPIClient.RATE_LIMIT_BURST),
+        )
+
+    def draw_date(self) -> date:
+        return date.today() + timedelta(days=self.random.randint(1, self.days))
+
+    def operation(self) -> Callable[[], Awaitable[bool]]:
+        """
+        Returns the coroutine function running one operation of the layer, returning
+        whether it succeeded.
+        """
+        client = FlightAPIClient(base_url=self.base_url, cache=self.cache, rate_limiter=self.rate_limiter)
+        if self.layer == 'client':
+
+            async def search_client() -> bool:
+                response = await client.search_flights(self.origin, self.destination, self.draw_date())
+                return 'error' not in response
+            return search_client
+
+        if self.layer == 'service':
+            service = FlightService(client)
+
+            async def search_service() -> bool:
+                flights = await service.get_flights_internal(
+                    self.origin, self.destination, self.draw_date(), self.flexibility
+                )
+                # Failed upstream calls leave their dates without flights.
+                return bool(flights)
+            return search_service
+
+        view_client = AsyncClient()
+        url = reverse('search_flights')
+
+        async def search_view() -> bool:
+            response = await view_client.post(url, {
+                'origin': self.origin,
+                'destination': self.destination,
+                'date': self.draw_date().isoformat(),
+                'flexibility': self.flexibility,
+            })
+            # Successful searches redirect to their results.
+            return response.status_code == 302
+        return search_view
+
+    async def run(self) -> LoadReport:
+        """
+        Runs the operations, `concurrency` at a time.
+
+        Returns:
+            The LoadReport. Operations raising an exception count as errors.
+        """
+        if self.layer != 'view':
+            return await self.drive()
+        with override_settings(**self.view_settings()):
+            FlightAPIClient.reset_rate_limiter()
+            reset_search_cache()
+            try:
+                return await self.drive()
+            finally:
+                FlightAPIClient.reset_rate_limiter()
+                reset_search_cache()
+
+    def view_settings(self) -> Dict[str, Any]:
+        """
+        Returns the settings view searches run with, so they call the same endpoint, at the
+        same rate and with the same cache as client and service searches, and record no fares.
+        """
+        overrides: Dict[str, Any] = {
+            'FLIGHT_API_RATE_LIMIT': self.rate_limiter.rate,
+            'FLIGHT_API_RATE_LIMIT_BURST': self.rate_limiter.capacity,
+            'FLIGHT_API_RATE_LIMIT_CACHE': None,
+            'FLIGHT_SEARCH_CACHE_BACKEND': None,
+            'FLIGHT_SEARCH_CACHE_TTL': self.cache.ttl if self.cache is not None else 0,
+            'FLIGHT_FARE_HISTORY_ENABLED': False,
+            # Host of the requests made by Django's test client.
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver'],
+        }
+        if self.base_url is not None:
+            overrides['FLIGHT_API_BASE_URL'] = self.base_url
+        return overrides
+
+    async def drive(self) -> LoadReport:
+        operation = self.operation()
+        remaining = self.operations
+        latencies: List[float] = []
+        errors = 0
+
+        async def worker() -> None:
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    succeeded = await operation()
+                except Exception:
+                    succeeded = False
+                if succeeded:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, self.operations))])
+        return LoadReport(
+            self.layer, self.concurrency, time.perf_counter() - started, latencies, errors
+        )
@@ -0,0 +1,188 @@
+import json
+import pickle
+import statistics
+import time
+import tracemalloc
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from flights.autocomplete import AirportAutocomplete
+from flights.decoding import DECODERS
+from flights.ranking import cheapest, merge_cheapest, rank_key
+from flights.records import SearchContext, dump_flights
+from flights.replay import load_recorded_responses
+from flights.services import FlightService
+
+class Command(BaseCommand):
+    help = 'Measures the latency of hot code paths without calling the Smiles API'
+
+    DEFAULT_ITERATIONS = 1000
+    RECORDS_SEARCH_DAYS = 30
+    RANKING_LIMIT = 50
+    AUTOCOMPLETE_QUERIES = (
+        'g', 'gr', 'gru', 'sa', 'sao', 'sao paulo', 'São Pau', 'rio de',
+        'lisboa', 'new york', 'new yrok', 'int', 'xx',
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('subject', choices=sorted(self.subjects()), help='What to measure.')
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=self.DEFAULT_ITERATIONS,
+            help='Number of times each case is run.',
+        )
+
+    def subjects(self) -> Dict[str, Callable[[int], None]]:
+        return {
+            'autocomplete': self.benchmark_autocomplete,
+            'decoding': self.benchmark_decoding,
+            'parser': self.benchmark_parser,
+            'ranking': self.benchmark_ranking,
+            'records': self.benchmark_records,
+        }
+
+    def handle(self, *args, **kwargs):
+        if kwargs['iterations'] <= 0:
+            raise CommandError('--iterations must be positive.')
+        self.subjects()[kwargs['subject']](kwargs['iterations'])
+
+    def benchmark_autocomplete(self, iterations: int) -> None:
+        started = time.perf_counter()
+        autocomplete = AirportAutocomplete.from_csv()
+        self.stdout.write(
+            f'Index built from {len(autocomplete.records)} airports '
+            f'in {(time.perf_counter() - started) * 1000:.1f} ms'
+        )
+        for query in self.AUTOCOMPLETE_QUERIES:
+            self.report(repr(query), self.measure(lambda: autocomplete.search(query), iterations))
+
+    def benchmark_decoding(self, iterations: int) -> None:
+        bodies = [json.dumps(response) for response in load_recorded_responses()]
+        self.stdout.write(
+            f'Decoding {len(bodies)} recorded responses, {sum(map(len, bodies)) / 1024:.0f} KiB in total'
+        )
+        for name, decoder in DECODERS.items():
+            if decoder is None:
+                self.stdout.write(f'{name:<20} not installed')
+                continue
+            self.report(name, self.measure(lambda: [decoder(body) for body in bodies], iterations))
+
+    def benchmark_parser(self, iterations: int) -> None:
+        service = FlightService(client=object())
+        flight_lists = [
+            segment['flightList']
+            for response in load_recorded_responses()
+            for segment in response['requestedFlightSegmentList']
+        ]
+        self.stdout.write(
+            f'Parsing {sum(map(len, flight_lists))} recorded flights from {len(flight_lists)} responses'
+        )
+
+        def parse_with(parser: Callable[[Dict[str, Any], Any], Any], url: Any) -> Callable[[], None]:
+            def parse_all() -> None:
+                for flight_list in flight_lists:
+                    for flight in flight_list:
+                        parser(flight, url)
+            return parse_all
+
+        reference = self.measure(
+            parse_with(service.parse_single_flight, service.SMILES_URL_BASE), iterations
+        )
+        fast = self.measure(
+            parse_with(service.parse_flight_fast, SearchContext(service.SMILES_URL_BASE)), iterations
+        )
+        self.report('parse_single_flight', reference)
+        self.report('parse_flight_fast', fast)
+        self.stdout.write(f'Speedup: {statistics.median(reference) / statistics.median(fast):.2f}x')
+
+    def benchmark_records(self, iterations: int) -> None:
+        service = FlightService(client=object())
+        responses = load_recorded_responses()
+        # The recorded responses are replayed over a 30-day flexible search, one URL per date.
+        searches = [
+            (
+                service.generate_smiles_url('CNF', 'LIS', date(2024, 12, 1) + timedelta(days=day)),
+                responses[day % len(responses)],
+            )
+            for day in range(self.RECORDS_SEARCH_DAYS)
+        ]
+
+        def parse_dicts() -> List[Dict[str, Any]]:
+            flights = []
+            for smiles_url, response in searches:
+                for segment in response['requestedFlightSegmentList']:
+                    for flight in segment['flightList']:
+                        parsed = service.parse_single_flight(flight, smiles_url)
+                        if parsed and parsed['miles_cost'] != -1:
+                            flights.append(parsed)
+            return flights
+
+        def parse_records() -> List[Any]:
+            flights = []
+            for smiles_url, response in searches:
+                flights.extend(service.extract_flights(response, smiles_url))
+            return flights
+
+        for case, parse, dump in (
+            ('Dictionaries', parse_dicts, lambda flights: flights),
+            ('Flight records', parse_records, dump_flights),
+        ):
+            tracemalloc.start()
+            flights = parse()
+            memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            stored = dump(flights)
+            pickled = pickle.dumps(stored)
+            encoded = json.dumps(stored)
+            self.stdout.write(
+                f'{case}: {len(flights)} flights, {memory / 1024:.0f} KiB in memory, '
+                f'{len(pickled) / 1024:.0f} KiB pickled, {len(encoded) / 1024:.0f} KiB as JSON'
+            )
+            self.report('  pickle.dumps', self.measure(lambda: pickle.dumps(dump(flights)), iterations))
+            self.report('  json.dumps', self.measure(lambda: json.dumps(dump(flights)), iterations))
+
+    def benchmark_ranking(self, iterations: int) -> None:
+        service = FlightService(client=object())
+        responses = load_recorded_responses()
+        dates = [
+            service.extract_flights(
+                responses[day % len(responses)],
+                service.generate_smiles_url('CNF', 'LIS', date(2024, 12, 1) + timedelta(days=day)),
+            )
+            for day in range(self.RECORDS_SEARCH_DAYS)
+        ]
+        limit = self.RANKING_LIMIT
+        self.stdout.write(
+            f'Selecting the top {limit} of {sum(map(len, dates))} flights over {len(dates)} dates'
+        )
+
+        def full_sort() -> None:
+            sorted((flight for flights in dates for flight in flights), key=rank_key)[:limit]
+
+        def bounded_merge() -> None:
+            merge_cheapest([cheapest(flights, limit) for flights in dates], limit)
+
+        self.report('full sort', self.measure(full_sort, iterations))
+        self.report('bounded merge', self.measure(bounded_merge, iterations))
+
+    def measure(self, function: Callable[[], object], iterations: int) -> List[float]:
+        """
+        Runs the function repeatedly and returns the duration of each run in microseconds.
+        """
+        durations = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            function()
+            durations.append((time.perf_counter() - started) * 1_000_000)
+        return durations
+
+    def report(self, case: str, durations: List[float]) -> None:
+        durations = sorted(durations)
+        p99 = durations[min(len(durations) - 1, int(len(durations) * 0.99))]
+        self.stdout.write(
+            f'{case:<20} mean {statistics.mean(durations):8.1f} us  '
+            f'p50 {statistics.median(durations):8.1f} us  p99 {p99:8.1f} us'
+        )
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from flights.api_client import FlightAPIClient
+from flights.watchlist import WatchChecker
+
+class Command(BaseCommand):
+    help = (
+        'Re-checks the active price watches, searching each route and date once however many '
+        'users watch it, and records an alert for each watch whose fare dropped enough. '
+        'It sends at most FLIGHT_WATCH_RATE_SHARE of FLIGHT_API_RATE_LIMIT. Set FLIGHT_API_RATE_LIMIT_CACHE '
+        'so this process shares the rate limit with the web server; otherwise its requests add up to the web server\'s'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--budget',
+            type=int,
+            help='Maximum number of routes and dates searched per run. Defaults to the FLIGHT_WATCH_BUDGET setting.',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Seconds between runs. Runs once if zero.',
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['budget'] is not None and kwargs['budget'] <= 0:
+            raise CommandError('--budget must be positive.')
+        if kwargs['interval'] < 0:
+            raise CommandError('--interval must not be negative.')
+
+        checker = WatchChecker(budget=kwargs['budget'])
+        if FlightAPIClient.get_shared_rate_limiter() is None:
+            self.stderr.write(self.style.WARNING(
+                'FLIGHT_API_RATE_LIMIT_CACHE is not set, so this process does not share the rate limit '
+                'with the web server, and its requests add up to the web server\'s.'
+            ))
+        while True:
+            counts = checker.check()
+            self.stdout.write(self.style.SUCCESS(
+                f'Searched {counts["groups"]} routes and dates. Checked: {counts["checked"]}, '
+                f'failed: {counts["failed"]}, alerts: {counts["alerts"]}.'
+            ))
+            if not kwargs['interval']:
+                return
+            time.sleep(kwargs['interval'])
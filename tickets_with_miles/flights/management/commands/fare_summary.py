@@ -0,0 +1,96 @@
+import calendar
+import csv
+import time
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from flights.fare_analytics import DIMENSIONS, FareColumns, summarize
+
+class Command(BaseCommand):
+    help = (
+        'Summarizes the miles of the fare history by route, weekday, airline or stops: '
+        'count, minimum, mean, maximum and percentiles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--by',
+            default='route,weekday',
+            help=f'Comma-separated dimensions the fares are grouped by, among {", ".join(DIMENSIONS)}.',
+        )
+        parser.add_argument(
+            '--percentiles',
+            default='10,50,90',
+            help='Comma-separated percentiles of the miles of each group.',
+        )
+        parser.add_argument('--route', help='Only the fares of one route, such as CNF-GRU.')
+        parser.add_argument('--since-days', type=int, help='Only the fares observed in the last days.')
+        parser.add_argument(
+            '--columns',
+            help='Directory of columns saved by --export, memory-mapped instead of loading the database.',
+        )
+        parser.add_argument('--export', help='Directory the columns loaded from the database are saved to.')
+        parser.add_argument('--csv', action='store_true', help='Writes the summary as CSV.')
+
+    def handle(self, *args, **kwargs):
+        by = [name.strip() for name in kwargs['by'].split(',') if name.strip()]
+        try:
+            percentiles = [float(value) for value in kwargs['percentiles'].split(',') if value.strip()]
+        except ValueError:
+            raise CommandError('--percentiles must be numbers.')
+        if any(not 0 <= percentile <= 100 for percentile in percentiles):
+            raise CommandError('--percentiles must be between 0 and 100.')
+
+        started = time.perf_counter()
+        try:
+            columns = FareColumns.load(kwargs['columns']) if kwargs['columns'] else FareColumns.from_observations()
+        except (ValueError, OSError) as e:
+            raise CommandError(e)
+        loaded = time.perf_counter()
+        if kwargs['export']:
+            columns.save(kwargs['export'])
+
+        since = None
+        if kwargs['since_days'] is not None:
+            since = timezone.now() - timedelta(days=kwargs['since_days'])
+        route = kwargs['route'].upper() if kwargs['route'] else None
+        if route is not None or since is not None:
+            columns = columns.filter(route=route, since=since)
+
+        try:
+            rows = summarize(columns, by, percentiles)
+        except ValueError as e:
+            raise CommandError(e)
+        summarized = time.perf_counter()
+
+        self.write_rows(rows, kwargs['csv'])
+        self.stderr.write(
+            f'{len(columns)} fares loaded in {loaded - started:.2f} s, '
+            f'{len(rows)} groups summarized in {summarized - loaded:.3f} s'
+        )
+
+    def write_rows(self, rows: List[Dict[str, Any]], as_csv: bool) -> None:
+        if not rows:
+            self.stdout.write('No fares recorded.')
+            return
+        fields = list(rows[0])
+        cells = [
+            [calendar.day_abbr[value] if field == 'weekday' else value for field, value in row.items()]
+            for row in rows
+        ]
+        if as_csv:
+            writer = csv.writer(self.stdout)
+            writer.writerow(fields)
+            writer.writerows(cells)
+            return
+        widths = [
+            max(len(str(value)) for value in [field] + [row[index] for row in cells])
+            for index, field in enumerate(fields)
+        ]
+        for line in [fields] + cells:
+            self.stdout.write('  '.join(
+                str(value).ljust(width) if isinstance(value, str) else str(value).rjust(width)
+                for value, width in zip(line, widths)
+            ))
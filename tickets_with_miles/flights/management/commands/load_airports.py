@@ -1,24 +1,71 @@
 import os
 import csv
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from flights.airport_index import invalidate_airport_index
+from flights.autocomplete import invalidate_airport_autocomplete
 from flights.models import Airport
 
 class Command(BaseCommand):
-    help = 'Loads airports from a CSV file'
+    help = 'Loads airports from a CSV file, inserting new ones and updating changed ones'
 
-    def handle(self, *args, **kwargs):
+    FIELDS = ('name', 'state_code', 'country_code', 'country_name')
+    DEFAULT_BATCH_SIZE = 500
 
+    def add_arguments(self, parser):
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        csv_path = os.path.join(base_dir, 'data', 'airports.csv')
+        parser.add_argument(
+            '--csv',
+            dest='csv_path',
+            default=os.path.join(base_dir, 'data', 'airports.csv'),
+            help='Path of the CSV file with the airports.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=self.DEFAULT_BATCH_SIZE,
+            help='Number of airports written per query.',
+        )
 
-        with open(csv_path, 'r') as file:
+    def handle(self, *args, **kwargs):
+        rows = {}
+        with open(kwargs['csv_path'], 'r', encoding='utf-8') as file:
             reader = csv.DictReader(file)
             for row in reader:
-                Airport.objects.create(
-                    name = row['name'],
-                    iata_code = row['iata_code'],
-                    state_code =row['state_code'],
-                    country_code = row['country_code'],
-                    country_name = row['country_name'],
-                )
-        self.stdout.write(self.style.SUCCESS('Airports loaded with success!'))
\ No newline at end of file
+                # A repeated code keeps its last row, as sequential updates would.
+                rows[row['iata_code']] = tuple(row[field] for field in self.FIELDS)
+
+        existing = {
+            airport[0]: airport[1:]
+            for airport in Airport.objects.values_list('iata_code', *self.FIELDS)
+        }
+
+        inserted = updated = unchanged = 0
+        airports = []
+        for iata_code, values in rows.items():
+            current = existing.get(iata_code)
+            if current is None:
+                inserted += 1
+            elif current != values:
+                updated += 1
+            else:
+                unchanged += 1
+                continue
+            airports.append(Airport(iata_code=iata_code, **dict(zip(self.FIELDS, values))))
+
+        with transaction.atomic():
+            Airport.objects.bulk_create(
+                airports,
+                batch_size=kwargs['batch_size'],
+                update_conflicts=True,
+                unique_fields=['iata_code'],
+                update_fields=list(self.FIELDS),
+            )
+        # bulk_create doesn't send post_save, so the indexes are refreshed here.
+        invalidate_airport_index()
+        invalidate_airport_autocomplete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Airports loaded with success! '
+            f'Inserted: {inserted}, updated: {updated}, unchanged: {unchanged}.'
+        ))
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from flights.api_client import FlightAPIClient
+from flights.cache import SearchCache
+from flights.load_test import LoadReport, LoadTest
+from flights.management.commands.replay_server import add_profile_arguments, profile_from_options
+from flights.replay import ReplayProfile, ReplayServer
+from flights.throttling import TokenBucket
+
+class Command(BaseCommand):
+    help = (
+        'Drives searches through the client, the service or the search view at a target '
+        'concurrency, against a replay of the Smiles API, and reports throughput and latency percentiles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('layer', choices=LoadTest.LAYERS, help='Layer the searches go through.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Searches in flight at once.')
+        parser.add_argument('--requests', type=int, default=200, help='Searches run in total.')
+        parser.add_argument('--origin', default='CNF', help='Origin searched.')
+        parser.add_argument('--destination', default='GRU', help='Destination searched.')
+        parser.add_argument('--days', type=int, default=30, help='Days, from tomorrow, the dates are drawn from.')
+        parser.add_argument(
+            '--flexibility',
+            type=int,
+            default=0,
+            help='Flexibility of service and view searches, in days.',
+        )
+        parser.add_argument(
+            '--rate-limit',
+            type=float,
+            help='Requests per second allowed to the API. Defaults to the FLIGHT_API_RATE_LIMIT setting.',
+        )
+        parser.add_argument(
+            '--no-cache',
+            action='store_true',
+            help='Disables the search cache, so every search calls the API.',
+        )
+        parser.add_argument(
+            '--url',
+            help='Search endpoint of a replay server already running, such as `manage.py replay_server`. '
+                 'By default, one is started in this process with the options below.',
+        )
+        add_profile_arguments(parser)
+
+    def handle(self, *args, **kwargs):
+        if kwargs['rate_limit'] is not None and kwargs['rate_limit'] <= 0:
+            raise CommandError('--rate-limit must be positive.')
+        # Replayed responses must never reach a cache shared with the web server, nor the fare history.
+        cache = None
+        ttl = getattr(settings, 'FLIGHT_SEARCH_CACHE_TTL', 0)
+        if ttl and not kwargs['no_cache']:
+            cache = SearchCache(
+                ttl=ttl,
+                maxsize=getattr(settings, 'FLIGHT_SEARCH_CACHE_MAXSIZE', 1024),
+                stale_ttl=getattr(settings, 'FLIGHT_SEARCH_CACHE_STALE_TTL', 0),
+            )
+        rate_limiter = None
+        if kwargs['rate_limit'] is not None:
+            rate_limiter = TokenBucket(rate=kwargs['rate_limit'], capacity=max(1, int(kwargs['rate_limit'])))
+        try:
+            profile = profile_from_options(kwargs)
+            load_test = LoadTest(
+                kwargs['layer'],
+                kwargs['concurrency'],
+                kwargs['requests'],
+                origin=kwargs['origin'].upper(),
+                destination=kwargs['destination'].upper(),
+                days=kwargs['days'],
+                flexibility=kwargs['flexibility'],
+                seed=kwargs['seed'],
+                base_url=kwargs['url'],
+                cache=cache,
+                rate_limiter=rate_limiter,
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        report = asyncio.run(self.run(load_test, profile))
+        self.report(report)
+
+    async def run(self, load_test: LoadTest, profile: ReplayProfile) -> LoadReport:
+        server = None
+        if load_test.base_url is None:
+            server = ReplayServer(profile=profile)
+            load_test.base_url = await server.start()
+        try:
+            return await load_test.run()
+        finally:
+            await FlightAPIClient.close_session()
+            if server is not None:
+                await server.close()
+                self.stdout.write(f'Replay server: {server.stats}')
+
+    def report(self, report: LoadReport) -> None:
+        summary = report.summary()
+        self.stdout.write(
+            f'{summary["layer"]}: {summary["operations"]} searches, concurrency {summary["concurrency"]}, '
+            f'{summary["errors"]} failed, in {report.elapsed:.2f} s'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'throughput {summary["throughput"]:.1f}/s  mean {summary["mean_ms"]:.1f} ms  '
+            f'p50 {summary["p50_ms"]:.1f} ms  p95 {summary["p95_ms"]:.1f} ms  '
+            f'p99 {summary["p99_ms"]:.1f} ms  max {summary["max_ms"]:.1f} ms'
+        ))
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from flights.api_client import FlightAPIClient
+from flights.prefetch import CachePrefetcher, HotRoute, load_hot_routes, parse_hot_routes
+
+class Command(BaseCommand):
+    help = (
+        'Warms the search cache with the searches of popular routes, using only spare API capacity, '
+        'at most FLIGHT_PREFETCH_RATE_SHARE of FLIGHT_API_RATE_LIMIT. Set FLIGHT_API_RATE_LIMIT_CACHE '
+        'so this process shares the rate limit with the web server; otherwise its requests add up to the web server\'s'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--routes',
+            dest='routes_path',
+            help=(
+                'CSV file with origin, destination and, optionally, days, start and weight columns. '
+                'Defaults to the FLIGHT_PREFETCH_ROUTES setting.'
+            ),
+        )
+        parser.add_argument('--budget', type=int, help='Maximum number of searches fetched per run.')
+        parser.add_argument('--concurrency', type=int, help='Maximum number of searches in flight at once.')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Seconds between runs, reloading the routes each time. Runs once if zero.',
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['budget'] is not None and kwargs['budget'] < 0:
+            raise CommandError('--budget must not be negative.')
+        if kwargs['concurrency'] is not None and kwargs['concurrency'] <= 0:
+            raise CommandError('--concurrency must be positive.')
+
+        routes_path = kwargs['routes_path']
+
+        def load_routes() -> List[HotRoute]:
+            if routes_path:
+                return load_hot_routes(routes_path)
+            return parse_hot_routes(getattr(settings, 'FLIGHT_PREFETCH_ROUTES', []))
+
+        try:
+            load_routes()
+            prefetcher = CachePrefetcher(budget=kwargs['budget'], concurrency=kwargs['concurrency'])
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        if FlightAPIClient.get_shared_rate_limiter() is None:
+            self.stderr.write(self.style.WARNING(
+                'FLIGHT_API_RATE_LIMIT_CACHE is not set, so this process does not share the rate limit '
+                'with the web server, and its requests add up to the web server\'s.'
+            ))
+        if prefetcher.client.cache.backend is None:
+            self.stderr.write(self.style.WARNING(
+                'FLIGHT_SEARCH_CACHE_BACKEND is not set, so the responses are only cached in this '
+                'process. Set it to a cache shared with the web server.'
+            ))
+        asyncio.run(self.run(prefetcher, load_routes, kwargs['interval']))
+
+    async def run(
+        self,
+        prefetcher: CachePrefetcher,
+        load_routes: Callable[[], List[HotRoute]],
+        interval: Optional[float],
+    ) -> None:
+        try:
+            while True:
+                routes = load_routes()
+                counts = await prefetcher.prefetch(routes)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Warmed {len(routes)} routes. Fetched: {counts["fetched"]}, '
+                    f'already fresh: {counts["fresh"]}, failed: {counts["failed"]}, '
+                    f'deferred: {counts["deferred"]}.'
+                ))
+                if not interval:
+                    return
+                await asyncio.sleep(interval)
+        finally:
+            await FlightAPIClient.close_session()
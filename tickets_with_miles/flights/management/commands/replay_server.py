@@ -0,0 +1,77 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+from flights.replay import ReplayProfile, ReplayServer, load_recorded_responses
+
+class Command(BaseCommand):
+    help = 'Serves recorded Smiles API responses locally, to develop and benchmark offline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='localhost', help='Interface listened on.')
+        parser.add_argument('--port', type=int, default=8765, help='Port listened on.')
+        parser.add_argument('--responses', help='JSON file with the responses replayed. Defaults to the recorded ones.')
+        add_profile_arguments(parser)
+
+    def handle(self, *args, **kwargs):
+        try:
+            responses = load_recorded_responses(kwargs['responses']) if kwargs['responses'] else None
+            server = ReplayServer(responses, profile_from_options(kwargs))
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+        try:
+            asyncio.run(self.serve(server, kwargs['host'], kwargs['port']))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Replay server stopped. {server.stats}')
+
+    async def serve(self, server: ReplayServer, host: str, port: int) -> None:
+        url = await server.start(host, port)
+        self.stdout.write(self.style.SUCCESS(
+            f'Replaying {len(server.bodies)} responses at {url}. Set FLIGHT_API_BASE_URL to it, '
+            f'and stop with CONTROL-C.'
+        ))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+
+def add_profile_arguments(parser) -> None:
+    """
+    Adds the options of a ReplayProfile to a command's parser.
+    """
+    parser.add_argument('--latency', type=float, default=0.2, help='Median seconds per response.')
+    parser.add_argument(
+        '--jitter',
+        type=float,
+        default=0.0,
+        help='Spread of the log-normal latencies, 0 for a fixed latency. 0.5 gives a realistic tail.',
+    )
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of responses that are 503s.')
+    parser.add_argument(
+        '--throttle-every',
+        type=int,
+        default=0,
+        help='Requests between bursts of 429 responses, 0 never throttles.',
+    )
+    parser.add_argument('--throttle-length', type=int, default=1, help='429 responses per burst.')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds of the 429s.')
+    parser.add_argument('--seed', type=int, help='Seed of the random latencies and errors.')
+
+
+def profile_from_options(options) -> ReplayProfile:
+    """
+    Builds the ReplayProfile of a command's options.
+
+    Raises:
+        ValueError: If an option is out of range.
+    """
+    return ReplayProfile(
+        latency=options['latency'],
+        jitter=options['jitter'],
+        error_rate=options['error_rate'],
+        throttle_every=options['throttle_every'],
+        throttle_length=options['throttle_length'],
+        retry_after=options['retry_after'],
+        seed=options['seed'],
+    )
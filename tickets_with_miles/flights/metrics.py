@@ -0,0 +1,363 @@
+import bisect
+import math
+import threading
+import weakref
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .cache import get_search_cache
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+PARSE_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)  # seconds
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+Labels = Tuple[str, ...]
+
+
+class _ShardOwner:
+    """
+    Kept in a thread's locals, so its finalizer runs when the thread ends.
+    """
+
+
+class Metric:
+    """
+    Base of the metrics: values per label set, aggregated per thread.
+
+    Each thread updates its own shard, a dictionary registered once on its first
+    update, so updates take no lock and never contend. Collecting adds up the shards.
+    When a thread ends, its shard is folded into a base shard, so servers starting
+    a thread per request don't keep one shard per thread they ever ran.
+    """
+
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._base: Dict[Labels, Any] = {}
+        self._shards: List[Dict[Labels, Any]] = [self._base]
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> Dict[Labels, Any]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            # The thread's locals are dropped when it ends, and the owner with them.
+            owner = self._local.owner = _ShardOwner()
+            weakref.finalize(owner, self._fold, shard)
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _fold(self, shard: Dict[Labels, Any]) -> None:
+        with self._shards_lock:
+            for labels, value in shard.items():
+                total = self._base.get(labels)
+                self._base[labels] = value if total is None else self._add(total, value)
+            self._shards = [other for other in self._shards if other is not shard]
+
+    def _add(self, total: Any, value: Any) -> Any:
+        raise NotImplementedError
+
+    def _check(self, labels: Labels) -> None:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {labels}")
+
+    def snapshots(self) -> Iterable[List[Tuple[Labels, Any]]]:
+        with self._shards_lock:
+            # Folding updates the base shard under the lock, and replaces its values.
+            base = list(self._base.items())
+            shards = [shard for shard in self._shards if shard is not self._base]
+        # Copied in one step each, so threads updating their shard meanwhile are harmless.
+        return [base] + [list(shard.items()) for shard in shards]
+
+    def reset(self) -> None:
+        with self._shards_lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """
+        Returns the (sample name, formatted labels, value) of every series.
+        """
+        raise NotImplementedError
+
+    def format_labels(self, labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+    def expose(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.TYPE}']
+        lines.extend(f'{name}{labels} {format_value(value)}' for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """
+    Value that only goes up, such as a number of requests.
+    """
+
+    TYPE = 'counter'
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        shard = self._shard()
+        if labels not in shard:
+            self._check(labels)
+            shard[labels] = 0
+        shard[labels] += amount
+
+    def _add(self, total: float, value: float) -> float:
+        return total + value
+
+    def totals(self) -> Dict[Labels, float]:
+        totals: Dict[Labels, float] = {}
+        for items in self.snapshots():
+            for labels, value in items:
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def value(self, *labels: str) -> float:
+        return self.totals().get(labels, 0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [
+            (self.name, self.format_labels(labels), value)
+            for labels, value in sorted(self.totals().items())
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, such as the number of requests in flight.
+    """
+
+    TYPE = 'gauge'
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, such as latencies, counted in buckets.
+    """
+
+    TYPE = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            self._check(labels)
+            # Count per bucket, the last one unbounded, then the sum of the values.
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def _add(self, total: List[float], value: List[float]) -> List[float]:
+        return [a + b for a, b in zip(total, value)]
+
+    def totals(self) -> Dict[Labels, List[float]]:
+        totals: Dict[Labels, List[float]] = {}
+        for items in self.snapshots():
+            for labels, entry in items:
+                entry = list(entry)
+                total = totals.get(labels)
+                if total is None:
+                    totals[labels] = entry
+                else:
+                    for index, value in enumerate(entry):
+                        total[index] += value
+        return totals
+
+    def count(self, *labels: str) -> int:
+        entry = self.totals().get(labels)
+        return sum(entry[:-1]) if entry else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        for labels, entry in sorted(self.totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry[:-1]):
+                cumulative += count
+                samples.append((
+                    f'{self.name}_bucket', self.format_labels(labels, (('le', format_value(bound)),)), cumulative,
+                ))
+            samples.append((f'{self.name}_sum', self.format_labels(labels), entry[-1]))
+            samples.append((f'{self.name}_count', self.format_labels(labels), cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Metrics of this process, exposed in the Prometheus text format.
+
+    Collectors are functions called on every exposition, returning the lines of
+    values kept elsewhere, such as the search cache's counters.
+    """
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], List[str]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], List[str]]) -> None:
+        self.collectors.append(collector)
+
+    def expose(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines: List[str] = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.expose())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        """
+        Zeroes every metric, for tests.
+        """
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+
+def escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def metrics_enabled() -> bool:
+    """
+    Returns whether the /metrics view is served, from the FLIGHT_METRICS_ENABLED setting.
+    """
+    return getattr(settings, 'FLIGHT_METRICS_ENABLED', False)
+
+
+def flexibility_bucket(days: Optional[int]) -> str:
+    """
+    Groups flexibilities, in days, into a few label values, so the series stay few.
+    """
+    if not days:
+        return '0'
+    for bound, label in ((3, '1-3'), (7, '4-7'), (15, '8-15')):
+        if days <= bound:
+            return label
+    return '16+'
+
+
+REGISTRY = MetricsRegistry()
+
+# Client
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'flights_upstream_requests_total',
+    'Requests sent to the Smiles API, by outcome: ok, an HTTP status, timeout or connection_error.',
+    ('outcome',),
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    'flights_upstream_retries_total', 'Failed requests to the Smiles API that were retried.'
+)
+UPSTREAM_FAILURES = REGISTRY.counter(
+    'flights_upstream_failures_total',
+    'Searches that failed after every attempt, answered with an error instead of flights.',
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    'flights_upstream_in_flight', 'Requests to the Smiles API currently in flight.'
+)
+UPSTREAM_LATENCY = REGISTRY.histogram(
+    'flights_upstream_request_seconds', 'Duration of each request to the Smiles API, including the body.'
+)
+
+# Service
+FLIGHTS_PARSED = REGISTRY.counter('flights_parsed_total', 'Flights parsed from the Smiles API responses.')
+PARSE_LATENCY = REGISTRY.histogram(
+    'flights_parse_seconds', 'Time spent parsing the flights of one response.', buckets=PARSE_BUCKETS
+)
+RESULT_SIZE = REGISTRY.histogram(
+    'flights_search_results', 'Flights or round trips returned per search, by kind.', ('kind',), buckets=SIZE_BUCKETS
+)
+
+# Views
+VIEW_LATENCY = REGISTRY.histogram(
+    'flights_view_seconds',
+    'End-to-end duration of the search views, by view and flexibility in days.',
+    ('view', 'flexibility'),
+)
+
+
+def collect_search_cache() -> List[str]:
+    """
+    Returns the counters of the process-wide search cache, if it is enabled.
+    """
+    cache = get_search_cache()
+    if cache is None:
+        return []
+    stats = cache.stats()
+    lines = [
+        '# HELP flights_search_cache_lookups_total Lookups of the search cache, by result.',
+        '# TYPE flights_search_cache_lookups_total counter',
+    ]
+    # Stale hits are counted among the hits too.
+    for result, count in (
+        ('hit', stats['hits'] - stats['stale_hits']), ('stale', stats['stale_hits']), ('miss', stats['misses']),
+    ):
+        lines.append(f'flights_search_cache_lookups_total{{result="{result}"}} {count}')
+    lines.extend([
+        '# HELP flights_search_cache_hit_ratio Hits over lookups of the search cache.',
+        '# TYPE flights_search_cache_hit_ratio gauge',
+        f'flights_search_cache_hit_ratio {format_value(stats["hit_ratio"])}',
+        '# HELP flights_search_cache_size Responses held in this process\'s search cache.',
+        '# TYPE flights_search_cache_size gauge',
+        f'flights_search_cache_size {stats["size"]}',
+    ])
+    return lines
+
+
+REGISTRY.add_collector(collect_search_cache)
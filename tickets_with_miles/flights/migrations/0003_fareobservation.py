@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0002_alter_airport_iata_code'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin', models.CharField(max_length=3)),
+                ('destination', models.CharField(max_length=3)),
+                ('flight_date', models.DateField()),
+                ('airline', models.CharField(blank=True, max_length=64)),
+                ('stops', models.PositiveSmallIntegerField()),
+                ('miles', models.PositiveIntegerField()),
+                ('observed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['origin', 'destination', 'flight_date', 'miles'], name='fare_route_day_miles'), models.Index(fields=['origin', 'destination', 'flight_date', 'observed_at'], name='fare_route_day_observed'), models.Index(fields=['observed_at'], name='fare_observed_at')],
+            },
+        ),
+    ]
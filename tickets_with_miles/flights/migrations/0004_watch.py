@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0003_fareobservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Watch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254)),
+                ('origin', models.CharField(max_length=3)),
+                ('destination', models.CharField(max_length=3)),
+                ('flight_date', models.DateField()),
+                ('max_miles', models.PositiveIntegerField()),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_checked_at', models.DateTimeField(blank=True, null=True)),
+                ('alerted_miles', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['active', 'origin', 'destination', 'flight_date'], name='watch_active_route_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('miles', models.PositiveIntegerField()),
+                ('airline', models.CharField(blank=True, max_length=64)),
+                ('stops', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('triggered_at', models.DateTimeField()),
+                ('watch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alerts', to='flights.watch')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flights', '0004_watch'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='fareobservation',
+            name='airline',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fareobservation',
+            name='stops',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+    ]
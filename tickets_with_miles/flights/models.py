@@ -1,3 +1,4 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
 class Airport(models.Model):
@@ -9,3 +10,106 @@ class Airport(models.Model):
 
     def __str__(self):
         return f"{self.name} ({self.iata_code})"
+
+
+class FareObservation(models.Model):
+    """
+    Fare of one flight seen in a response of the Smiles API, kept to follow prices over time.
+    """
+
+    origin = models.CharField(max_length=3)
+    destination = models.CharField(max_length=3)
+    flight_date = models.DateField()
+    # Null when the API didn't say.
+    airline = models.CharField(max_length=64, null=True, blank=True)
+    stops = models.PositiveSmallIntegerField(null=True, blank=True)
+    miles = models.PositiveIntegerField()
+    observed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Cheapest fare of a route per day: the minimum is read from the index.
+            models.Index(fields=['origin', 'destination', 'flight_date', 'miles'], name='fare_route_day_miles'),
+            # Fares of a route and day over time, or observed recently.
+            models.Index(fields=['origin', 'destination', 'flight_date', 'observed_at'], name='fare_route_day_observed'),
+            # Pruning of old observations.
+            models.Index(fields=['observed_at'], name='fare_observed_at'),
+        ]
+
+    def __str__(self):
+        return f"{self.origin}-{self.destination} {self.flight_date}: {self.miles} miles"
+
+
+class Watch(models.Model):
+    """
+    Request to be alerted when a route's cheapest fare on a date drops to `max_miles` or less.
+    """
+
+    email = models.EmailField()
+    origin = models.CharField(max_length=3)
+    destination = models.CharField(max_length=3)
+    flight_date = models.DateField()
+    max_miles = models.PositiveIntegerField()
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_checked_at = models.DateTimeField(null=True, blank=True)
+    # Fare of the last alert, so the watcher is only alerted again if the price drops further.
+    alerted_miles = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Active watches grouped by route and date, and the watchers of one group.
+            models.Index(fields=['active', 'origin', 'destination', 'flight_date'], name='watch_active_route_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.email}: {self.origin}-{self.destination} {self.flight_date} ≤ {self.max_miles} miles"
+
+    def clean_fields(self, exclude=None):
+        self.normalize()
+        super().clean_fields(exclude)
+
+    def clean(self):
+        """
+        Validates the airports like the fare calendar form: each one an IATA code of the
+        airport index, not a group or a region, and different from each other.
+        """
+        # Imported here, since the airport index reads the Airport model.
+        from .airport_groups import is_airport_code
+        from .forms import FlightSearchForm
+
+        errors = {
+            field: FlightSearchForm.ERROR_MESSAGES[field]
+            for field in ('origin', 'destination')
+            if not is_airport_code(getattr(self, field))
+        }
+        if not errors and self.origin == self.destination:
+            errors['destination'] = FlightSearchForm.ERROR_MESSAGES['same_airports']
+        if errors:
+            raise ValidationError(errors)
+
+    def save(self, *args, **kwargs):
+        self.normalize()
+        super().save(*args, **kwargs)
+
+    def normalize(self) -> None:
+        """
+        Uppercases the airport codes, so watches of the same route are searched together.
+        """
+        self.origin = (self.origin or '').strip().upper()
+        self.destination = (self.destination or '').strip().upper()
+
+
+class PriceAlert(models.Model):
+    """
+    Fare that met a watch's threshold when it was checked.
+    """
+
+    watch = models.ForeignKey(Watch, on_delete=models.CASCADE, related_name='alerts')
+    miles = models.PositiveIntegerField()
+    airline = models.CharField(max_length=64, blank=True)
+    stops = models.PositiveSmallIntegerField(null=True, blank=True)
+    triggered_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.watch.origin}-{self.watch.destination} {self.watch.flight_date}: {self.miles} miles"
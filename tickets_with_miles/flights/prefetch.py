@@ -0,0 +1,194 @@
+import asyncio
+import csv
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .api_client import FlightAPIClient
+from .cache import SearchCache, get_search_cache
+from .fare_history import get_fare_history
+
+
+@dataclass(frozen=True, slots=True)
+class HotRoute:
+    """
+    Route whose searches are kept warm in the search cache.
+
+    The dates warmed are the `days` dates starting `start` days from today. The weight
+    ranks routes against each other, for example their number of recent searches.
+    """
+
+    origin: str
+    destination: str
+    days: int = 7
+    start: int = 0
+    weight: float = 1.0
+
+
+def parse_hot_routes(rows: Iterable[Dict[str, Any]]) -> List[HotRoute]:
+    """
+    Builds hot routes from dictionaries, such as CSV rows or the FLIGHT_PREFETCH_ROUTES setting.
+
+    Args:
+        rows: Dictionaries with 'origin' and 'destination' and, optionally, 'days',
+            'start' and 'weight'. Empty values take the defaults of HotRoute.
+
+    Returns:
+        The hot routes, with airport codes uppercased.
+
+    Raises:
+        ValueError: If a row lacks an airport code or has an invalid number.
+    """
+    routes = []
+    for line, row in enumerate(rows, start=1):
+        origin = (row.get('origin') or '').strip().upper()
+        destination = (row.get('destination') or '').strip().upper()
+        if not origin or not destination:
+            raise ValueError(f"Route {line} needs an origin and a destination.")
+        options = {
+            name: cast(row[name])
+            for name, cast in (('days', int), ('start', int), ('weight', float))
+            if row.get(name) not in (None, '')
+        }
+        route = HotRoute(origin, destination, **options)
+        if route.days <= 0 or route.start < 0 or route.weight <= 0:
+            raise ValueError(f"Route {line} needs positive days and weight and a non-negative start.")
+        routes.append(route)
+    return routes
+
+
+def load_hot_routes(csv_path: str) -> List[HotRoute]:
+    """
+    Reads hot routes from a CSV file with the columns of `parse_hot_routes`.
+
+    Args:
+        csv_path: Path of the CSV file, for example aggregated from recent search logs.
+
+    Returns:
+        The hot routes, in file order.
+    """
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        return parse_hot_routes(csv.DictReader(file))
+
+
+class CachePrefetcher:
+    """
+    Fills the search cache with the searches of hot routes before users ask for them.
+
+    Searches are fetched most valuable first, and only those missing from the cache or
+    stale, until the request budget is spent. The client only takes spare tokens from
+    the process-wide rate limiter, so warming yields to interactive searches instead of
+    delaying them, and never more than its share of the rate. When it runs in a process
+    of its own, the budget is only shared with the web server through the cache named by
+    FLIGHT_API_RATE_LIMIT_CACHE.
+    """
+
+    DEFAULT_BUDGET = 200  # upstream searches per run
+    DEFAULT_CONCURRENCY = 2
+    DEFAULT_RATE_LIMIT_KEEP = 5  # tokens of the rate limiter left for interactive searches
+    DEFAULT_RATE_LIMIT_SHARE = 0.2  # fraction of the rate limit warming uses at most
+
+    def __init__(
+        self,
+        client: Optional[FlightAPIClient] = None,
+        budget: Optional[int] = None,
+        concurrency: Optional[int] = None,
+    ):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            client: Client whose cache is warmed, by default a background client backed
+                by the process-wide search cache and fare history, and limited to
+                FLIGHT_PREFETCH_RATE_SHARE of the rate limit.
+            budget: Maximum number of searches fetched per run.
+            concurrency: Maximum number of searches in flight at once.
+
+        Raises:
+            ValueError: If the client has no cache to warm.
+        """
+        self.client = client or FlightAPIClient(
+            cache=get_search_cache(),
+            rate_limit_keep=getattr(settings, 'FLIGHT_PREFETCH_RATE_LIMIT_KEEP', self.DEFAULT_RATE_LIMIT_KEEP),
+            rate_limit_share=getattr(settings, 'FLIGHT_PREFETCH_RATE_SHARE', self.DEFAULT_RATE_LIMIT_SHARE),
+            fare_history=get_fare_history(),
+        )
+        if self.client.cache is None:
+            raise ValueError("The search cache is disabled, so there is nothing to warm.")
+        self.budget = budget if budget is not None else getattr(
+            settings, 'FLIGHT_PREFETCH_BUDGET', self.DEFAULT_BUDGET
+        )
+        self.concurrency = concurrency or getattr(
+            settings, 'FLIGHT_PREFETCH_CONCURRENCY', self.DEFAULT_CONCURRENCY
+        )
+
+    def plan(self, routes: Iterable[HotRoute], today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the searches of the routes, most valuable first.
+
+        A date's priority is its route's weight divided by the number of days until it,
+        plus one, since near dates are searched more often. Searches shared by several
+        routes appear once, with their priorities added up; ties keep the routes' order.
+
+        Args:
+            routes: The hot routes.
+            today: Date the windows start from, by default today.
+
+        Returns:
+            Search dictionaries, as taken by `FlightAPIClient.search_flights_bulk`.
+        """
+        today = today or date.today()
+        priorities: Dict[Tuple[str, str, int], float] = {}
+        for route in routes:
+            for offset in range(route.start, route.start + route.days):
+                key = (route.origin, route.destination, offset)
+                priorities[key] = priorities.get(key, 0) + route.weight / (offset + 1)
+
+        return [
+            {'origin': origin, 'destination': destination, 'departure_date': today + timedelta(days=offset)}
+            for origin, destination, offset in sorted(priorities, key=lambda key: -priorities[key])
+        ]
+
+    async def prefetch(self, routes: Iterable[HotRoute], today: Optional[date] = None) -> Dict[str, int]:
+        """
+        Fetches the planned searches that aren't fresh in the cache, within the budget.
+
+        Args:
+            routes: The hot routes.
+            today: Date the windows start from, by default today.
+
+        Returns:
+            The number of searches already 'fresh', 'fetched', 'failed' and 'deferred'
+            because the budget was spent.
+        """
+        counts = dict.fromkeys(('fresh', 'fetched', 'failed', 'deferred'), 0)
+        pending = []
+        for search in self.plan(routes, today):
+            params = self.client.build_bulk_params(search)
+            key = SearchCache.make_key(params)
+            # Not counted, so the cache's hit ratio keeps measuring user searches only.
+            _, fresh = self.client.cache.lookup(key, count=False)
+            if fresh:
+                counts['fresh'] += 1
+            elif len(pending) < self.budget:
+                pending.append((params, key))
+            else:
+                counts['deferred'] += 1
+
+        if pending:
+            session = await self.client.get_session()
+            semaphore = asyncio.Semaphore(self.concurrency)
+            deadline = asyncio.get_running_loop().time() + getattr(
+                settings, 'FLIGHT_API_RETRY_BUDGET', FlightAPIClient.RETRY_BUDGET
+            )
+
+            async def warm(params: Dict[str, Any], key: str) -> Dict[str, Any]:
+                async with semaphore:
+                    # Joins the interactive search for the same key, if one is in flight.
+                    return await self.client.fetch_shared(session, params, key, deadline)
+
+            for result in await asyncio.gather(*[warm(params, key) for params, key in pending]):
+                counts['failed' if 'error' in result else 'fetched'] += 1
+        return counts
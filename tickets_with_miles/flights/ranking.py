@@ -0,0 +1,214 @@
+import heapq
+from datetime import date
+from itertools import count, islice
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .records import Flight, RoundTrip
+
+INFINITY = float('inf')
+
+RankKey = Tuple[float, float, float]
+
+
+def rank_key(flight: Flight) -> RankKey:
+    """
+    Returns the key ordering flights from best to worst: fewest miles, then shortest
+    duration, then fewest stops. Unknown durations and stops rank last.
+    """
+    return rank_values(
+        flight.miles_cost, flight.duration_hours, flight.duration_minutes, flight.number_of_stops
+    )
+
+
+def rank_values(
+    miles_cost: int,
+    hours: Optional[int],
+    minutes: Optional[int],
+    stops: Optional[int],
+) -> RankKey:
+    """
+    Returns the `rank_key` of a flight from its fields, for callers without a Flight record.
+    """
+    if hours is None and minutes is None:
+        duration = INFINITY
+    else:
+        duration = (hours or 0) * 60 + (minutes or 0)
+    return miles_cost, duration, INFINITY if stops is None else stops
+
+
+def cheapest(flights: Iterable[Flight], limit: Optional[int] = None) -> List[Flight]:
+    """
+    Returns the best `limit` flights, or all of them, sorted by `rank_key`.
+
+    Ties keep their original order. Meant for the flights of a single date, a few
+    hundred at most, where the builtin sort is faster than `heapq.nsmallest`'s heap.
+    """
+    ranked = sorted(flights, key=rank_key)
+    return ranked if limit is None else ranked[:limit]
+
+
+def merge_cheapest(ranked_lists: Iterable[List[Flight]], limit: Optional[int] = None) -> List[Flight]:
+    """
+    Merges lists already sorted by `rank_key` into the best `limit` flights overall.
+
+    The merge stops as soon as `limit` flights are taken. Ties keep the order of the lists.
+    """
+    return list(islice(heapq.merge(*ranked_lists, key=rank_key), limit))
+
+
+def round_trip_key(trip: RoundTrip) -> RankKey:
+    """
+    Returns the key ordering round trips like flights, by the sums of their legs' miles,
+    durations and stops.
+    """
+    return add_keys(rank_key(trip.outbound), rank_key(trip.inbound))
+
+
+def add_keys(first: RankKey, second: RankKey) -> RankKey:
+    return first[0] + second[0], first[1] + second[1], first[2] + second[2]
+
+
+def connects(outbound: Flight, inbound: Flight) -> bool:
+    """
+    Returns whether the return flight leaves after the outbound flight lands.
+
+    Flights without a known arrival or departure time are never paired.
+    """
+    return (
+        outbound.arrival_time is not None
+        and inbound.departure_time is not None
+        and outbound.arrival_time <= inbound.departure_time
+    )
+
+
+def cheapest_round_trip(outbound: List[Flight], inbound: List[Flight]) -> Optional[RoundTrip]:
+    """
+    Returns the best round trip made of one flight of each list, by `round_trip_key`.
+
+    The best pair of independent legs is the best of each: the lists are sorted by
+    `rank_key`, so that takes O(1) whenever the two connect, as they do on different
+    days. Otherwise, the flights are swept by time: each return flight is paired with
+    the best outbound flight landing before it leaves, in O(n log n).
+
+    Args:
+        outbound: The outbound flights of one date, sorted by `rank_key`.
+        inbound: The return flights of one date, sorted by `rank_key`.
+
+    Returns:
+        The best connecting RoundTrip, or None if no pair connects.
+    """
+    if not outbound or not inbound:
+        return None
+    if connects(outbound[0], inbound[0]):
+        return RoundTrip(outbound[0], inbound[0])
+
+    landings = sorted(
+        (flight for flight in outbound if flight.arrival_time is not None),
+        key=lambda flight: flight.arrival_time,
+    )
+    departures = sorted(
+        (flight for flight in inbound if flight.departure_time is not None),
+        key=lambda flight: flight.departure_time,
+    )
+    best = best_key = None
+    best_outbound = best_outbound_key = None
+    landed = 0
+    for flight in departures:
+        while landed < len(landings) and landings[landed].arrival_time <= flight.departure_time:
+            key = rank_key(landings[landed])
+            if best_outbound is None or key < best_outbound_key:
+                best_outbound, best_outbound_key = landings[landed], key
+            landed += 1
+        if best_outbound is None:
+            continue
+        key = add_keys(best_outbound_key, rank_key(flight))
+        if best is None or key < best_key:
+            best, best_key = RoundTrip(best_outbound, flight), key
+    return best
+
+
+def pair_round_trips(
+    outbound_by_date: Dict[date, List[Flight]],
+    inbound_by_date: Dict[date, List[Flight]],
+    limit: Optional[int] = None,
+) -> List[RoundTrip]:
+    """
+    Combines the one-way flights of each date into the best round trips.
+
+    Each pair of an outbound date and a return date on or after it contributes its
+    best round trip, found by `cheapest_round_trip` without trying every pair of flights.
+
+    Args:
+        outbound_by_date: Outbound flights by date, each list sorted by `rank_key`.
+        inbound_by_date: Return flights by date, each list sorted by `rank_key`.
+        limit: Maximum number of round trips returned, or None for all of them.
+
+    Returns:
+        Round trips sorted by `round_trip_key`, at most one per pair of dates.
+    """
+    trips = []
+    for outbound_date, outbound in outbound_by_date.items():
+        for inbound_date, inbound in inbound_by_date.items():
+            if inbound_date < outbound_date:
+                continue
+            trip = cheapest_round_trip(outbound, inbound)
+            if trip is not None:
+                trips.append(trip)
+    trips.sort(key=round_trip_key)
+    return trips if limit is None else trips[:limit]
+
+
+class CheapestFlights:
+    """
+    Bounded selection of the best flights seen so far, for results that arrive in batches.
+
+    A max-heap of at most `limit` flights keeps the current worst one at the top, so each
+    new flight is admitted or rejected in O(log limit) without keeping the others.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        # Entries are (negated rank key, negated arrival order, flight), so the top is the
+        # worst flight and, among ties, the one that arrived last.
+        self._heap: List[Tuple[Tuple[float, ...], int, Flight]] = []
+        self._arrivals = count()
+
+    def offer(self, flight: Flight) -> bool:
+        """
+        Adds the flight if it ranks among the best `limit` seen so far.
+
+        Returns:
+            Whether the flight was admitted. An admitted flight may evict a previous one.
+        """
+        entry = (tuple(-value for value in rank_key(flight)), -next(self._arrivals), flight)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, entry)
+            return True
+        if entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def admit(self, ranked_flights: Iterable[Flight]) -> List[Flight]:
+        """
+        Offers flights sorted by `rank_key`, stopping at the first one rejected.
+
+        Returns:
+            The flights admitted, in order.
+        """
+        admitted = []
+        for flight in ranked_flights:
+            if not self.offer(flight):
+                # Every later flight ranks at least as badly as this one.
+                break
+            admitted.append(flight)
+        return admitted
+
+    def flights(self) -> List[Flight]:
+        """
+        Returns the flights currently selected, best first.
+        """
+        return [entry[2] for entry in sorted(self._heap, reverse=True)]
+
+    def __len__(self) -> int:
+        return len(self._heap)
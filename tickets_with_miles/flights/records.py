@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from datetime import date
+from operator import attrgetter, itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+# Fare types priced in Smiles miles.
+SMILES_FARE_TYPES = frozenset({'SMILES', 'SMILES_CLUB'})
+
+
+@dataclass(frozen=True, slots=True)
+class SearchContext:
+    """
+    Data shared by every flight found by the same search, such as the booking URL.
+
+    Flights keep a reference to their search's context instead of a copy of each value.
+    """
+
+    smiles_url: str
+
+
+@dataclass(frozen=True, slots=True)
+class Flight:
+    """
+    Immutable, slotted record of a parsed flight.
+
+    Fields can also be read with subscripts, as on the dictionaries flights used to be,
+    so templates and callers indexing `flight['miles_cost']` keep working.
+    """
+
+    airline: Optional[str]
+    miles_cost: int
+    duration_hours: Optional[int]
+    duration_minutes: Optional[int]
+    departure_time: Optional[str]
+    departure_airport: Optional[str]
+    number_of_stops: int
+    arrival_time: Optional[str]
+    arrival_airport: Optional[str]
+    context: SearchContext
+
+    # Order of the keys of `to_dict`, the same as the dictionaries flights used to be.
+    FIELDS = (
+        'airline',
+        'miles_cost',
+        'duration_hours',
+        'duration_minutes',
+        'departure_time',
+        'departure_airport',
+        'number_of_stops',
+        'arrival_time',
+        'arrival_airport',
+        'smiles_url',
+    )
+
+    @property
+    def smiles_url(self) -> str:
+        return self.context.smiles_url
+
+    @property
+    def duration_total_minutes(self) -> Optional[int]:
+        if self.duration_hours is None and self.duration_minutes is None:
+            return None
+        return (self.duration_hours or 0) * 60 + (self.duration_minutes or 0)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the flight as a JSON-serializable dictionary.
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+@dataclass(frozen=True, slots=True)
+class RoundTrip:
+    """
+    Outbound and return flights, each a one-way ticket, whose costs add up.
+    """
+
+    outbound: Flight
+    inbound: Flight
+
+    @property
+    def miles_cost(self) -> int:
+        return self.outbound.miles_cost + self.inbound.miles_cost
+
+    @property
+    def duration_total_minutes(self) -> Optional[int]:
+        outbound, inbound = self.outbound.duration_total_minutes, self.inbound.duration_total_minutes
+        if outbound is None or inbound is None:
+            return None
+        return outbound + inbound
+
+    @property
+    def number_of_stops(self) -> int:
+        return self.outbound.number_of_stops + self.inbound.number_of_stops
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the round trip as a JSON-serializable dictionary.
+        """
+        return {
+            'outbound': self.outbound.to_dict(),
+            'inbound': self.inbound.to_dict(),
+            'miles_cost': self.miles_cost,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class FareCalendarDay:
+    """
+    Cheapest flight of a route on one day, as shown in the fare calendar.
+
+    Days without flights, or whose search failed, have every field but the date set to None.
+    """
+
+    date: date
+    miles_cost: Optional[int] = None
+    airline: Optional[str] = None
+    number_of_stops: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the day as a JSON-serializable dictionary.
+        """
+        return {
+            'date': self.date.isoformat(),
+            'miles_cost': self.miles_cost,
+            'airline': self.airline,
+            'number_of_stops': self.number_of_stops,
+        }
+
+
+# Fields stored in each row of `dump_flights`; the URL lives in the row's context.
+ROW_FIELDS = Flight.FIELDS[:-1]
+_record_values = attrgetter(*ROW_FIELDS)
+_dict_values = itemgetter(*ROW_FIELDS)
+
+FlightLike = Union[Flight, Dict[str, Any]]
+
+
+def dump_flights(flights: Iterable[FlightLike]) -> Dict[str, List[Any]]:
+    """
+    Converts flights to a compact JSON-serializable form.
+
+    Each flight becomes a row of its values in ROW_FIELDS order followed by the index
+    of its context, and each distinct context is stored once.
+
+    Args:
+        flights: Flight records, or dictionaries with the same keys.
+
+    Returns:
+        A dictionary with the 'contexts' and the flight 'rows'.
+    """
+    contexts: Dict[str, int] = {}
+    rows = []
+    for flight in flights:
+        if isinstance(flight, Flight):
+            values, smiles_url = _record_values(flight), flight.context.smiles_url
+        else:
+            values, smiles_url = _dict_values(flight), flight['smiles_url']
+        context_index = contexts.setdefault(smiles_url, len(contexts))
+        rows.append((*values, context_index))
+    return {
+        'contexts': [{'smiles_url': smiles_url} for smiles_url in contexts],
+        'rows': rows,
+    }
+
+
+def load_flights(data: Dict[str, List[Any]]) -> List[Flight]:
+    """
+    Rebuilds the flights converted by `dump_flights`, sharing one context per search.
+
+    Args:
+        data: The dictionary returned by `dump_flights`.
+
+    Returns:
+        The Flight records, in their original order.
+    """
+    contexts = [SearchContext(**context) for context in data['contexts']]
+    return [Flight(*row[:-1], context=contexts[row[-1]]) for row in data['rows']]
+
+
+def dump_round_trips(round_trips: Iterable[RoundTrip]) -> Dict[str, List[Any]]:
+    """
+    Converts round trips to the form of `dump_flights`, with each outbound flight followed by its return.
+    """
+    return dump_flights(flight for trip in round_trips for flight in (trip.outbound, trip.inbound))
+
+
+def load_round_trips(data: Dict[str, List[Any]]) -> List[RoundTrip]:
+    """
+    Rebuilds the round trips converted by `dump_round_trips`.
+    """
+    flights = load_flights(data)
+    return [RoundTrip(outbound, inbound) for outbound, inbound in zip(flights[::2], flights[1::2])]
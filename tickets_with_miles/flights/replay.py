@@ -0,0 +1,152 @@
+import asyncio
+import json
+import math
+import os
+import random
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+RESPONSES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'smiles_responses.json')
+
+
+@dataclass(frozen=True, slots=True)
+class ReplayProfile:
+    """
+    Behaviour of the replay server: how long it takes to answer and how often it fails.
+
+    Latencies follow a log-normal distribution around `latency`, spread by `jitter`
+    (0 answers every request in exactly `latency` seconds, 0.5 is a realistic long
+    tail). A `throttle_length` burst of 429 responses, with a Retry-After header,
+    starts every `throttle_every` requests, mimicking the upstream's rate limiter.
+    """
+
+    latency: float = 0.2  # median seconds
+    jitter: float = 0.0
+    error_rate: float = 0.0  # fraction of requests answered with 503
+    throttle_every: int = 0  # requests between bursts of 429s, 0 never throttles
+    throttle_length: int = 1  # 429s per burst
+    retry_after: float = 1.0  # seconds
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        if self.latency < 0 or self.jitter < 0:
+            raise ValueError("The latency and jitter must not be negative.")
+        if not 0 <= self.error_rate <= 1:
+            raise ValueError("The error rate must be between 0 and 1.")
+        if self.throttle_every < 0 or self.throttle_length < 0:
+            raise ValueError("The throttling must not be negative.")
+
+
+def load_recorded_responses(path: str = RESPONSES_PATH) -> List[Dict[str, Any]]:
+    """
+    Returns the Smiles API responses recorded in a JSON file, by default the one in the data directory.
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+class ReplayServer:
+    """
+    Local stand-in for the Smiles search endpoint, replaying recorded responses.
+
+    Each search is answered with one of the recorded responses, always the same for
+    the same route and date, after a delay drawn from the profile, so the client, the
+    service and the views can be exercised and benchmarked without the real API.
+    """
+
+    PATH = '/v1/airlines/search'
+    REQUIRED_PARAMS = ('originAirportCode', 'destinationAirportCode', 'departureDate')
+
+    def __init__(
+        self,
+        responses: Optional[List[Dict[str, Any]]] = None,
+        profile: Optional[ReplayProfile] = None,
+    ):
+        """
+        Initialize the server.
+
+        Args:
+            responses: Responses replayed, by default the recorded ones.
+            profile: Latency and failures of the server, by default fast and reliable.
+        """
+        # Encoded once, so the server's own JSON encoding doesn't weigh on the benchmarks.
+        self.bodies = [json.dumps(response).encode() for response in (responses or load_recorded_responses())]
+        if not self.bodies:
+            raise ValueError("The replay server needs at least one response.")
+        self.profile = profile or ReplayProfile()
+        self.random = random.Random(self.profile.seed)
+        self.stats = dict.fromkeys(('requests', 'ok', 'errors', 'throttled', 'invalid'), 0)
+        self.runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(self.PATH, self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """
+        Answers a search like the Smiles API, after the profile's latency.
+        """
+        self.stats['requests'] += 1
+        number = self.stats['requests']
+        await asyncio.sleep(self.draw_latency())
+
+        profile = self.profile
+        if profile.throttle_every and (number - 1) % profile.throttle_every < profile.throttle_length:
+            self.stats['throttled'] += 1
+            return web.json_response(
+                {'error': 'Too Many Requests'},
+                status=429,
+                headers={'Retry-After': f'{profile.retry_after:g}'},
+            )
+        if profile.error_rate and self.random.random() < profile.error_rate:
+            self.stats['errors'] += 1
+            return web.json_response({'error': 'Service Unavailable'}, status=503)
+        if any(not request.query.get(name) for name in self.REQUIRED_PARAMS):
+            self.stats['invalid'] += 1
+            return web.json_response({'error': 'Bad Request'}, status=400)
+
+        self.stats['ok'] += 1
+        key = '|'.join(request.query[name] for name in self.REQUIRED_PARAMS)
+        body = self.bodies[zlib.crc32(key.encode()) % len(self.bodies)]
+        return web.Response(body=body, content_type='application/json')
+
+    def draw_latency(self) -> float:
+        """
+        Returns the seconds the next response is delayed, drawn from the profile.
+        """
+        latency, jitter = self.profile.latency, self.profile.jitter
+        if latency == 0 or jitter == 0:
+            return latency
+        return self.random.lognormvariate(math.log(latency), jitter)
+
+    async def start(self, host: str = 'localhost', port: int = 0) -> str:
+        """
+        Starts serving on the running event loop.
+
+        Args:
+            host: Interface listened on.
+            port: Port listened on, by default any free one.
+
+        Returns:
+            The URL of the search endpoint, as taken by FlightAPIClient's `base_url`.
+        """
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        self.url = f'http://{host}:{port}{self.PATH}'
+        return self.url
+
+    async def close(self) -> None:
+        """
+        Stops serving.
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
@@ -0,0 +1,89 @@
+import time
+import uuid
+from typing import Any, Dict, Iterable, Optional, Union
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .records import FlightLike, RoundTrip, dump_flights, dump_round_trips, load_flights, load_round_trips
+
+
+class SearchResultStore:
+    """
+    Stores finished search results under a random search ID for a limited time.
+
+    Results live in one of Django's caches instead of the user's session, so only the
+    ID travels in the URL and the same results page can be shared and reloaded. Flights
+    are stored in the compact form of `dump_flights`, with the booking URL of each
+    searched date stored once, and round trips as their pairs of flights. Each entry
+    also stores when it expires, so pages can be cached no longer than their results.
+    """
+
+    KEY_PREFIX = 'flights:results'
+    DEFAULT_TTL = 3600  # seconds
+
+    def __init__(self, alias: Optional[str] = None, ttl: Optional[int] = None):
+        """
+        Initialize the store.
+
+        Args:
+            alias: The alias from CACHES holding the results.
+            ttl: Seconds the results of a search are kept.
+        """
+        self.alias = alias or getattr(settings, 'FLIGHT_SEARCH_RESULTS_CACHE', 'default')
+        self.ttl = ttl or getattr(settings, 'FLIGHT_SEARCH_RESULTS_TTL', self.DEFAULT_TTL)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, search_id: Union[str, uuid.UUID]) -> str:
+        return f"{self.KEY_PREFIX}:{search_id}"
+
+    async def save(self, search: Dict[str, Any], flights: Iterable[Union[FlightLike, RoundTrip]]) -> str:
+        """
+        Stores the results of a search.
+
+        Args:
+            search: The search parameters, shown again on the results page.
+            flights: The flights found, or the round trips of a round-trip search.
+
+        Returns:
+            The ID under which the results were stored.
+        """
+        search_id = str(uuid.uuid4())
+        flights = list(flights)
+        if flights and isinstance(flights[0], RoundTrip):
+            stored = {'search': search, 'round_trips': dump_round_trips(flights)}
+        else:
+            stored = {'search': search, 'flights': dump_flights(flights)}
+        stored['expires_at'] = time.time() + self.ttl
+        await self.cache.aset(self.make_key(search_id), stored, timeout=self.ttl)
+        return search_id
+
+    async def load(self, search_id: Union[str, uuid.UUID]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the stored results of a search.
+
+        Args:
+            search_id: The ID returned by `save`.
+
+        Returns:
+            A dictionary with 'search', the Flight records under 'flights' and the
+            RoundTrip records under 'round_trips', one of them empty, and the seconds
+            left before the results expire under 'expires_in', or None if the results
+            expired.
+        """
+        stored = await self.cache.aget(self.make_key(search_id))
+        if stored is None:
+            return None
+        flights = load_flights(stored['flights']) if 'flights' in stored else []
+        round_trips = load_round_trips(stored['round_trips']) if 'round_trips' in stored else []
+        # Results stored without their expiry time are treated as about to expire.
+        expires_in = max(int(stored.get('expires_at', 0) - time.time()), 0)
+        return {
+            'search': stored['search'],
+            'flights': flights,
+            'round_trips': round_trips,
+            'expires_in': expires_in,
+        }
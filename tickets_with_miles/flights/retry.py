@@ -0,0 +1,126 @@
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+
+from django.conf import settings
+
+
+class RetryPolicy:
+    """
+    Decides whether a failed request to the Smiles API is retried and how long to wait.
+
+    Each retryable HTTP status has its own attempt limit. Connection errors and
+    timeouts use `max_attempts`. Waits grow exponentially with full jitter, and a
+    `Retry-After` header sent by the server is honored as a lower bound, unless it
+    exceeds `max_retry_after`: the request then fails rather than wait that long, since
+    retrying sooner than the server asked would most likely fail again.
+    """
+
+    DEFAULT_RETRY_STATUSES = {429: 5, 500: 3, 502: 3, 503: 3, 504: 3}
+    DEFAULT_MAX_ATTEMPTS = 3
+    DEFAULT_BACKOFF = 0.5  # seconds
+    DEFAULT_MAX_BACKOFF = 8.0  # seconds
+    DEFAULT_MAX_RETRY_AFTER = 30.0  # seconds
+
+    def __init__(
+        self,
+        retry_statuses: Optional[Mapping[int, int]] = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff: float = DEFAULT_BACKOFF,
+        max_backoff: float = DEFAULT_MAX_BACKOFF,
+        rng: Optional[random.Random] = None,
+        max_retry_after: float = DEFAULT_MAX_RETRY_AFTER,
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            retry_statuses: Maps each retryable HTTP status to its maximum number of attempts.
+            max_attempts: Maximum number of attempts after a connection error or timeout.
+            backoff: Base wait in seconds, doubled on every attempt.
+            max_backoff: Upper bound in seconds for the exponential wait.
+            rng: Random generator used for jitter.
+            max_retry_after: Longest Retry-After in seconds waited for before retrying.
+        """
+        self.retry_statuses: Dict[int, int] = dict(
+            self.DEFAULT_RETRY_STATUSES if retry_statuses is None else retry_statuses
+        )
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rng = rng or random.Random()
+        self.max_retry_after = max_retry_after
+
+    @classmethod
+    def from_settings(cls) -> 'RetryPolicy':
+        """
+        Builds the policy from the FLIGHT_API_RETRY_* settings.
+        """
+        return cls(
+            retry_statuses=getattr(settings, 'FLIGHT_API_RETRY_STATUSES', None),
+            max_attempts=getattr(settings, 'FLIGHT_API_RETRY_ATTEMPTS', cls.DEFAULT_MAX_ATTEMPTS),
+            backoff=getattr(settings, 'FLIGHT_API_RETRY_BACKOFF', cls.DEFAULT_BACKOFF),
+            max_backoff=getattr(settings, 'FLIGHT_API_RETRY_MAX_BACKOFF', cls.DEFAULT_MAX_BACKOFF),
+            max_retry_after=getattr(settings, 'FLIGHT_API_RETRY_MAX_RETRY_AFTER', cls.DEFAULT_MAX_RETRY_AFTER),
+        )
+
+    def get_delay(
+        self,
+        attempt: int,
+        status: Optional[int] = None,
+        headers: Optional[Mapping[str, Any]] = None,
+    ) -> Optional[float]:
+        """
+        Computes how long to wait before the next attempt.
+
+        Args:
+            attempt: Number of attempts made so far, starting at 1.
+            status: HTTP status of the failed attempt, or None for connection errors.
+            headers: Response headers of the failed attempt, if any.
+
+        Returns:
+            The wait in seconds, or None if the request must not be retried, including
+            when the server asks to wait longer than `max_retry_after`.
+        """
+        if status is None:
+            limit = self.max_attempts
+        else:
+            limit = self.retry_statuses.get(status, 0)
+        if attempt >= limit:
+            return None
+
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay = self.rng.uniform(0, cap)
+
+        retry_after = self.parse_retry_after((headers or {}).get('Retry-After'))
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parses a Retry-After header given either in seconds or as an HTTP date.
+
+        Args:
+            value: The raw header value.
+
+        Returns:
+            The wait in seconds, or None if the header is missing or invalid.
+        """
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
@@ -1,14 +1,30 @@
 from datetime import datetime, date, time, timedelta
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
 import asyncio
+from time import perf_counter
 
+from .airport_groups import needs_airport_index, resolve_routes
 from .api_client import FlightAPIClient
-
+from .cache import get_search_cache
+from .fare_calendar import FareCalendarStore
+from .fare_history import FareHistoryRecorder, get_fare_history, recent_cheapest
+from .metrics import FLIGHTS_PARSED, PARSE_LATENCY, RESULT_SIZE
+from .ranking import CheapestFlights, cheapest, merge_cheapest, pair_round_trips, rank_values
+from .records import SMILES_FARE_TYPES, FareCalendarDay, Flight, RoundTrip, SearchContext
+from .timing import span
+
+# Valid dates in the canonical ISO format, which `datetime.isoformat` would give back unchanged.
+_CANONICAL_DATETIME = re.compile(
+    r'(?!0000)[0-9]{4}-(0[1-9]|1[0-2])-(0[1-9]|1[0-9]|2[0-8])T([01][0-9]|2[0-3]):[0-5][0-9]:[0-5][0-9]\Z'
+)
 
 class FlightService:
     SMILES_URL_BASE = "https://www.smiles.com.br/mfe/emissao-passagem/"
-    SMILES_FARE_TYPES = {'SMILES', 'SMILES_CLUB'}
+    SMILES_FARE_TYPES = SMILES_FARE_TYPES
     DEFAULT_CABIN = 'ALL'
     DEFAULT_ADULTS = 1
     DEFAULT_CHILDREN = 0
@@ -18,11 +34,22 @@ class FlightService:
     DEFAULT_TRIP_TYPE = 2
     DEFAULT_DEPARTURE_TIME_HOUR = 15  # 3:00 PM
 
-    def __init__(self, client: Optional[FlightAPIClient] = None):
+    def __init__(
+        self,
+        client: Optional[FlightAPIClient] = None,
+        calendar_store: Optional[FareCalendarStore] = None,
+        fare_history: Optional[FareHistoryRecorder] = None,
+    ):
         """
         Initialize the FlightService with a FlightAPIClient instance.
+
+        Without an explicit fare history, the process-wide one is used, if enabled: the fare
+        calendar reads recent days from it. Without an explicit client, one backed by the
+        process-wide search cache, recording the fares it fetches in that history, is used.
         """
-        self.client = client or FlightAPIClient()
+        self.fare_history = fare_history or get_fare_history()
+        self.client = client or FlightAPIClient(cache=get_search_cache(), fare_history=self.fare_history)
+        self.calendar_store = calendar_store or FareCalendarStore()
 
     def get_flights(
         self,
@@ -30,22 +57,24 @@ class FlightService:
         destination: str,
         departure_date: date,
         flexibility: int,
-    ) -> List[Dict[str, Any]]:
+        limit: Optional[int] = None,
+    ) -> List[Flight]:
         """
         Fetches and processes flight data for the given parameters using synchronous calls.
 
         Args:
-            origin: The IATA code of the origin airport.
-            destination: The IATA code of the destination airport.
+            origin: The IATA code of the origin airport, or a set of airports (see `build_searches`).
+            destination: The IATA code of the destination airport, or a set of airports.
             departure_date: The date of departure.
             flexibility: Number of days with forward flexibility.
+            limit: Maximum number of flights returned, or None for all of them.
 
         Returns:
-            A list of dictionaries containing flight information.
+            A list of Flight records, cheapest first.
         """
         # Run the asynchronous get_flights_internal in an event loop
         return asyncio.run(
-            self.get_flights_internal(origin, destination, departure_date, flexibility)
+            self.get_flights_internal(origin, destination, departure_date, flexibility, limit)
         )
 
     async def get_flights_internal(
@@ -54,46 +83,269 @@ class FlightService:
         destination: str,
         departure_date: date,
         flexibility: int,
-    ) -> List[Dict[str, Any]]:
+        limit: Optional[int] = None,
+    ) -> List[Flight]:
         """
         Asynchronous internal method to fetch and process flight data.
 
+        Each search's flights (one route on one date) are ranked and cut to `limit`,
+        then the searches are merged with a heap that stops once `limit` flights are
+        taken, so the flights of all searches are never held or sorted together.
+
         Args:
-            origin: The IATA code of the origin airport.
-            destination: The IATA code of the destination airport.
+            origin: The IATA code of the origin airport, or a set of airports (see `build_searches`).
+            destination: The IATA code of the destination airport, or a set of airports.
             departure_date: The date of departure.
             flexibility: Number of days with forward flexibility.
+            limit: Maximum number of flights returned, or None for all of them.
 
         Returns:
-            A list of dictionaries containing flight information.
+            A list of Flight records, cheapest first, ties broken by duration and stops.
         """
-        flexibility = max(flexibility, 1)
-        searches = []
-        for delta_days in range(flexibility):
-            search_date = departure_date + timedelta(days=delta_days)
-            searches.append({
-                'origin': origin,
-                'destination': destination,
-                'departure_date': search_date,
-                'adults': self.DEFAULT_ADULTS,
-                'children': self.DEFAULT_CHILDREN,
-                'infants': self.DEFAULT_INFANTS,
-            })
-
-        raw_data_list = await self.client.search_flights_bulk(searches)
+        searches = await self.build_searches(origin, destination, departure_date, flexibility)
+        with span('fetch'):
+            raw_data_list = await self.client.search_flights_bulk(searches)
 
-        flights = []
+        ranked_lists = []
         for search_params, raw_data in zip(searches, raw_data_list):
-            smiles_url = self.generate_smiles_url(
-                search_params['origin'],
-                search_params['destination'],
-                search_params['departure_date']
+            flights = self.extract_search_flights(search_params, raw_data)
+            with span('rank'):
+                ranked_lists.append(cheapest(flights, limit))
+        with span('rank'):
+            flights = merge_cheapest(ranked_lists, limit)
+        RESULT_SIZE.observe(len(flights), 'flights')
+        return flights
+
+    async def get_round_trips(
+        self,
+        origin: str,
+        destination: str,
+        departure_date: date,
+        flexibility: int,
+        return_date: date,
+        return_flexibility: int,
+        limit: Optional[int] = None,
+    ) -> List[RoundTrip]:
+        """
+        Fetches the flights of both ways and combines them into the cheapest round trips.
+
+        Each outbound and return date is searched once, as a one-way leg, so N outbound
+        and M return dates take N + M upstream calls instead of one per pair of dates.
+        The legs are then paired by `pair_round_trips`.
+
+        Args:
+            origin: The IATA code of the origin airport, or a set of airports (see `build_searches`).
+            destination: The IATA code of the destination airport, or a set of airports.
+            departure_date: The date of departure.
+            flexibility: Number of days with forward flexibility of the departure.
+            return_date: The date of return.
+            return_flexibility: Number of days with forward flexibility of the return.
+            limit: Maximum number of round trips returned, or None for all of them.
+
+        Returns:
+            A list of RoundTrip records, cheapest first, at most one per pair of dates.
+        """
+        outbound_searches = await self.build_searches(origin, destination, departure_date, flexibility)
+        inbound_searches = await self.build_searches(destination, origin, return_date, return_flexibility)
+        with span('fetch'):
+            raw_data_list = await self.client.search_flights_bulk(outbound_searches + inbound_searches)
+
+        outbound_by_date: Dict[date, List[Flight]] = {}
+        inbound_by_date: Dict[date, List[Flight]] = {}
+        for index, (search_params, raw_data) in enumerate(zip(outbound_searches + inbound_searches, raw_data_list)):
+            legs = outbound_by_date if index < len(outbound_searches) else inbound_by_date
+            # With sets of airports, the routes of a date are ranked together.
+            legs.setdefault(search_params['departure_date'], []).extend(
+                self.extract_search_flights(search_params, raw_data)
             )
-            extracted_flights = self.extract_flights(raw_data, smiles_url)
-            flights.extend(extracted_flights)
+        with span('rank'):
+            outbound_by_date = {day: cheapest(flights) for day, flights in outbound_by_date.items()}
+            inbound_by_date = {day: cheapest(flights) for day, flights in inbound_by_date.items()}
+        with span('pair'):
+            round_trips = pair_round_trips(outbound_by_date, inbound_by_date, limit)
+        RESULT_SIZE.observe(len(round_trips), 'round_trips')
+        return round_trips
+
+    async def stream_flights(
+        self,
+        origin: str,
+        destination: str,
+        departure_date: date,
+        flexibility: int,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Tuple[date, List[Flight]]]:
+        """
+        Fetches flight data like `get_flights_internal`, yielding each date as soon as it arrives.
+
+        With a limit, only the flights entering the best `limit` seen so far are yielded,
+        so a consumer keeping the best `limit` of everything yielded ends up with the
+        same flights as `get_flights_internal`.
+
+        Args:
+            origin: The IATA code of the origin airport, or a set of airports (see `build_searches`).
+            destination: The IATA code of the destination airport, or a set of airports.
+            departure_date: The date of departure.
+            flexibility: Number of days with forward flexibility.
+            limit: Maximum number of flights kept, or None for all of them.
+
+        Yields:
+            Tuples of (search date, flights of that date cheapest first), fastest date first.
+        """
+        selection = CheapestFlights(limit) if limit else None
+        searches = await self.build_searches(origin, destination, departure_date, flexibility)
+        total = 0
+        async for search_params, raw_data in self.client.search_flights_as_completed(searches):
+            flights = self.extract_search_flights(search_params, raw_data)
+            with span('rank'):
+                flights = cheapest(flights, limit)
+                if selection is not None:
+                    flights = selection.admit(flights)
+            total += len(flights)
+            yield search_params['departure_date'], flights
+        RESULT_SIZE.observe(min(total, limit) if limit else total, 'streamed_flights')
+
+    async def fare_calendar(
+        self,
+        origin: str,
+        destination: str,
+        start: date,
+        days: int,
+    ) -> List[FareCalendarDay]:
+        """
+        Returns the cheapest fare of each day of a window.
+
+        Days already in the calendar store are reused, then, if FLIGHT_FARE_HISTORY_MAX_AGE
+        is set, days observed recently enough in the fare history, so only the remaining
+        days are requested from the API. Each response is reduced to its cheapest flight
+        while it is read, without building Flight records.
+
+        Args:
+            origin: The IATA code of the origin airport.
+            destination: The IATA code of the destination airport.
+            start: The first day of the window.
+            days: Number of days in the window.
+
+        Returns:
+            One FareCalendarDay per day of the window, in date order.
+        """
+        dates = [start + timedelta(days=delta_days) for delta_days in range(days)]
+        calendar = await self.calendar_store.load(origin, destination, dates)
 
-        sorted_flights_list = sorted(flights, key=lambda x: x['miles_cost'])
-        return sorted_flights_list
+        max_age = getattr(settings, 'FLIGHT_FARE_HISTORY_MAX_AGE', None)
+        missing = [day for day in dates if day not in calendar]
+        if missing and max_age and self.fare_history is not None:
+            with span('history'):
+                calendar.update(await sync_to_async(recent_cheapest)(origin, destination, missing, max_age))
+
+        searches = [
+            self.build_search(origin, destination, day) for day in dates if day not in calendar
+        ]
+        if searches:
+            with span('fetch'):
+                raw_data_list = await self.client.search_flights_bulk(searches)
+            with span('parse'):
+                searched = []
+                for search_params, raw_data in zip(searches, raw_data_list):
+                    if 'error' not in raw_data:
+                        searched.append(self.summarize_day(search_params['departure_date'], raw_data))
+            # Failed searches aren't stored, so the next calendar retries them.
+            await self.calendar_store.save(origin, destination, searched)
+            calendar.update((day.date, day) for day in searched)
+
+        return [calendar.get(day) or FareCalendarDay(day) for day in dates]
+
+    def summarize_day(self, search_date: date, raw_data: Dict[str, Any]) -> FareCalendarDay:
+        """
+        Reduces an API response to its cheapest flight.
+
+        Flights are compared like search results: by miles, then duration, then stops.
+        Only the fields needed for that are read, and flights costing more miles than
+        the cheapest so far are skipped after reading their fares.
+
+        Args:
+            search_date: The date searched.
+            raw_data: The raw data returned from the API client.
+
+        Returns:
+            The FareCalendarDay of the date, without fare if no flight has one.
+        """
+        best_key = None
+        best = FareCalendarDay(search_date)
+        fare_types = self.SMILES_FARE_TYPES
+        for segment in raw_data.get('requestedFlightSegmentList', []):
+            for flight in segment.get('flightList', []):
+                try:
+                    miles_cost = -1
+                    for fare in flight.get('fareList', []):
+                        if fare.get('type') in fare_types:
+                            miles = fare.get('miles', 0)
+                            if miles > 0 and (miles_cost == -1 or miles < miles_cost):
+                                miles_cost = miles
+                    if miles_cost == -1:
+                        continue
+                    if best_key is not None and miles_cost > best_key[0]:
+                        continue
+                    duration = flight.get('duration', {})
+                    stops = flight.get('stops', 0)
+                    key = rank_values(miles_cost, duration.get('hours'), duration.get('minutes'), stops)
+                    if best_key is not None and not key < best_key:
+                        continue
+                except (KeyError, IndexError, TypeError, ValueError):
+                    continue
+                best_key = key
+                best = FareCalendarDay(
+                    search_date, miles_cost, flight.get('airline', {}).get('name'), stops
+                )
+        return best
+
+    async def build_searches(
+        self,
+        origin: str,
+        destination: str,
+        departure_date: date,
+        flexibility: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Builds one search per route and day of the flexibility window.
+
+        The origin and destination may be sets of airports, such as 'SAO' or 'BR-SP',
+        searched as every route between them. Each route is searched once per day even
+        if the sets overlap, and routes from an airport to itself are skipped.
+
+        Args:
+            origin: The IATA code of the origin airport, or a set of airports as taken
+                by `resolve_airports`.
+            destination: The IATA code of the destination airport, or a set of airports.
+            departure_date: The date of departure.
+            flexibility: Number of days with forward flexibility.
+
+        Returns:
+            A list of search parameter dictionaries for the API client, date by date.
+        """
+        flexibility = max(flexibility, 1)
+        if needs_airport_index(origin) or needs_airport_index(destination):
+            # The airport index may have to be loaded from the database first.
+            routes = await sync_to_async(resolve_routes)(origin, destination)
+        else:
+            routes = resolve_routes(origin, destination)
+        return [
+            self.build_search(route_origin, route_destination, departure_date + timedelta(days=delta_days))
+            for delta_days in range(flexibility)
+            for route_origin, route_destination in routes
+        ]
+
+    def build_search(self, origin: str, destination: str, search_date: date) -> Dict[str, Any]:
+        """
+        Builds the search of a single day, with the default passengers.
+        """
+        return {
+            'origin': origin,
+            'destination': destination,
+            'departure_date': search_date,
+            'adults': self.DEFAULT_ADULTS,
+            'children': self.DEFAULT_CHILDREN,
+            'infants': self.DEFAULT_INFANTS,
+        }
 
     def generate_smiles_url(
         self,
@@ -142,11 +394,27 @@ class FlightService:
         )
         return int(combined_datetime.timestamp() * 1000)
 
+    def extract_search_flights(self, search_params: Dict[str, Any], raw_data: Dict[str, Any]) -> List[Flight]:
+        """
+        Extracts the flights of one search's response, linked to the booking page of that search.
+        """
+        smiles_url = self.generate_smiles_url(
+            search_params['origin'],
+            search_params['destination'],
+            search_params['departure_date']
+        )
+        started = perf_counter()
+        with span('parse'):
+            flights = self.extract_flights(raw_data, smiles_url)
+        PARSE_LATENCY.observe(perf_counter() - started)
+        FLIGHTS_PARSED.inc(amount=len(flights))
+        return flights
+
     def extract_flights(
         self,
         raw_data: Dict[str, Any],
         smiles_url: str
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Flight]:
         """
         Extracts flight information from raw API data.
 
@@ -155,7 +423,7 @@ class FlightService:
             smiles_url: The Smiles booking URL.
 
         Returns:
-            A list of dictionaries containing parsed flight information.
+            A list of Flight records.
         """
         segments = raw_data.get('requestedFlightSegmentList', [])
         flights = []
@@ -168,7 +436,7 @@ class FlightService:
         self,
         flight_list: List[Dict[str, Any]],
         smiles_url: str
-    ) -> List[Dict[str, Any]]:
+    ) -> List[Flight]:
         """
         Parses a list of flights and extracts relevant information.
 
@@ -177,12 +445,13 @@ class FlightService:
             smiles_url: The Smiles booking URL.
 
         Returns:
-            A list of dictionaries with cleaned and structured flight data.
+            A list of Flight records sharing one search context.
         """
+        context = SearchContext(smiles_url)
         parsed_flights = []
         for flight in flight_list:
-            parsed_flight = self.parse_single_flight(flight, smiles_url)
-            if parsed_flight and parsed_flight['miles_cost'] != -1:
+            parsed_flight = self.parse_flight_fast(flight, context)
+            if parsed_flight and parsed_flight.miles_cost != -1:
                 parsed_flights.append(parsed_flight)
         return parsed_flights
 
@@ -221,6 +490,84 @@ class FlightService:
             # Handle parsing errors gracefully
             return None
 
+    def parse_flight_fast(
+        self,
+        flight: Dict[str, Any],
+        context: SearchContext
+    ) -> Optional[Flight]:
+        """
+        Single-pass version of `parse_single_flight`, used on every API response.
+
+        Each nested object is looked up once and dates already in canonical ISO format,
+        checked with a regular expression, are kept as they are instead of being parsed
+        and formatted again. The result,
+        including which flights are rejected, is the same as `parse_single_flight`'s
+        once converted with `Flight.to_dict`; lookups run in the same order so
+        malformed flights fail the same way.
+
+        Args:
+            flight: A flight dictionary from the API.
+            context: The context shared by the flights of the search, with its Smiles booking URL.
+
+        Returns:
+            A Flight record, or None if parsing fails.
+        """
+        try:
+            get = flight.get
+            departure = get('departure', {})
+            arrival = get('arrival', {})
+            departure_time = self.format_iso_datetime(departure.get('date'))
+            arrival_time = self.format_iso_datetime(arrival.get('date'))
+            airline = get('airline', {}).get('name')
+
+            miles_cost = -1
+            fare_types = self.SMILES_FARE_TYPES
+            for fare in get('fareList', []):
+                if fare.get('type') in fare_types:
+                    miles = fare.get('miles', 0)
+                    if miles > 0 and (miles_cost == -1 or miles < miles_cost):
+                        miles_cost = miles
+
+            duration = get('duration', {})
+            return Flight(
+                airline,
+                miles_cost,
+                duration.get('hours'),
+                duration.get('minutes'),
+                departure_time,
+                departure.get('airport', {}).get('code'),
+                get('stops', 0),
+                arrival_time,
+                arrival.get('airport', {}).get('code'),
+                context,
+            )
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def format_iso_datetime(date_str: Optional[str]) -> Optional[str]:
+        """
+        Normalizes an ISO formatted date string as `parse_iso_datetime(...).isoformat()` would.
+
+        Dates already in the canonical 'YYYY-MM-DDTHH:MM:SS' format, as the API sends them,
+        are returned without parsing them; only other formats and days after the 28th,
+        which may not exist in their month, are parsed.
+
+        Args:
+            date_str: The ISO formatted date string.
+
+        Returns:
+            The date string in canonical ISO format, or None if parsing fails.
+        """
+        if not date_str:
+            return None
+        if _CANONICAL_DATETIME.match(date_str):
+            return date_str
+        try:
+            return datetime.fromisoformat(date_str).isoformat()
+        except ValueError:
+            return None
+
     @staticmethod
     def parse_iso_datetime(date_str: Optional[str]) -> Optional[datetime]:
         """
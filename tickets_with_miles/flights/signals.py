@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+
+from .airport_index import invalidate_airport_index
+from .autocomplete import invalidate_airport_autocomplete
+from .models import Airport
+
+
+def connect_signals() -> None:
+    """
+    Keeps the in-memory airport index and autocomplete in sync with the Airport table.
+    """
+    post_save.connect(invalidate_airport_index, sender=Airport, dispatch_uid='airport_index_save')
+    post_delete.connect(invalidate_airport_index, sender=Airport, dispatch_uid='airport_index_delete')
+    post_save.connect(
+        invalidate_airport_autocomplete, sender=Airport, dispatch_uid='airport_autocomplete_save'
+    )
+    post_delete.connect(
+        invalidate_airport_autocomplete, sender=Airport, dispatch_uid='airport_autocomplete_delete'
+    )
@@ -3,4 +3,156 @@ flatpickr("input[type='date']", {
     maxDate: new Date().fp_incr(329),
     dateFormat: "d/m/Y",
     locale: "pt"
-});
\ No newline at end of file
+});
+
+// Suggests airports while the origin and destination are typed. Responses that
+// arrive after a newer keystroke are ignored, so suggestions never go backwards.
+(function () {
+    var form = document.getElementById("search-form");
+    if (!form || !window.fetch) {
+        return;
+    }
+
+    [["id_origin", "origin-airports"], ["id_destination", "destination-airports"]].forEach(function (ids) {
+        var input = document.getElementById(ids[0]);
+        var datalist = document.getElementById(ids[1]);
+        if (!input || !datalist) {
+            return;
+        }
+        input.setAttribute("list", ids[1]);
+        input.setAttribute("autocomplete", "off");
+        var latest = 0;
+
+        input.addEventListener("input", function () {
+            var query = input.value.trim();
+            var request = ++latest;
+            if (!query) {
+                datalist.innerHTML = "";
+                return;
+            }
+            fetch(form.dataset.autocompleteUrl + "?q=" + encodeURIComponent(query))
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (request !== latest) {
+                        return;
+                    }
+                    datalist.innerHTML = "";
+                    data.results.forEach(function (airport) {
+                        var option = document.createElement("option");
+                        option.value = airport.iata_code;
+                        option.label = airport.name + " - " + airport.country_name;
+                        datalist.appendChild(option);
+                    });
+                })
+                .catch(function () {});
+        });
+    });
+})();
+
+// Streams the search results when the browser supports server-sent events,
+// inserting each date's flights as soon as they arrive, ordered by miles, then
+// duration, then stops, and keeping only the cheapest ones the server asked for.
+(function () {
+    var form = document.getElementById("search-form");
+    if (!form || !window.EventSource) {
+        return;
+    }
+
+    var results = document.getElementById("stream-results");
+    var list = results.querySelector(".flight-list");
+    var status = document.getElementById("stream-status");
+    var messages = document.getElementById("stream-messages");
+    var source = null;
+
+    function showMessages(texts) {
+        texts.forEach(function (text) {
+            var alert = document.createElement("div");
+            alert.className = "alert alert-danger mt-3";
+            alert.textContent = text;
+            messages.appendChild(alert);
+        });
+    }
+
+    function rankOf(card) {
+        return ["miles", "duration", "stops"].map(function (name) {
+            var value = card.dataset[name];
+            return value === undefined || value === "" ? Infinity : Number(value);
+        });
+    }
+
+    function ranksBefore(a, b) {
+        for (var i = 0; i < a.length; i++) {
+            if (a[i] !== b[i]) {
+                return a[i] < b[i];
+            }
+        }
+        return false;
+    }
+
+    function insertSorted(card, limit) {
+        var rank = rankOf(card);
+        var cards = list.children;
+        var inserted = false;
+        for (var i = 0; i < cards.length; i++) {
+            if (ranksBefore(rank, rankOf(cards[i]))) {
+                list.insertBefore(card, cards[i]);
+                inserted = true;
+                break;
+            }
+        }
+        if (!inserted) {
+            list.appendChild(card);
+        }
+        while (limit && list.children.length > limit) {
+            list.removeChild(list.lastElementChild);
+        }
+    }
+
+    form.addEventListener("submit", function (event) {
+        event.preventDefault();
+        if (source) {
+            source.close();
+        }
+
+        var params = new URLSearchParams(new FormData(form));
+        params.delete("csrfmiddlewaretoken");
+
+        var previous = document.getElementById("search-results");
+        if (previous) {
+            previous.innerHTML = "";
+        }
+        messages.innerHTML = "";
+        list.innerHTML = "";
+        status.textContent = "Buscando voos...";
+        results.classList.remove("d-none");
+
+        source = new EventSource(form.dataset.streamUrl + "?" + params.toString());
+
+        source.addEventListener("flights", function (event) {
+            var data = JSON.parse(event.data);
+            data.flights.forEach(function (flight) {
+                var wrapper = document.createElement("div");
+                wrapper.innerHTML = flight.html.trim();
+                insertSorted(wrapper.firstElementChild, data.limit);
+            });
+        });
+
+        source.addEventListener("search-error", function (event) {
+            showMessages(JSON.parse(event.data).messages);
+        });
+
+        source.addEventListener("done", function (event) {
+            var total = JSON.parse(event.data).total;
+            status.textContent = total + " voo(s) encontrado(s).";
+            if (!total) {
+                results.classList.add("d-none");
+            }
+            source.close();
+        });
+
+        source.onerror = function () {
+            status.textContent = "";
+            source.close();
+        };
+    });
+})();
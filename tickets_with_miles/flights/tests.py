@@ -1,23 +1,85 @@
 import asyncio
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from io import StringIO
 from datetime import date, timedelta
-from unittest import TestCase
-from unittest.mock import patch, MagicMock
-from django.test import TestCase as DjangoTestCase
+from dataclasses import FrozenInstanceError
+from unittest import TestCase, skipUnless
+from unittest.mock import patch, MagicMock, AsyncMock
+from django.test import TestCase as DjangoTestCase, override_settings
 from django.core.exceptions import ValidationError
-
-from flights.models import Airport
-from flights.forms import FlightSearchForm
+from django.urls import reverse
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.db.models import Min
+from django.utils import timezone
+
+from flights.models import Airport, FareObservation, PriceAlert, Watch
+from flights.forms import FareCalendarForm, FlightSearchForm
 from flights.services import FlightService
-from flights.api_client import FlightAPIClient
-from aiohttp import ClientError
+from flights.api_client import FlightAPIClient, SearchResult
+from flights.throttling import SharedRateLimiter, TokenBucket
+from flights.retry import RetryPolicy
+from flights.cache import TTLCache, SearchCache, DjangoCacheBackend, reset_search_cache
+from flights.airport_index import AirportIndex, get_airport_index, invalidate_airport_index
+from flights import decoding
+from flights.decoding import get_response_decoder
+from flights.ranking import (
+    CheapestFlights, cheapest, cheapest_round_trip, merge_cheapest, pair_round_trips, rank_key, round_trip_key,
+)
+from flights.fare_calendar import FareCalendarStore
+from flights import fare_analytics
+from flights.fare_analytics import FareColumns, grouped_reduction, summarize
+from flights.fare_history import (
+    FareHistoryRecorder, cheapest_by_day, flight_fares, get_fare_history, price_history, recent_cheapest,
+    reset_fare_history,
+)
+from flights.airport_groups import resolve_airports, resolve_routes
+from flights.prefetch import CachePrefetcher, HotRoute, parse_hot_routes
+from flights.watchlist import WatchChecker
+from flights import metrics
+from flights.metrics import MetricsRegistry, flexibility_bucket
+from flights.replay import ReplayProfile, ReplayServer
+from flights.load_test import LoadReport, LoadTest, percentile
+from flights.timing import SearchTimings, collect_timings, count, current_timings, span
+from flights.records import (
+    FareCalendarDay, Flight, RoundTrip, SearchContext, dump_flights, load_flights, dump_round_trips,
+    load_round_trips,
+)
+from flights.autocomplete import (
+    AirportAutocomplete, normalize, get_airport_autocomplete, invalidate_airport_autocomplete,
+)
+from aiohttp import ClientError, ClientConnectionError, ClientResponseError, web
+
+# The process-wide fare history writes from its own thread, outside the tests' transactions,
+# so it is off unless a test enables it.
+_fare_history_off = override_settings(FLIGHT_FARE_HISTORY_ENABLED=False)
+
+
+def setUpModule():
+    _fare_history_off.enable()
+
+
+def tearDownModule():
+    _fare_history_off.disable()
 
 
 class MockAiohttpResponse:
-    def __init__(self, json_data=None, raise_exc=None):
+    def __init__(self, json_data=None, raise_exc=None, delay=0):
         self.json_data = json_data or {}
         self.raise_exc = raise_exc
+        self.delay = delay
 
     async def __aenter__(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
         if self.raise_exc:
             raise self.raise_exc
         return self
@@ -28,7 +90,7 @@ class MockAiohttpResponse:
     def raise_for_status(self):
         return
 
-    async def json(self):
+    async def json(self, **kwargs):
         return self.json_data
 
 
@@ -447,3 +509,2703 @@ class EdgeCaseTests(DjangoTestCase):
     
         self.assertTrue(result.get('ok'), "Códigos numéricos não devem causar erro no client")
 
+
+
+class FlightAPIClientSessionTest(TestCase):
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    def test_session_is_shared_within_event_loop(self):
+        async def get_sessions():
+            first = await FlightAPIClient(api_key='dummy', telemetry='dummy').get_session()
+            second = await FlightAPIClient(api_key='dummy', telemetry='dummy').get_session()
+            await FlightAPIClient.close_session()
+            return first, second
+
+        first, second = asyncio.run(get_sessions())
+
+        self.assertIs(first, second)
+        self.assertTrue(first.closed)
+
+    def test_session_uses_configured_connector(self):
+        async def get_connector():
+            session = await FlightAPIClient(api_key='dummy', telemetry='dummy').get_session()
+            connector = session.connector
+            await FlightAPIClient.close_session()
+            return connector
+
+        with override_settings(FLIGHT_API_CONNECTOR_LIMIT=7):
+            connector = asyncio.run(get_connector())
+
+        self.assertEqual(connector.limit, 7)
+        self.assertFalse(connector.force_close)
+
+    def test_stale_sessions_are_discarded(self):
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy')
+        session = asyncio.run(client.get_session())
+        FlightAPIClient.discard_stale_sessions()
+
+        self.assertTrue(session.closed)
+        self.assertNotIn(session, FlightAPIClient._sessions.values())
+
+    @patch('aiohttp.ClientSession.get')
+    def test_service_closes_session_after_sync_search(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({})
+        FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy')).get_flights(
+            'CNF', 'GRU', date.today(), 1
+        )
+
+        self.assertEqual(FlightAPIClient._sessions, {})
+
+
+class TokenBucketTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bucket = TokenBucket(rate=2, capacity=2, clock=lambda: self.now)
+
+    def test_burst_is_free(self):
+        self.assertEqual(self.bucket.reserve(), 0)
+        self.assertEqual(self.bucket.reserve(), 0)
+
+    def test_requests_beyond_burst_are_paced(self):
+        self.bucket.reserve()
+        self.bucket.reserve()
+
+        self.assertAlmostEqual(self.bucket.reserve(), 0.5)
+        self.assertAlmostEqual(self.bucket.reserve(), 1.0)
+
+    def test_tokens_refill_over_time(self):
+        self.bucket.reserve()
+        self.bucket.reserve()
+        self.now = 1.0
+
+        self.assertEqual(self.bucket.reserve(), 0)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0, capacity=1)
+
+    def test_spare_tokens_leave_some_for_others(self):
+        self.assertEqual(self.bucket.reserve_spare(keep=1), 0)
+        self.assertAlmostEqual(self.bucket.reserve_spare(keep=1), 0.5)
+        self.assertEqual(self.bucket.reserve(), 0)
+
+    def test_spare_tokens_wait_for_borrowed_ones(self):
+        for _ in range(3):
+            self.bucket.reserve()
+
+        self.assertAlmostEqual(self.bucket.reserve_spare(), 1.0)
+        self.now = 1.0
+        self.assertEqual(self.bucket.reserve_spare(), 0)
+
+
+class SharedRateLimiterTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.now = 1000.0
+        # Two processes, sharing the counters through the cache.
+        self.web = SharedRateLimiter('default', rate=4, clock=lambda: self.now)
+        self.prefetcher = SharedRateLimiter('default', rate=4, clock=lambda: self.now)
+
+    def test_processes_share_one_budget(self):
+        for limiter in (self.web, self.prefetcher, self.web, self.prefetcher):
+            self.assertEqual(limiter.reserve(), 0)
+
+        self.assertEqual(self.web.reserve(), 1.0)
+        self.now += 0.75
+        self.assertEqual(self.prefetcher.reserve(), 0.25)
+        self.now += 0.25
+        self.assertEqual(self.web.reserve(), 0)
+
+    def test_spare_requests_leave_some_for_others(self):
+        self.assertEqual(self.prefetcher.reserve(keep=2), 0)
+        self.assertEqual(self.prefetcher.reserve(keep=2), 0)
+        self.assertEqual(self.prefetcher.reserve(keep=2), 1.0)
+        # Refused requests aren't counted.
+        self.assertEqual(self.web.reserve(), 0)
+        self.assertEqual(self.web.reserve(), 0)
+        self.assertEqual(self.web.reserve(), 1.0)
+
+    def test_slow_rates_use_longer_windows(self):
+        limiter = SharedRateLimiter('default', rate=0.5, clock=lambda: self.now)
+
+        self.assertEqual(limiter.window, 2)
+        self.assertEqual(limiter.reserve(), 0)
+        self.assertEqual(limiter.reserve(), 2.0)
+
+    @override_settings(FLIGHT_API_RATE_LIMIT_CACHE='default', FLIGHT_API_RATE_LIMIT=4)
+    def test_clients_wait_for_the_shared_limiter(self):
+        FlightAPIClient.reset_rate_limiter()
+        self.addCleanup(FlightAPIClient.reset_rate_limiter)
+        interactive = FlightAPIClient(api_key='dummy', telemetry='dummy')
+        background = FlightAPIClient(api_key='dummy', telemetry='dummy', rate_limit_keep=3)
+
+        self.assertEqual(FlightAPIClient.get_shared_rate_limiter().rate, 4)
+        with patch.object(SharedRateLimiter, 'acquire', new_callable=AsyncMock) as acquire:
+            asyncio.run(interactive.wait_for_rate_limit())
+            acquire.assert_awaited_with(keep=0)
+            asyncio.run(background.wait_for_rate_limit())
+            acquire.assert_awaited_with(keep=3)
+
+    @override_settings(FLIGHT_API_RATE_LIMIT_CACHE='default')
+    def test_clients_with_a_limiter_of_their_own_only_wait_for_it(self):
+        self.addCleanup(FlightAPIClient.reset_rate_limiter)
+        limiter = TokenBucket(rate=1000, capacity=1)
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy', rate_limiter=limiter)
+
+        with patch.object(SharedRateLimiter, 'acquire', new_callable=AsyncMock) as shared, \
+                patch.object(FlightAPIClient, 'get_rate_limiter') as process_wide:
+            asyncio.run(client.wait_for_rate_limit())
+
+        shared.assert_not_awaited()
+        process_wide.assert_not_called()
+        self.assertGreater(limiter.reserve(), 0)
+
+
+class FlightAPIClientThrottlingTest(TestCase):
+    def tearDown(self):
+        FlightAPIClient.reset_rate_limiter()
+        FlightAPIClient.close_all_sessions()
+
+    def test_bulk_search_respects_concurrency_cap(self):
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy', max_concurrency=2)
+        in_flight = 0
+        peak = 0
+
+        async def fake_fetch(session, params, deadline=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return {'date': params['departureDate']}
+
+        searches = [
+            {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today() + timedelta(days=i)}
+            for i in range(6)
+        ]
+        with patch.object(client, 'fetch', side_effect=fake_fetch):
+            results = asyncio.run(client.search_flights_bulk(searches))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0]['date'], searches[0]['departure_date'].strftime('%Y-%m-%d'))
+
+    def test_rate_limiter_is_shared(self):
+        first = FlightAPIClient(api_key='dummy', telemetry='dummy').get_rate_limiter()
+        second = FlightAPIClient(api_key='dummy', telemetry='dummy').get_rate_limiter()
+
+        self.assertIs(first, second)
+
+    @override_settings(FLIGHT_API_RATE_LIMIT=5, FLIGHT_API_RATE_LIMIT_BURST=3)
+    def test_rate_limiter_reads_settings(self):
+        FlightAPIClient.reset_rate_limiter()
+        limiter = FlightAPIClient.get_rate_limiter()
+
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.capacity, 3)
+
+
+class RetryPolicyTest(TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(
+            retry_statuses={429: 4, 503: 2}, max_attempts=2, backoff=1, max_backoff=3
+        )
+
+    def test_non_retryable_status(self):
+        self.assertIsNone(self.policy.get_delay(1, 404))
+
+    def test_attempt_limit_per_status(self):
+        self.assertIsNotNone(self.policy.get_delay(1, 503))
+        self.assertIsNone(self.policy.get_delay(2, 503))
+        self.assertIsNotNone(self.policy.get_delay(3, 429))
+
+    def test_backoff_is_capped(self):
+        for attempt in range(1, 4):
+            self.assertLessEqual(self.policy.get_delay(attempt, 429), min(3, 2 ** (attempt - 1)))
+
+    def test_retry_after_seconds_is_honored(self):
+        delay = self.policy.get_delay(1, 429, {'Retry-After': '7'})
+
+        self.assertEqual(delay, 7)
+
+    def test_retry_after_beyond_the_maximum_is_not_waited_for(self):
+        policy = RetryPolicy(retry_statuses={429: 4}, max_retry_after=10)
+
+        self.assertEqual(policy.get_delay(1, 429, {'Retry-After': '10'}), 10)
+        self.assertIsNone(policy.get_delay(1, 429, {'Retry-After': '86400'}))
+
+    def test_parse_retry_after_http_date(self):
+        delay = RetryPolicy.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT')
+
+        self.assertEqual(delay, 0)
+
+    def test_parse_retry_after_invalid(self):
+        self.assertIsNone(RetryPolicy.parse_retry_after('soon'))
+
+
+class FlightAPIClientRetryTest(TestCase):
+    def setUp(self):
+        self.client = FlightAPIClient(
+            api_key='dummy',
+            telemetry='dummy',
+            retry_policy=RetryPolicy(max_attempts=3, backoff=0),
+        )
+
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    @staticmethod
+    def status_error(status, headers=None):
+        return ClientResponseError(
+            request_info=MagicMock(), history=(), status=status, headers=headers
+        )
+
+    @patch('aiohttp.ClientSession.get')
+    def test_transient_status_is_retried(self, mock_get):
+        mock_get.side_effect = [
+            MockAiohttpResponse(raise_exc=self.status_error(503)),
+            MockAiohttpResponse(raise_exc=self.status_error(429)),
+            MockAiohttpResponse({'ok': True}),
+        ]
+        result = asyncio.run(self.client.search_flights('CNF', 'GRU', date.today()))
+
+        self.assertEqual(result, {'ok': True})
+        self.assertEqual(result.attempts, 3)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_connection_error_gives_up_after_max_attempts(self, mock_get):
+        mock_get.side_effect = lambda *args, **kwargs: MockAiohttpResponse(
+            raise_exc=ClientConnectionError('reset')
+        )
+        result = asyncio.run(self.client.search_flights('CNF', 'GRU', date.today()))
+
+        self.assertIn('error', result)
+        self.assertEqual(result.attempts, 3)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_client_error_status_is_not_retried(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse(raise_exc=self.status_error(400))
+        result = asyncio.run(self.client.search_flights('CNF', 'GRU', date.today()))
+
+        self.assertIn('error', result)
+        self.assertEqual(result.attempts, 1)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_bulk_search_stops_retrying_when_budget_is_spent(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse(
+            raise_exc=self.status_error(429, {'Retry-After': '60'})
+        )
+        searches = [{'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today()}]
+        results = asyncio.run(self.client.search_flights_bulk(searches, time_budget=1))
+
+        self.assertIn('error', results[0])
+        self.assertEqual(results[0].attempts, 1)
+
+    @override_settings(FLIGHT_API_RETRY_BUDGET=1)
+    @patch('aiohttp.ClientSession.get')
+    def test_search_stops_retrying_when_budget_is_spent(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse(
+            raise_exc=self.status_error(429, {'Retry-After': '20'})
+        )
+        with patch('flights.api_client.asyncio.sleep', new_callable=AsyncMock) as sleep:
+            result = asyncio.run(self.client.search_flights('CNF', 'GRU', date.today()))
+
+        self.assertIn('error', result)
+        self.assertEqual(result.attempts, 1)
+        sleep.assert_not_awaited()
+
+
+class TTLCacheTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = TTLCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.now = 9.9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(len(self.cache), 2)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'flights': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'flights-test'},
+})
+class SearchCacheTest(DjangoTestCase):
+    params = {
+        'originAirportCode': 'GRU',
+        'destinationAirportCode': 'GIG',
+        'departureDate': '2025-03-10',
+        'adults': 1,
+        'children': 0,
+        'infants': 0,
+    }
+
+    def setUp(self):
+        self.backend = DjangoCacheBackend('flights')
+        self.backend.clear()
+        self.cache = SearchCache(ttl=60, maxsize=10, backend=self.backend)
+
+    def test_key_depends_on_passengers(self):
+        key = self.cache.make_key(self.params)
+        other = self.cache.make_key(dict(self.params, adults=2))
+
+        self.assertNotEqual(key, other)
+        self.assertIn('GRU', key)
+
+    def test_hits_and_misses_are_counted(self):
+        key = self.cache.make_key(self.params)
+        self.assertIsNone(self.cache.get(key))
+        self.cache.set(key, {'requestedFlightSegmentList': []})
+        self.cache.get(key)
+        stats = self.cache.stats()
+
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_backend_hit_is_promoted_to_memory(self):
+        key = self.cache.make_key(self.params)
+        self.backend.set(key, (time.time() + 60, {'ok': True}), 60)
+
+        self.assertEqual(self.cache.get(key), {'ok': True})
+        self.assertEqual(self.cache.local.get(key), {'ok': True})
+        self.assertEqual(self.cache.stats()['backend_hits'], 1)
+
+    def test_errors_are_not_cached(self):
+        key = self.cache.make_key(self.params)
+        self.cache.set(key, {'error': 'boom'})
+
+        self.assertIsNone(self.cache.get(key))
+        self.assertIsNone(self.backend.get(key))
+
+    def test_stale_entries_are_flagged(self):
+        now = 0.0
+        cache = SearchCache(ttl=10, maxsize=10, stale_ttl=5, clock=lambda: now)
+        cache.set('key', {'ok': True})
+        now = 12
+
+        self.assertEqual(cache.lookup('key'), ({'ok': True}, False))
+        self.assertIsNone(cache.get('key'))
+        now = 15
+        self.assertEqual(cache.lookup('key'), (None, False))
+
+
+class FlightAPIClientCacheTest(TestCase):
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    @patch('aiohttp.ClientSession.get')
+    def test_cached_response_skips_request(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({'ok': True})
+        client = FlightAPIClient(
+            api_key='dummy', telemetry='dummy', cache=SearchCache(ttl=60, maxsize=10)
+        )
+
+        async def search_twice():
+            first = await client.search_flights('GRU', 'GIG', date.today())
+            second = await client.search_flights('GRU', 'GIG', date.today())
+            return first, second
+
+        first, second = asyncio.run(search_twice())
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(client.cache.stats()['hits'], 1)
+
+
+class FlightAPIClientCoalescingTest(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = SearchCache(ttl=10, maxsize=10, stale_ttl=60, clock=lambda: self.now)
+        self.client = FlightAPIClient(api_key='dummy', telemetry='dummy', cache=self.cache)
+
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    @patch('aiohttp.ClientSession.get')
+    def test_concurrent_identical_searches_share_one_call(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({'ok': True}, delay=0.01)
+
+        async def search_concurrently():
+            return await asyncio.gather(*[
+                self.client.search_flights('GRU', 'GIG', date.today()) for _ in range(5)
+            ])
+
+        results = asyncio.run(search_concurrently())
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    @patch('aiohttp.ClientSession.get')
+    def test_stale_response_is_served_while_refreshing(self, mock_get):
+        mock_get.side_effect = [MockAiohttpResponse({'v': 1}), MockAiohttpResponse({'v': 2})]
+
+        async def search_after_expiry():
+            await self.client.search_flights('GRU', 'GIG', date.today())
+            self.now = 11
+            stale = await self.client.search_flights('GRU', 'GIG', date.today())
+            await asyncio.gather(*FlightAPIClient._refreshes[asyncio.get_running_loop()])
+            fresh = await self.client.search_flights('GRU', 'GIG', date.today())
+            await FlightAPIClient.close_session()
+            return stale, fresh
+
+        stale, fresh = asyncio.run(search_after_expiry())
+
+        self.assertEqual(stale, {'v': 1})
+        self.assertEqual(fresh, {'v': 2})
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+
+class SearchFlightsViewTest(DjangoTestCase):
+    flight = {
+        'airline': 'GOL',
+        'miles_cost': 10000,
+        'duration_hours': 1,
+        'duration_minutes': 5,
+        'departure_time': '2025-03-10T10:00:00',
+        'departure_airport': 'CNF',
+        'number_of_stops': 0,
+        'arrival_time': '2025-03-10T11:05:00',
+        'arrival_airport': 'GRU',
+        'smiles_url': 'http://example.com',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def search_data(self, **overrides):
+        data = {
+            'origin': 'CNF',
+            'destination': 'GRU',
+            'date': (date.today() + timedelta(days=10)).isoformat(),
+            'flexibility': 3,
+        }
+        data.update(overrides)
+        return data
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_search_redirects_and_shows_results(self, mock_search):
+        mock_search.return_value = [self.flight]
+        response = self.client.post(reverse('search_flights'), self.search_data())
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith('/results/'))
+        mock_search.assert_awaited_once_with('CNF', 'GRU', date.today() + timedelta(days=10), 3, limit=50)
+
+        response = self.client.get(response.url)
+        self.assertContains(response, 'GOL')
+        self.assertContains(response, 'Milhas: 10000')
+        self.assertContains(response, 'value="CNF"')
+        self.assertRegex(response['Cache-Control'], r'max-age=(3600|35\d\d)\b')
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_results_are_cached_only_while_stored(self, mock_search):
+        mock_search.return_value = [self.flight]
+        now = time.time()
+        with patch('flights.results.time.time', return_value=now):
+            url = self.client.post(reverse('search_flights'), self.search_data()).url
+        with patch('flights.results.time.time', return_value=now + 3000):
+            response = self.client.get(url)
+
+        self.assertIn('max-age=600', response['Cache-Control'])
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_cached_results_page_has_no_csrf_token(self, mock_search):
+        mock_search.return_value = [self.flight]
+        url = self.client.post(reverse('search_flights'), self.search_data()).url
+
+        response = self.client.get(url)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'method="get"')
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+        # Without JavaScript, the form opens the search page filled in, whose form posts.
+        response = self.client.get(reverse('search_flights'), {'origin': 'CNF', 'destination': 'GRU'})
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertContains(response, 'value="GRU"')
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_results_are_not_stored_in_session(self, mock_search):
+        mock_search.return_value = [self.flight]
+        self.client.post(reverse('search_flights'), self.search_data())
+
+        self.assertNotIn('flights', self.client.session.keys())
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_results_can_be_reloaded(self, mock_search):
+        mock_search.return_value = [self.flight]
+        url = self.client.post(reverse('search_flights'), self.search_data()).url
+
+        self.assertContains(self.client.get(url), 'GOL')
+        self.assertContains(self.client.get(url), 'GOL')
+
+    def test_expired_results_redirect_to_search(self):
+        response = self.client.get(
+            reverse('search_results', args=['00000000-0000-0000-0000-000000000000'])
+        )
+
+        self.assertRedirects(response, reverse('search_flights'))
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock, return_value=[])
+    def test_search_without_results(self, mock_search):
+        response = self.client.post(reverse('search_flights'), self.search_data())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Nenhum voo encontrado.')
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_invalid_origin_does_not_search(self, mock_search):
+        response = self.client.post(reverse('search_flights'), self.search_data(origin='XXX'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'O código da origem não é válido.')
+        mock_search.assert_not_awaited()
+
+
+class FlightStreamingTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def setUp(self):
+        # A bucket drained by earlier tests would delay the requests and reorder them.
+        FlightAPIClient.reset_rate_limiter()
+
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    @patch('aiohttp.ClientSession.get')
+    def test_client_yields_in_completion_order(self, mock_get):
+        delays = {0: 0.03, 1: 0.0, 2: 0.015}
+        mock_get.side_effect = lambda *args, **kwargs: MockAiohttpResponse(
+            {'date': kwargs['params']['departureDate']},
+            delay=delays[(date.fromisoformat(kwargs['params']['departureDate']) - date.today()).days],
+        )
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy')
+        searches = [
+            {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today() + timedelta(days=i)}
+            for i in range(3)
+        ]
+
+        async def collect():
+            return [search['departure_date'] async for search, _ in client.search_flights_as_completed(searches)]
+
+        order = asyncio.run(collect())
+
+        self.assertEqual(order, [date.today() + timedelta(days=i) for i in (1, 2, 0)])
+
+    def test_service_yields_sorted_flights_per_date(self):
+        service = FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+        day = date(2025, 3, 10)
+
+        async def fake_as_completed(searches, time_budget=None):
+            yield searches[0], {'requestedFlightSegmentList': [{'flightList': [
+                {'fareList': [{'type': 'SMILES', 'miles': 15000}]},
+                {'fareList': [{'type': 'SMILES', 'miles': 9000}]},
+            ]}]}
+
+        async def collect():
+            return [item async for item in service.stream_flights('CNF', 'GRU', day, 0)]
+
+        with patch.object(service.client, 'search_flights_as_completed', fake_as_completed):
+            batches = asyncio.run(collect())
+
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0][0], day)
+        self.assertEqual([f['miles_cost'] for f in batches[0][1]], [9000, 15000])
+
+    async def test_stream_view_sends_events(self):
+        flight = dict(SearchFlightsViewTest.flight)
+
+        async def fake_stream(self, origin, destination, departure_date, flexibility, limit=None):
+            yield departure_date, [flight]
+
+        with patch.object(FlightService, 'stream_flights', fake_stream):
+            response = await self.async_client.get(reverse('stream_flights'), {
+                'origin': 'CNF',
+                'destination': 'GRU',
+                'date': (date.today() + timedelta(days=3)).isoformat(),
+                'flexibility': 0,
+            })
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn('event: flights', body)
+        self.assertIn('Milhas: 10000', body)
+        self.assertIn('event: done\ndata: {"total": 1}', body)
+
+    async def test_stream_view_reports_validation_errors(self):
+        response = await self.async_client.get(reverse('stream_flights'), {
+            'origin': 'XXX',
+            'destination': 'GRU',
+            'date': (date.today() + timedelta(days=3)).isoformat(),
+            'flexibility': 0,
+        })
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertIn('event: search-error', body)
+        self.assertIn('event: done', body)
+
+
+class LoadAirportsCommandTest(DjangoTestCase):
+    def write_csv(self, rows):
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        with file:
+            file.write('name,iata_code,state_code,country_code,country_name\n')
+            for row in rows:
+                file.write(','.join(row) + '\n')
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    def load(self, csv_path):
+        out = StringIO()
+        call_command('load_airports', csv=csv_path, stdout=out)
+        return out.getvalue()
+
+    def test_inserts_airports(self):
+        output = self.load(self.write_csv([
+            ('Confins', 'CNF', 'MG', 'BR', 'Brasil'),
+            ('Guarulhos', 'GRU', 'SP', 'BR', 'Brasil'),
+        ]))
+
+        self.assertEqual(Airport.objects.count(), 2)
+        self.assertIn('Inserted: 2, updated: 0, unchanged: 0', output)
+
+    def test_rerun_is_idempotent(self):
+        csv_path = self.write_csv([('Confins', 'CNF', 'MG', 'BR', 'Brasil')])
+        self.load(csv_path)
+        output = self.load(csv_path)
+
+        self.assertEqual(Airport.objects.count(), 1)
+        self.assertIn('Inserted: 0, updated: 0, unchanged: 1', output)
+
+    def test_changed_rows_are_updated(self):
+        Airport.objects.create(
+            name='Old name', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        output = self.load(self.write_csv([
+            ('Confins', 'CNF', 'MG', 'BR', 'Brasil'),
+            ('Guarulhos', 'GRU', 'SP', 'BR', 'Brasil'),
+        ]))
+
+        self.assertEqual(Airport.objects.get(iata_code='CNF').name, 'Confins')
+        self.assertIn('Inserted: 1, updated: 1, unchanged: 0', output)
+
+    def test_loads_bundled_dataset(self):
+        call_command('load_airports', stdout=StringIO())
+
+        self.assertTrue(Airport.objects.filter(iata_code='GRU').exists())
+
+
+class AirportIndexTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def setUp(self):
+        invalidate_airport_index()
+
+    def test_lookup_is_case_insensitive(self):
+        index = AirportIndex(['CNF'])
+
+        self.assertIn('cnf', index)
+        self.assertNotIn('GRU', index)
+
+    def test_from_csv_reads_bundled_dataset(self):
+        index = AirportIndex.from_csv()
+
+        self.assertIn('GRU', index)
+        self.assertGreater(len(index), 3000)
+
+    def test_index_is_built_once(self):
+        with self.assertNumQueries(1):
+            get_airport_index()
+            get_airport_index()
+
+    def test_form_validation_runs_no_queries(self):
+        get_airport_index()
+        form = FlightSearchForm(data={
+            'origin': 'CNF',
+            'destination': 'GRU',
+            'date': (date.today() + timedelta(days=10)).isoformat(),
+            'flexibility': 0,
+        })
+
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+
+    def test_saving_an_airport_invalidates_index(self):
+        self.assertNotIn('SDU', get_airport_index())
+        Airport.objects.create(
+            name='Santos Dumont', iata_code='SDU', state_code='RJ', country_code='BR', country_name='Brasil'
+        )
+
+        self.assertIn('SDU', get_airport_index())
+
+    def test_deleting_an_airport_invalidates_index(self):
+        self.assertIn('CNF', get_airport_index())
+        Airport.objects.get(iata_code='CNF').delete()
+
+        self.assertNotIn('CNF', get_airport_index())
+
+    @override_settings(FLIGHT_AIRPORT_INDEX_SOURCE='csv')
+    def test_csv_source(self):
+        self.addCleanup(invalidate_airport_index)
+        with self.assertNumQueries(0):
+            self.assertIn('LIS', get_airport_index())
+
+
+class AirportAutocompleteTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.autocomplete = AirportAutocomplete.from_csv()
+
+    def codes(self, query, limit=10):
+        return [airport['iata_code'] for airport in self.autocomplete.search(query, limit)]
+
+    def test_normalize_strips_accents_and_punctuation(self):
+        self.assertEqual(normalize('  São Paulo-Guarulhos! '), 'sao paulo guarulhos')
+
+    def test_exact_code_ranks_first(self):
+        self.assertEqual(self.codes('gru')[0], 'GRU')
+        self.assertEqual(self.codes('LIS')[0], 'LIS')
+
+    def test_name_prefix_across_words(self):
+        self.assertEqual(self.codes('São Paulo'), ['SAO', 'CGH', 'GRU'])
+        self.assertEqual(self.codes('sao pau gua'), ['GRU'])
+
+    def test_prefix_rankings_match_ranking_on_the_fly(self):
+        for query in ('s', 'sa', 'int', 'unit', 'states'):
+            ranks = self.autocomplete._rank_prefix_matches(query)
+            expected = sorted(ranks, key=ranks.__getitem__)[:10]
+            self.assertEqual(
+                self.codes(query), [self.autocomplete.records[i][0] for i in expected], query
+            )
+
+    def test_typos_fall_back_to_trigrams(self):
+        self.assertIn('JFK', self.codes('new yrok'))
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.codes('a', limit=3)), 3)
+        self.assertEqual(self.codes('   '), [])
+        self.assertEqual(self.codes('zzzzzz'), [])
+
+    def test_results_include_names(self):
+        self.assertEqual(self.autocomplete.search('lisboa', limit=1), [
+            {'iata_code': 'LIS', 'name': 'Lisbon Lisboa', 'country_name': 'Portugal'},
+        ])
+
+
+class AirportAutocompleteViewTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def setUp(self):
+        invalidate_airport_autocomplete()
+        self.addCleanup(invalidate_airport_autocomplete)
+
+    def test_returns_matching_airports(self):
+        response = self.client.get(reverse('airport_autocomplete'), {'q': 'guaru'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': [
+            {'iata_code': 'GRU', 'name': 'Guarulhos', 'country_name': 'Brasil'},
+        ]})
+
+    def test_missing_query_returns_no_results(self):
+        response = self.client.get(reverse('airport_autocomplete'))
+
+        self.assertEqual(response.json(), {'results': []})
+
+    def test_index_is_built_once(self):
+        with self.assertNumQueries(1):
+            get_airport_autocomplete()
+            get_airport_autocomplete()
+
+    def test_saving_an_airport_invalidates_autocomplete(self):
+        self.assertEqual(get_airport_autocomplete().search('santos'), [])
+        Airport.objects.create(
+            name='Santos Dumont', iata_code='SDU', state_code='RJ', country_code='BR', country_name='Brasil'
+        )
+
+        self.assertEqual(get_airport_autocomplete().search('santos')[0]['iata_code'], 'SDU')
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', 'autocomplete', iterations=2, stdout=out)
+
+        self.assertIn("'gru'", out.getvalue())
+        self.assertIn('p99', out.getvalue())
+
+
+class FlightParserTest(TestCase):
+    RESPONSES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'smiles_responses.json')
+    URL = 'http://example.com'
+
+    def setUp(self):
+        self.service = FlightService(client=MagicMock())
+
+    def parse_both(self, flight):
+        results = []
+        for parser, url in (
+            (self.service.parse_single_flight, self.URL),
+            (self.service.parse_flight_fast, SearchContext(self.URL)),
+        ):
+            try:
+                result = parser(flight, url)
+                results.append(result.to_dict() if isinstance(result, Flight) else result)
+            except Exception as error:
+                results.append(type(error))
+        return results
+
+    def test_fast_parser_matches_reference_on_recorded_responses(self):
+        with open(self.RESPONSES_PATH, 'r', encoding='utf-8') as file:
+            responses = json.load(file)
+        flights = [
+            flight
+            for response in responses
+            for segment in response['requestedFlightSegmentList']
+            for flight in segment['flightList']
+        ]
+
+        self.assertGreater(len(flights), 100)
+        for flight in flights:
+            reference, fast = self.parse_both(flight)
+            self.assertEqual(list(fast.items()), list(reference.items()))
+
+    def test_fast_parser_matches_reference_on_malformed_flights(self):
+        flights = [
+            {},
+            {'fareList': [{'type': 'SMILES', 'miles': 12000}, {'type': 'SMILES_CLUB', 'miles': 9000.0}]},
+            {'fareList': [{'type': 'SMILES_MONEY', 'miles': 100}, {'type': 'SMILES', 'miles': 0}]},
+            {'fareList': [{'type': 'OTHER', 'miles': 'n/a'}, {'type': 'SMILES', 'miles': 5000}]},
+            {'fareList': [{'type': 'SMILES', 'miles': 'n/a'}]},
+            {'fareList': [{'type': 'SMILES'}]},
+            {'departure': {'date': '2024-12-20T10:00:00.000Z'}, 'arrival': {'date': '2024-12-20'}},
+            {'departure': {'date': '2024-W51-5T10:00:00'}, 'arrival': {'date': '2024-12-20 12:00:00'}},
+            {'departure': {'date': '2024-02-30T10:00:00'}, 'arrival': {'date': 'tomorrow'}},
+            {'departure': {'date': '2023-02-29T10:00:00'}, 'arrival': {'date': '2024-02-29T23:59:59'}},
+            {'departure': {'date': '0000-01-01T00:00:00'}, 'arrival': {'date': '2024-13-01T00:00:00'}},
+            {'departure': {'date': '2024-12-20T24:00:00'}, 'arrival': {'date': '2024-12-20T10:00:00\n'}},
+            {'departure': {'date': '２０２４-12-20T10:00:00'}, 'arrival': {'date': '2024-12-20T10:00:60'}},
+            {'departure': {'date': 20241220}},
+            {'departure': {'date': '2024-12-20T10:00:00', 'airport': {'code': 'CNF'}}, 'stops': None},
+            {'airline': {}, 'duration': {'hours': 2}},
+            {'airline': None},
+            {'duration': None},
+            {'departure': None},
+            {'fareList': None},
+        ]
+
+        for flight in flights:
+            reference, fast = self.parse_both(flight)
+            if isinstance(reference, dict):
+                self.assertEqual(list(fast.items()), list(reference.items()), flight)
+            else:
+                self.assertEqual(fast, reference, flight)
+
+    def test_canonical_dates_are_not_parsed(self):
+        with patch('flights.services.datetime') as mock_datetime:
+            self.assertEqual(self.service.format_iso_datetime('2024-12-20T10:00:00'), '2024-12-20T10:00:00')
+            self.assertFalse(mock_datetime.fromisoformat.called)
+
+        self.assertEqual(self.service.format_iso_datetime('2024-12-20 10:00'), '2024-12-20T10:00:00')
+
+    def test_parse_flights_skips_flights_without_miles(self):
+        flights = self.service.parse_flights([
+            {'fareList': [{'type': 'SMILES', 'miles': 12000}]},
+            {'fareList': [{'type': 'SMILES_MONEY', 'miles': 100}]},
+            {'departure': {'date': 20241220}, 'fareList': [{'type': 'SMILES', 'miles': 12000}]},
+        ], self.URL)
+
+        self.assertEqual([flight['miles_cost'] for flight in flights], [12000])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', 'parser', iterations=2, stdout=out)
+
+        self.assertIn('parse_flight_fast', out.getvalue())
+        self.assertIn('Speedup', out.getvalue())
+
+
+class FlightRecordTest(TestCase):
+    def setUp(self):
+        self.service = FlightService(client=MagicMock())
+        self.flights = self.service.parse_flights([
+            {'fareList': [{'type': 'SMILES', 'miles': 15000}], 'airline': {'name': 'GOL'}},
+            {'fareList': [{'type': 'SMILES_CLUB', 'miles': 9000}], 'airline': {'name': 'AZUL'}},
+        ], 'http://example.com/long-url')
+
+    def test_records_are_immutable_and_slotted(self):
+        flight = self.flights[0]
+
+        with self.assertRaises(FrozenInstanceError):
+            flight.miles_cost = 1
+        self.assertFalse(hasattr(flight, '__dict__'))
+
+    def test_flights_of_a_search_share_one_context(self):
+        self.assertIs(self.flights[0].context, self.flights[1].context)
+        self.assertEqual(self.flights[0].smiles_url, 'http://example.com/long-url')
+
+    def test_fields_can_be_read_like_a_dict(self):
+        flight = self.flights[0]
+
+        self.assertEqual(flight['miles_cost'], 15000)
+        self.assertEqual(flight['smiles_url'], 'http://example.com/long-url')
+        self.assertEqual(list(flight.to_dict()), list(Flight.FIELDS))
+        with self.assertRaises(KeyError):
+            flight['context']
+
+    def test_dump_and_load_round_trip(self):
+        other = self.service.parse_flights(
+            [{'fareList': [{'type': 'SMILES', 'miles': 7000}]}], 'http://example.com/other'
+        )
+        data = json.loads(json.dumps(dump_flights(self.flights + other)))
+
+        self.assertEqual(len(data['contexts']), 2)
+        flights = load_flights(data)
+        self.assertEqual(flights, self.flights + other)
+        self.assertIs(flights[0].context, flights[1].context)
+
+    def test_dump_accepts_dictionaries(self):
+        flight = dict(self.flights[0].to_dict())
+
+        self.assertEqual(load_flights(dump_flights([flight])), [self.flights[0]])
+
+    def test_records_can_be_pickled(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.flights)), self.flights)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', 'records', iterations=1, stdout=out)
+
+        self.assertIn('Flight records', out.getvalue())
+
+
+class ResponseDecodingTest(TestCase):
+    RESPONSES_PATH = FlightParserTest.RESPONSES_PATH
+
+    def setUp(self):
+        with open(self.RESPONSES_PATH, 'r', encoding='utf-8') as file:
+            self.bodies = [json.dumps(response) for response in json.load(file)]
+        self.service = FlightService(client=MagicMock())
+
+    def assert_same_flights(self, decoder):
+        for body in self.bodies:
+            self.assertEqual(
+                self.service.extract_flights(decoder(body), 'http://example.com'),
+                self.service.extract_flights(json.loads(body), 'http://example.com'),
+            )
+
+    def test_auto_picks_first_installed_decoder(self):
+        expected = next(d for d in decoding.DECODERS.values() if d is not None)
+
+        self.assertIs(get_response_decoder('auto'), expected)
+        with override_settings(FLIGHT_API_JSON_DECODER='json'):
+            self.assertIs(get_response_decoder(), decoding.decode_json)
+
+    def test_unknown_decoder(self):
+        with self.assertRaises(ValueError):
+            get_response_decoder('yaml')
+
+    def test_client_decodes_with_its_decoder(self):
+        decoder = MagicMock(return_value={'requestedFlightSegmentList': []})
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy', decoder=decoder)
+        response = MockAiohttpResponse()
+        response.json = AsyncMock(side_effect=lambda loads: loads('{}'))
+
+        with patch('aiohttp.ClientSession.get', return_value=response):
+            result = asyncio.run(client.search_flights('CNF', 'GRU', date.today()))
+        FlightAPIClient.close_all_sessions()
+
+        self.assertEqual(result, {'requestedFlightSegmentList': []})
+        decoder.assert_called_once_with('{}')
+
+    @skipUnless(decoding.msgspec, 'msgspec is not installed')
+    def test_msgspec_keeps_only_the_fields_read(self):
+        decoded = decoding.decode_msgspec(self.bodies[0])
+        flight = decoded['requestedFlightSegmentList'][0]['flightList'][0]
+
+        self.assertNotIn('legList', flight)
+        self.assertNotIn('money', flight['fareList'][0])
+        self.assert_same_flights(decoding.decode_msgspec)
+
+    @skipUnless(decoding.msgspec, 'msgspec is not installed')
+    def test_msgspec_falls_back_on_unexpected_shapes(self):
+        body = '{"requestedFlightSegmentList": [{"flightList": [{"airline": null, "uid": 1}]}]}'
+
+        self.assertEqual(decoding.decode_msgspec(body), json.loads(body))
+        with self.assertRaises(ValueError):
+            decoding.decode_msgspec('<html>')
+
+    @skipUnless(decoding.orjson, 'orjson is not installed')
+    def test_orjson_matches_json(self):
+        self.assert_same_flights(decoding.decode_orjson)
+        self.assertEqual(decoding.decode_orjson('{"miles": NaN}').keys(), {'miles'})
+
+
+class FlightRankingTest(TestCase):
+    context = SearchContext('http://example.com')
+
+    def make_flight(self, miles, hours=1, minutes=0, stops=0, airline='GOL'):
+        return Flight(airline, miles, hours, minutes, None, 'CNF', stops, None, 'GRU', self.context)
+
+    def random_dates(self, seed, dates=5, per_date=40):
+        rng = random.Random(seed)
+        return [
+            [
+                self.make_flight(
+                    rng.choice([10000, 12000, 15000, 20000]),
+                    rng.randrange(1, 4),
+                    rng.choice([0, 30]),
+                    rng.randrange(0, 3),
+                    airline=f'{day}-{i}',
+                )
+                for i in range(per_date)
+            ]
+            for day in range(dates)
+        ]
+
+    def test_ties_are_broken_by_duration_then_stops(self):
+        slow = self.make_flight(10000, hours=5)
+        one_stop = self.make_flight(10000, hours=2, stops=1)
+        direct = self.make_flight(10000, hours=2, stops=0)
+        unknown = self.make_flight(10000, hours=None, minutes=None)
+
+        self.assertEqual(
+            cheapest([unknown, slow, one_stop, direct, self.make_flight(9000, hours=9)])[1:],
+            [direct, one_stop, slow, unknown],
+        )
+        self.assertLess(rank_key(direct), rank_key(one_stop))
+
+    def test_equal_flights_keep_their_order(self):
+        first, second = self.make_flight(10000, airline='A'), self.make_flight(10000, airline='B')
+
+        self.assertEqual(cheapest([first, second], limit=1), [first])
+        self.assertEqual(merge_cheapest([[first], [second]], limit=2), [first, second])
+
+    def test_merge_matches_full_sort(self):
+        for seed in range(5):
+            dates = self.random_dates(seed)
+            everything = sorted((f for flights in dates for f in flights), key=rank_key)
+            for limit in (None, 1, 7, 50, 1000):
+                merged = merge_cheapest([cheapest(flights, limit) for flights in dates], limit)
+                self.assertEqual(merged, everything[:limit])
+
+    def test_selection_matches_full_sort_across_batches(self):
+        for seed in range(5):
+            dates = self.random_dates(seed)
+            everything = sorted((f for flights in dates for f in flights), key=rank_key)
+            selection = CheapestFlights(10)
+            for flights in dates:
+                admitted = selection.admit(cheapest(flights, 10))
+                self.assertLessEqual(len(admitted), 10)
+
+            self.assertEqual(selection.flights(), everything[:10])
+
+    def test_admit_stops_at_first_rejected_flight(self):
+        selection = CheapestFlights(2)
+        selection.admit([self.make_flight(1000), self.make_flight(2000)])
+
+        admitted = selection.admit([self.make_flight(1500), self.make_flight(2000), self.make_flight(500)])
+
+        self.assertEqual([f.miles_cost for f in admitted], [1500])
+        self.assertEqual(len(selection), 2)
+
+    @patch.object(FlightAPIClient, 'search_flights_bulk')
+    def test_service_returns_cheapest_flights(self, mock_search):
+        def response(*fares):
+            return {'requestedFlightSegmentList': [{'flightList': [
+                {'fareList': [{'type': 'SMILES', 'miles': miles}], 'duration': {'hours': hours}}
+                for miles, hours in fares
+            ]}]}
+        mock_search.return_value = [
+            response((15000, 2), (9000, 3)),
+            response((9000, 1), (20000, 1)),
+        ]
+        service = FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+
+        flights = service.get_flights('CNF', 'GRU', date.today(), 2, limit=3)
+
+        self.assertEqual(
+            [(f.miles_cost, f.duration_hours) for f in flights], [(9000, 1), (9000, 3), (15000, 2)]
+        )
+
+    def test_streamed_flights_match_service_limit(self):
+        service = FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+        responses = [
+            {'requestedFlightSegmentList': [{'flightList': [
+                {'fareList': [{'type': 'SMILES', 'miles': miles}]} for miles in batch
+            ]}]}
+            for batch in ([15000, 9000, 30000], [8000, 40000], [12000, 9000, 7000])
+        ]
+
+        async def fake_as_completed(searches, time_budget=None):
+            for search, response in zip(searches, responses):
+                yield search, response
+
+        async def collect():
+            return [item async for item in service.stream_flights('CNF', 'GRU', date.today(), 3, limit=3)]
+
+        with patch.object(service.client, 'search_flights_as_completed', fake_as_completed):
+            batches = asyncio.run(collect())
+
+        self.assertEqual([[f.miles_cost for f in flights] for _, flights in batches], [
+            [9000, 15000, 30000], [8000], [7000],
+        ])
+        streamed = cheapest((f for _, flights in batches for f in flights), limit=3)
+        self.assertEqual([f.miles_cost for f in streamed], [7000, 8000, 9000])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark', 'ranking', iterations=1, stdout=out)
+
+        self.assertIn('top 50', out.getvalue())
+
+
+class SearchLimitViewTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def search_data(self, **overrides):
+        return dict(SearchFlightsViewTest.search_data(self, **overrides))
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock, return_value=[])
+    def test_requested_limit_is_passed_to_service(self, mock_search):
+        self.client.post(reverse('search_flights'), self.search_data(limit=5))
+
+        self.assertEqual(mock_search.await_args.kwargs['limit'], 5)
+
+    @override_settings(FLIGHT_SEARCH_RESULTS_LIMIT=None)
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock, return_value=[])
+    def test_no_limit_configured(self, mock_search):
+        self.client.post(reverse('search_flights'), self.search_data())
+
+        self.assertIsNone(mock_search.await_args.kwargs['limit'])
+
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_limit_out_of_range_is_rejected(self, mock_search):
+        response = self.client.post(reverse('search_flights'), self.search_data(limit=0))
+
+        self.assertEqual(response.status_code, 200)
+        mock_search.assert_not_awaited()
+
+    async def test_stream_sends_limit(self):
+        async def fake_stream(self, origin, destination, departure_date, flexibility, limit=None):
+            yield departure_date, [dict(SearchFlightsViewTest.flight)] * 3
+
+        with patch.object(FlightService, 'stream_flights', fake_stream):
+            response = await self.async_client.get(reverse('stream_flights'), self.search_data(limit=2))
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertIn('"limit": 2', body)
+        self.assertIn('event: done\ndata: {"total": 2}', body)
+
+
+class FareCalendarTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def setUp(self):
+        caches['default'].clear()
+        self.client_api = FlightAPIClient(api_key='dummy', telemetry='dummy')
+        self.service = FlightService(self.client_api)
+        self.start = date.today() + timedelta(days=10)
+
+    def response(self, *flights):
+        return {'requestedFlightSegmentList': [{'flightList': [
+            {
+                'fareList': [{'type': 'SMILES', 'miles': miles}, {'type': 'SMILES_MONEY', 'miles': 100}],
+                'airline': {'name': airline},
+                'duration': {'hours': hours, 'minutes': 0},
+                'stops': stops,
+            }
+            for miles, airline, hours, stops in flights
+        ]}]}
+
+    def fake_bulk(self, searches, time_budget=None):
+        return [
+            self.response((10000 + search['departure_date'].day, 'GOL', 2, 0))
+            for search in searches
+        ]
+
+    def test_summarize_day_picks_cheapest_then_shortest(self):
+        day = self.service.summarize_day(self.start, self.response(
+            (15000, 'GOL', 1, 0), (9000, 'AZUL', 5, 2), (9000, 'LATAM', 3, 1), (0, 'TAP', 1, 0),
+        ))
+
+        self.assertEqual(day, FareCalendarDay(self.start, 9000, 'LATAM', 1))
+
+    def test_summarize_day_matches_search_results(self):
+        with open(FlightParserTest.RESPONSES_PATH, 'r', encoding='utf-8') as file:
+            responses = json.load(file)
+        for response in responses:
+            best = cheapest(self.service.extract_flights(response, 'http://example.com'), limit=1)[0]
+            day = self.service.summarize_day(self.start, response)
+
+            self.assertEqual(
+                (day.miles_cost, day.airline, day.number_of_stops),
+                (best.miles_cost, best.airline, best.number_of_stops),
+            )
+
+    def test_day_without_fares(self):
+        day = self.service.summarize_day(self.start, self.response((0, 'GOL', 1, 0)))
+
+        self.assertEqual(day, FareCalendarDay(self.start))
+
+    def test_overlapping_windows_reuse_cached_days(self):
+        with patch.object(self.client_api, 'search_flights_bulk', AsyncMock(side_effect=self.fake_bulk)) as bulk:
+            first = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.start, 5))
+            second = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.start + timedelta(days=3), 5))
+
+        self.assertEqual([day.date for day in first], [self.start + timedelta(days=i) for i in range(5)])
+        self.assertEqual(first[3:], second[:2])
+        searched = [search['departure_date'] for search in bulk.await_args_list[1].args[0]]
+        self.assertEqual(searched, [self.start + timedelta(days=i) for i in (5, 6, 7)])
+        self.assertEqual(second[-1].miles_cost, 10000 + (self.start + timedelta(days=7)).day)
+
+    def test_failed_days_are_not_cached(self):
+        bulk = AsyncMock(side_effect=[[{'error': 'timeout'}], [self.response((9000, 'GOL', 1, 0))]])
+        with patch.object(self.client_api, 'search_flights_bulk', bulk):
+            failed = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.start, 1))
+            retried = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.start, 1))
+
+        self.assertEqual(failed, [FareCalendarDay(self.start)])
+        self.assertEqual(retried[0].miles_cost, 9000)
+
+    def test_store_round_trip(self):
+        store = FareCalendarStore()
+        day = FareCalendarDay(self.start, 9000, 'GOL', 0)
+        asyncio.run(store.save('CNF', 'GRU', [day]))
+
+        loaded = asyncio.run(store.load('CNF', 'GRU', [self.start, self.start + timedelta(days=1)]))
+
+        self.assertEqual(loaded, {self.start: day})
+
+    @patch.object(FlightService, 'fare_calendar', new_callable=AsyncMock)
+    def test_view_returns_days(self, mock_calendar):
+        mock_calendar.return_value = [FareCalendarDay(self.start, 9000, 'GOL', 0), FareCalendarDay(self.start)]
+        response = self.client.get(reverse('fare_calendar'), {
+            'origin': 'cnf', 'destination': 'GRU', 'date': self.start.isoformat(), 'days': 2,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        mock_calendar.assert_awaited_once_with('CNF', 'GRU', self.start, 2)
+        self.assertEqual(response.json()['days'], [
+            {'date': self.start.isoformat(), 'miles_cost': 9000, 'airline': 'GOL', 'number_of_stops': 0},
+            {'date': self.start.isoformat(), 'miles_cost': None, 'airline': None, 'number_of_stops': None},
+        ])
+
+    def test_view_rejects_invalid_requests(self):
+        response = self.client.get(reverse('fare_calendar'), {
+            'origin': 'XXX', 'destination': 'GRU', 'date': self.start.isoformat(),
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Origin: O código da origem não é válido.', response.json()['errors'])
+
+    def test_form_defaults_and_caps_days(self):
+        last_day = date.today() + timedelta(days=FareCalendarForm.ALLOWED_FORWARD_SEARCH_DAYS)
+        form = FareCalendarForm({'origin': 'CNF', 'destination': 'GRU', 'date': self.start.isoformat()})
+        late = FareCalendarForm({'origin': 'CNF', 'destination': 'GRU', 'date': last_day.isoformat(), 'days': 10})
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['days'], FareCalendarForm.DEFAULT_DAYS)
+        self.assertTrue(late.is_valid())
+        self.assertEqual(late.cleaned_data['days'], 1)
+
+    def test_form_accepts_only_plain_airport_codes(self):
+        invalidate_airport_index()
+        self.addCleanup(invalidate_airport_index)
+        form = FareCalendarForm({'origin': 'cnf', 'destination': 'GRU', 'date': self.start.isoformat()})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['origin'], 'CNF')
+
+        # Each of them resolves to the single airport GRU.
+        for destination in ('BR-SP', 'GRU,GRU', 'gru, gru'):
+            form = FareCalendarForm({'origin': 'CNF', 'destination': destination, 'date': self.start.isoformat()})
+
+            self.assertFalse(form.is_valid(), destination)
+            self.assertIn('destination', form.errors)
+
+
+class CachePrefetcherTest(TestCase):
+    def setUp(self):
+        self.today = date(2025, 1, 10)
+        self.cache = SearchCache(ttl=60, maxsize=100)
+        self.client = FlightAPIClient(api_key='dummy', telemetry='dummy', cache=self.cache, rate_limit_keep=1)
+
+    def tearDown(self):
+        FlightAPIClient.reset_rate_limiter()
+        FlightAPIClient.close_all_sessions()
+
+    def search_key(self, origin, destination, days):
+        return SearchCache.make_key(self.client.build_bulk_params({
+            'origin': origin, 'destination': destination, 'departure_date': self.today + timedelta(days=days),
+        }))
+
+    def test_parse_hot_routes(self):
+        routes = parse_hot_routes([
+            {'origin': 'cnf', 'destination': 'gru'},
+            {'origin': 'GRU', 'destination': 'LIS', 'days': '3', 'start': '', 'weight': '2.5'},
+        ])
+
+        self.assertEqual(routes, [HotRoute('CNF', 'GRU'), HotRoute('GRU', 'LIS', days=3, weight=2.5)])
+        with self.assertRaises(ValueError):
+            parse_hot_routes([{'origin': 'CNF', 'destination': ''}])
+        with self.assertRaises(ValueError):
+            parse_hot_routes([{'origin': 'CNF', 'destination': 'GRU', 'days': '0'}])
+
+    def test_plan_favors_weight_and_near_dates(self):
+        prefetcher = CachePrefetcher(self.client)
+        plan = prefetcher.plan([
+            HotRoute('CNF', 'GRU', days=3),
+            HotRoute('GRU', 'LIS', days=2, start=1, weight=4),
+            HotRoute('CNF', 'GRU', days=1, start=2),
+        ], self.today)
+
+        self.assertEqual(
+            [(search['destination'], (search['departure_date'] - self.today).days) for search in plan],
+            [('LIS', 1), ('LIS', 2), ('GRU', 0), ('GRU', 2), ('GRU', 1)],
+        )
+
+    @patch('aiohttp.ClientSession.get')
+    def test_prefetch_fetches_missing_searches_within_budget(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({'requestedFlightSegmentList': []})
+        self.cache.set(self.search_key('CNF', 'GRU', 0), {'cached': True})
+        prefetcher = CachePrefetcher(self.client, budget=2)
+
+        counts = asyncio.run(prefetcher.prefetch([HotRoute('CNF', 'GRU', days=4)], self.today))
+
+        self.assertEqual(counts, {'fresh': 1, 'fetched': 2, 'failed': 0, 'deferred': 1})
+        self.assertIsNotNone(self.cache.get(self.search_key('CNF', 'GRU', 1)))
+        self.assertIsNone(self.cache.get(self.search_key('CNF', 'GRU', 3)))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_prefetch_takes_only_spare_tokens(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({'requestedFlightSegmentList': []})
+        prefetcher = CachePrefetcher(self.client)
+
+        with patch.object(TokenBucket, 'acquire_spare', new_callable=AsyncMock) as acquire_spare, \
+                patch.object(TokenBucket, 'acquire', new_callable=AsyncMock) as acquire:
+            asyncio.run(prefetcher.prefetch([HotRoute('CNF', 'GRU', days=2)], self.today))
+
+        self.assertEqual(acquire_spare.await_count, 2)
+        acquire_spare.assert_awaited_with(keep=1)
+        acquire.assert_not_awaited()
+
+    @override_settings(FLIGHT_API_RATE_LIMIT=10, FLIGHT_API_RATE_LIMIT_BURST=10, FLIGHT_PREFETCH_RATE_SHARE=0.25)
+    def test_prefetch_uses_only_its_share_of_the_rate_in_the_long_run(self):
+        client = CachePrefetcher(FlightAPIClient(
+            api_key='dummy', telemetry='dummy', cache=self.cache, rate_limit_keep=1, rate_limit_share=0.25,
+        )).client
+        self.assertEqual(CachePrefetcher().client.share_limiter.rate, 2.5)
+        self.assertEqual(client.share_limiter.capacity, 2.5)
+
+        now = 0.0
+
+        async def sleep(delay):
+            nonlocal now
+            now += delay
+
+        # Nothing else takes tokens, so the shared limiter alone would allow 10 requests per second.
+        shared = TokenBucket(rate=10, capacity=10, clock=lambda: now)
+        limiter = client.share_limiter
+        client.share_limiter = TokenBucket(rate=limiter.rate, capacity=limiter.capacity, clock=lambda: now)
+
+        async def send(requests):
+            for _ in range(requests):
+                await client.wait_for_rate_limit()
+
+        with patch.object(FlightAPIClient, 'get_rate_limiter', return_value=shared), \
+                patch('flights.throttling.asyncio.sleep', side_effect=sleep):
+            asyncio.run(send(1000))
+
+        # After the burst, 2.5 requests per second.
+        self.assertAlmostEqual(now, (1000 - 2.5) / 2.5)
+
+    def test_invalid_rate_limit_share(self):
+        with self.assertRaises(ValueError):
+            FlightAPIClient(api_key='dummy', telemetry='dummy', rate_limit_share=1.5)
+
+    @patch('aiohttp.ClientSession.get')
+    def test_failed_searches_are_counted(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse(raise_exc=ClientError('boom'))
+        prefetcher = CachePrefetcher(self.client)
+
+        counts = asyncio.run(prefetcher.prefetch([HotRoute('CNF', 'GRU', days=1)], self.today))
+
+        self.assertEqual(counts['failed'], 1)
+
+    def test_requires_a_cache(self):
+        with self.assertRaises(ValueError):
+            CachePrefetcher(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+
+
+class PrefetchRoutesCommandTest(TestCase):
+    def tearDown(self):
+        reset_search_cache()
+
+    def write_csv(self, text):
+        file = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        with file:
+            file.write(text)
+        self.addCleanup(os.remove, file.name)
+        return file.name
+
+    @patch.object(CachePrefetcher, 'prefetch', new_callable=AsyncMock)
+    def test_warms_routes_from_csv(self, mock_prefetch):
+        mock_prefetch.return_value = {'fresh': 1, 'fetched': 4, 'failed': 0, 'deferred': 2}
+        out, err = StringIO(), StringIO()
+
+        call_command(
+            'prefetch_routes', routes=self.write_csv('origin,destination,days\nCNF,GRU,7\n'),
+            budget=4, stdout=out, stderr=err,
+        )
+
+        mock_prefetch.assert_awaited_once_with([HotRoute('CNF', 'GRU', days=7)])
+        self.assertIn('Fetched: 4, already fresh: 1, failed: 0, deferred: 2.', out.getvalue())
+        self.assertIn('FLIGHT_SEARCH_CACHE_BACKEND', err.getvalue())
+        self.assertIn('FLIGHT_API_RATE_LIMIT_CACHE', err.getvalue())
+
+    @override_settings(FLIGHT_SEARCH_CACHE_TTL=0)
+    def test_disabled_cache_is_an_error(self):
+        reset_search_cache()
+        with self.assertRaises(CommandError):
+            call_command('prefetch_routes', stdout=StringIO())
+
+    def test_invalid_routes_are_an_error(self):
+        with self.assertRaises(CommandError):
+            call_command('prefetch_routes', routes=self.write_csv('origin,destination\nCNF,\n'), stdout=StringIO())
+
+
+class RoundTripTest(DjangoTestCase):
+    context = SearchContext('http://example.com')
+
+    @classmethod
+    def setUpTestData(cls):
+        Airport.objects.create(
+            name='Confins', iata_code='CNF', state_code='MG', country_code='BR', country_name='Brasil'
+        )
+        Airport.objects.create(
+            name='Guarulhos', iata_code='GRU', state_code='SP', country_code='BR', country_name='Brasil'
+        )
+
+    def setUp(self):
+        self.departure = date.today() + timedelta(days=10)
+
+    def flight(self, miles, departure, arrival, hours=1, stops=0, origin='CNF', destination='GRU'):
+        return Flight(
+            'GOL', miles, hours, 0, departure, origin, stops, arrival, destination, self.context
+        )
+
+    def test_best_legs_on_different_days_are_paired(self):
+        outbound = cheapest([
+            self.flight(9000, '2025-03-10T10:00:00', '2025-03-10T11:00:00'),
+            self.flight(7000, '2025-03-10T20:00:00', '2025-03-10T21:00:00'),
+        ])
+        inbound = cheapest([self.flight(5000, '2025-03-12T08:00:00', '2025-03-12T09:00:00')])
+
+        trip = cheapest_round_trip(outbound, inbound)
+
+        self.assertEqual(trip, RoundTrip(outbound[0], inbound[0]))
+        self.assertEqual(trip.miles_cost, 12000)
+
+    def test_same_day_pairs_must_connect(self):
+        outbound = cheapest([
+            self.flight(7000, '2025-03-10T20:00:00', '2025-03-10T21:00:00'),
+            self.flight(9000, '2025-03-10T08:00:00', '2025-03-10T09:00:00'),
+        ])
+        inbound = cheapest([
+            self.flight(4000, '2025-03-10T07:00:00', '2025-03-10T08:00:00'),
+            self.flight(6000, '2025-03-10T18:00:00', '2025-03-10T19:00:00'),
+            self.flight(8000, '2025-03-10T22:00:00', '2025-03-10T23:00:00'),
+        ])
+
+        trip = cheapest_round_trip(outbound, inbound)
+
+        self.assertEqual((trip.outbound.miles_cost, trip.inbound.miles_cost), (9000, 6000))
+        self.assertIsNone(cheapest_round_trip(outbound, inbound[:1]))
+
+    def test_pairing_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(50):
+            outbound, inbound = [], []
+            for flights in (outbound, inbound):
+                for _ in range(rng.randint(1, 12)):
+                    departure = rng.randint(0, 40)
+                    arrival = departure + rng.randint(1, 8)
+                    flights.append(self.flight(
+                        rng.choice([5000, 6000, 7000]),
+                        f'2025-03-10T{departure // 2:02d}:{departure % 2 * 30:02d}:00',
+                        f'2025-03-10T{arrival // 2:02d}:{arrival % 2 * 30:02d}:00' if arrival < 48 else None,
+                        hours=rng.randint(1, 3),
+                        stops=rng.randint(0, 2),
+                    ))
+            pairs = [
+                RoundTrip(first, second) for first in outbound for second in inbound
+                if first.arrival_time and first.arrival_time <= second.departure_time
+            ]
+
+            trip = cheapest_round_trip(cheapest(outbound), cheapest(inbound))
+
+            if pairs:
+                self.assertEqual(round_trip_key(trip), min(map(round_trip_key, pairs)))
+            else:
+                self.assertIsNone(trip)
+
+    def test_returns_before_departure_are_skipped(self):
+        day = timedelta(days=1)
+        start = date(2025, 3, 10)
+        outbound = {
+            start: [self.flight(5000, '2025-03-10T10:00:00', '2025-03-10T11:00:00')],
+            start + day: [self.flight(3000, '2025-03-11T10:00:00', '2025-03-11T11:00:00')],
+        }
+        inbound = {
+            start: [self.flight(1000, '2025-03-10T20:00:00', '2025-03-10T21:00:00')],
+            start + day * 2: [self.flight(4000, '2025-03-12T10:00:00', '2025-03-12T11:00:00')],
+        }
+
+        trips = pair_round_trips(outbound, inbound)
+
+        self.assertEqual([trip.miles_cost for trip in trips], [6000, 7000, 9000])
+        self.assertEqual([trip.miles_cost for trip in pair_round_trips(outbound, inbound, limit=1)], [6000])
+
+    def test_service_searches_each_leg_once(self):
+        def response(miles, hour):
+            return {'requestedFlightSegmentList': [{'flightList': [{
+                'fareList': [{'type': 'SMILES', 'miles': miles}],
+                'airline': {'name': 'GOL'},
+                'departure': {'date': f'2025-03-10T{hour:02d}:00:00', 'airport': {'code': 'X'}},
+                'arrival': {'date': f'2025-03-10T{hour + 1:02d}:00:00', 'airport': {'code': 'Y'}},
+                'duration': {'hours': 1, 'minutes': 0},
+                'stops': 0,
+            }]}]}
+
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy')
+        bulk = AsyncMock(return_value=[response(5000, 8), response(4000, 8), response(3000, 18), response(2000, 9)])
+        return_date = self.departure + timedelta(days=3)
+        with patch.object(client, 'search_flights_bulk', bulk):
+            trips = asyncio.run(FlightService(client).get_round_trips('CNF', 'GRU', self.departure, 2, return_date, 2))
+
+        searches = bulk.await_args.args[0]
+        self.assertEqual(bulk.await_count, 1)
+        self.assertEqual(
+            [(search['origin'], search['departure_date']) for search in searches],
+            [('CNF', self.departure), ('CNF', self.departure + timedelta(days=1)),
+             ('GRU', return_date), ('GRU', return_date + timedelta(days=1))],
+        )
+        self.assertEqual(len(trips), 4)
+        self.assertEqual((trips[0].outbound.miles_cost, trips[0].inbound.miles_cost), (4000, 2000))
+        self.assertIn('originAirport=GRU', trips[0].inbound.smiles_url)
+
+    def test_form_rejects_return_before_departure(self):
+        form = FlightSearchForm({
+            'origin': 'CNF', 'destination': 'GRU', 'date': self.departure.isoformat(), 'flexibility': 0,
+            'return_date': (self.departure - timedelta(days=1)).isoformat(),
+        })
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['return_date'], [FlightSearchForm.ERROR_MESSAGES['return_before_departure']])
+
+    def test_store_round_trips(self):
+        trip = RoundTrip(
+            self.flight(5000, '2025-03-10T10:00:00', '2025-03-10T11:00:00'),
+            self.flight(4000, '2025-03-12T10:00:00', '2025-03-12T11:00:00', origin='GRU', destination='CNF'),
+        )
+
+        self.assertEqual(load_round_trips(dump_round_trips([trip])), [trip])
+
+    @patch.object(FlightService, 'get_round_trips', new_callable=AsyncMock)
+    def test_round_trip_search_shows_both_legs(self, mock_round_trips):
+        mock_round_trips.return_value = [RoundTrip(
+            self.flight(5000, '2025-03-10T10:00:00', '2025-03-10T11:00:00'),
+            self.flight(4000, '2025-03-12T10:00:00', '2025-03-12T11:00:00', origin='GRU', destination='CNF'),
+        )]
+        return_date = self.departure + timedelta(days=5)
+        response = self.client.post(reverse('search_flights'), {
+            'origin': 'CNF', 'destination': 'GRU', 'date': self.departure.isoformat(), 'flexibility': 3,
+            'return_date': return_date.isoformat(), 'return_flexibility': 7,
+        })
+
+        self.assertEqual(response.status_code, 302)
+        mock_round_trips.assert_awaited_once_with('CNF', 'GRU', self.departure, 3, return_date, 7, limit=50)
+        response = self.client.get(response.url)
+        self.assertContains(response, 'Total: 9000 milhas')
+        self.assertContains(response, 'GRU &rarr; CNF')
+        self.assertContains(response, f'value="{return_date.isoformat()}"')
+
+    @patch.object(FlightService, 'get_round_trips', new_callable=AsyncMock)
+    def test_round_trip_stream_sends_one_event(self, mock_round_trips):
+        mock_round_trips.return_value = [RoundTrip(
+            self.flight(5000, '2025-03-10T10:00:00', '2025-03-10T11:00:00'),
+            self.flight(4000, '2025-03-12T10:00:00', '2025-03-12T11:00:00'),
+        )]
+
+        async def read_stream():
+            response = await self.async_client.get(reverse('stream_flights'), {
+                'origin': 'CNF', 'destination': 'GRU', 'date': self.departure.isoformat(), 'flexibility': 0,
+                'return_date': (self.departure + timedelta(days=2)).isoformat(),
+            })
+            return b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        body = asyncio.run(read_stream())
+
+        self.assertEqual(body.count('event: flights'), 1)
+        self.assertIn('"miles_cost": 9000', body)
+        self.assertIn('event: done\ndata: {"total": 1}', body)
+
+
+@override_settings(FLIGHT_AIRPORT_GROUPS={'SAO': ('GRU', 'CGH', 'VCP'), 'RIO': ('GIG', 'SDU')})
+class AirportSetSearchTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for iata_code, state_code in (('GRU', 'SP'), ('CGH', 'SP'), ('GIG', 'RJ'), ('SDU', 'RJ'), ('CNF', 'MG')):
+            Airport.objects.create(
+                name=iata_code, iata_code=iata_code, state_code=state_code, country_code='BR', country_name='Brasil'
+            )
+
+    def setUp(self):
+        invalidate_airport_index()
+        self.departure = date.today() + timedelta(days=10)
+
+    def test_index_groups_airports_by_region(self):
+        index = get_airport_index()
+
+        self.assertEqual(index.airports_in('br-sp'), ('CGH', 'GRU'))
+        self.assertEqual(len(index.airports_in('BR')), 5)
+        self.assertEqual(index.airports_in('AR'), ())
+
+    def test_resolve_airports(self):
+        self.assertEqual(resolve_airports('sao'), ('GRU', 'CGH'))
+        self.assertEqual(resolve_airports('BR-RJ, GIG, CNF'), ('GIG', 'SDU', 'CNF'))
+        with self.assertRaises(ValueError):
+            resolve_airports('BR-XX')
+        with self.assertRaises(ValueError):
+            resolve_airports('GRU,')
+
+    def test_plain_codes_need_no_index(self):
+        with patch('flights.airport_groups.get_airport_index', side_effect=AssertionError):
+            self.assertEqual(resolve_airports('gru'), ('GRU',))
+
+    def test_routes_are_deduplicated(self):
+        self.assertEqual(
+            resolve_routes('GRU,CGH,GRU', 'CGH,GIG'),
+            [('GRU', 'CGH'), ('GRU', 'GIG'), ('CGH', 'GIG')],
+        )
+
+    def test_searches_cover_every_route_and_date(self):
+        get_airport_index()  # Built by the form's validation before any search.
+        searches = asyncio.run(FlightService(client=object()).build_searches('SAO', 'RIO', self.departure, 2))
+
+        self.assertEqual(len(searches), 8)
+        self.assertEqual(len({(s['origin'], s['destination'], s['departure_date']) for s in searches}), 8)
+        self.assertEqual(searches[0]['departure_date'], self.departure)
+        self.assertEqual(searches[-1]['departure_date'], self.departure + timedelta(days=1))
+
+    @patch('aiohttp.ClientSession.get')
+    def test_cached_legs_are_reused(self, mock_get):
+        def respond(url, headers=None, params=None, timeout=None):
+            miles = {'GRU': 9000, 'CGH': 7000}[params['originAirportCode']]
+            return MockAiohttpResponse({'requestedFlightSegmentList': [{'flightList': [{
+                'fareList': [{'type': 'SMILES', 'miles': miles}],
+                'airline': {'name': params['originAirportCode']},
+                'duration': {'hours': 1, 'minutes': 0},
+                'stops': 0,
+            }]}]})
+
+        mock_get.side_effect = respond
+        client = FlightAPIClient(api_key='dummy', telemetry='dummy', cache=SearchCache(ttl=60, maxsize=100))
+        service = FlightService(client)
+        self.addCleanup(FlightAPIClient.close_all_sessions)
+        get_airport_index()
+
+        asyncio.run(service.get_flights_internal('GRU', 'GIG', self.departure, 3))
+        flights = asyncio.run(service.get_flights_internal('SAO', 'GIG', self.departure, 3, limit=2))
+
+        self.assertEqual(mock_get.call_count, 6)
+        self.assertEqual([flight.airline for flight in flights], ['CGH', 'CGH'])
+        self.assertIn('originAirport=CGH', flights[0].smiles_url)
+
+    def test_form_accepts_airport_sets(self):
+        form = FlightSearchForm({
+            'origin': 'sao', 'destination': 'BR-RJ', 'date': self.departure.isoformat(), 'flexibility': 7,
+        })
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual((form.cleaned_data['origin'], form.cleaned_data['destination']), ('SAO', 'BR-RJ'))
+
+    def test_form_rejects_unknown_and_overlapping_sets(self):
+        unknown = FlightSearchForm({
+            'origin': 'GRU,XXX', 'destination': 'GIG', 'date': self.departure.isoformat(), 'flexibility': 0,
+        })
+        same = FlightSearchForm({
+            'origin': 'GRU', 'destination': 'gru', 'date': self.departure.isoformat(), 'flexibility': 0,
+        })
+
+        self.assertIn('origin', unknown.errors)
+        self.assertEqual(same.errors['destination'], [FlightSearchForm.ERROR_MESSAGES['same_airports']])
+
+    def test_form_limits_the_number_of_searches(self):
+        with patch.object(FlightSearchForm, 'MAX_SEARCHES', 10):
+            form = FlightSearchForm({
+                'origin': 'SAO', 'destination': 'RIO', 'date': self.departure.isoformat(), 'flexibility': 3,
+            })
+
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), [FlightSearchForm.ERROR_MESSAGES['too_many_searches']])
+
+    def test_fare_calendar_takes_single_airports(self):
+        form = FareCalendarForm({'origin': 'SAO', 'destination': 'GIG', 'date': self.departure.isoformat()})
+
+        self.assertIn('origin', form.errors)
+
+
+class SearchTimingsTest(DjangoTestCase):
+    response = {'requestedFlightSegmentList': [{'flightList': [
+        {'fareList': [{'type': 'SMILES', 'miles': 15000}], 'duration': {'hours': 1, 'minutes': 0}, 'stops': 0},
+        {'fareList': [{'type': 'SMILES', 'miles': 9000}], 'duration': {'hours': 2, 'minutes': 0}, 'stops': 1},
+    ]}]}
+
+    @classmethod
+    def setUpTestData(cls):
+        for iata_code in ('CNF', 'GRU'):
+            Airport.objects.create(
+                name=iata_code, iata_code=iata_code, state_code='MG', country_code='BR', country_name='Brasil'
+            )
+
+    def setUp(self):
+        self.addCleanup(FlightAPIClient.close_all_sessions)
+        self.search = {
+            'origin': 'CNF',
+            'destination': 'GRU',
+            'date': (date.today() + timedelta(days=10)).isoformat(),
+            'flexibility': 3,
+        }
+
+    def test_spans_are_aggregated(self):
+        timings = SearchTimings('search', clock=iter([10.0, 12.5]).__next__)
+        timings.add('server', 0.5)
+        timings.add('server', 0.25)
+        timings.add('cache_hit', 0.0)
+        timings.finish()
+
+        self.assertEqual(timings.summary(), {
+            'search': 'search',
+            'total_ms': 2500.0,
+            'spans': {
+                'server': {'ms': 750.0, 'count': 2, 'max_ms': 500.0},
+                'cache_hit': {'ms': 0.0, 'count': 1, 'max_ms': 0.0},
+            },
+        })
+        self.assertEqual(timings.server_timing(), 'total;dur=2500.0, server;dur=750.0, cache_hit;dur=0.0')
+        self.assertEqual(timings.format(), 'search total=2500.0ms server=750.0ms/2 cache_hit=0.0ms/1')
+
+    def test_timing_is_off_by_default(self):
+        with collect_timings('search') as timings:
+            with span('parse'):
+                count('cache_hit')
+
+        self.assertIsNone(timings)
+        self.assertIsNone(current_timings())
+
+    @override_settings(FLIGHT_SEARCH_TIMINGS='log')
+    @patch('aiohttp.ClientSession.get')
+    def test_service_phases_are_logged(self, mock_get):
+        mock_get.side_effect = lambda *args, **kwargs: MockAiohttpResponse(self.response)
+        service = FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+
+        async def search():
+            with collect_timings('search') as timings:
+                flights = await service.get_flights_internal('CNF', 'GRU', date.today(), 2, limit=1)
+            return flights, timings
+
+        with self.assertLogs('flights.timing', 'INFO') as logs:
+            flights, timings = asyncio.run(search())
+
+        self.assertEqual([flight.miles_cost for flight in flights], [9000])
+        spans = timings.summary()['spans']
+        self.assertEqual(spans['fetch']['count'], 1)
+        self.assertEqual(spans['rate_limit']['count'], 2)
+        self.assertEqual(spans['body']['count'], 2)
+        self.assertEqual(spans['parse']['count'], 2)
+        self.assertEqual(spans['rank']['count'], 3)  # Each date, then the merge.
+        self.assertIsNone(current_timings())
+        self.assertIn('search total=', logs.output[0])
+        self.assertIn('parse=', logs.output[0])
+
+    @override_settings(FLIGHT_SEARCH_TIMINGS='log')
+    def test_requests_are_traced(self):
+        async def search():
+            app = web.Application()
+            app.router.add_get('/search', lambda request: web.json_response(self.response))
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, 'localhost', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            client = FlightAPIClient(api_key='dummy', telemetry='dummy', base_url=f'http://localhost:{port}/search')
+            try:
+                with collect_timings('search') as timings:
+                    await client.search_flights_bulk([
+                        {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today()},
+                        {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today() + timedelta(days=1)},
+                    ])
+            finally:
+                await FlightAPIClient.close_session()
+                await runner.cleanup()
+            return timings
+
+        with self.assertLogs('flights.timing', 'INFO'):
+            spans = asyncio.run(search()).summary()['spans']
+
+        self.assertEqual(spans['request']['count'], 2)
+        self.assertEqual(spans['server']['count'], 2)
+        self.assertEqual(spans['decode']['count'], 2)
+        self.assertGreaterEqual(spans['connect']['count'], 1)
+        self.assertGreaterEqual(spans['dns']['count'], 1)
+
+    @override_settings(FLIGHT_SEARCH_TIMINGS='response')
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_search_response_has_server_timing(self, mock_search):
+        mock_search.return_value = [SearchFlightsViewTest.flight]
+
+        with self.assertLogs('flights.timing', 'INFO'):
+            response = self.client.post(reverse('search_flights'), self.search)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Server-Timing'].startswith('total;dur='))
+
+    @override_settings(FLIGHT_SEARCH_TIMINGS='log')
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_logged_timings_are_not_sent(self, mock_search):
+        mock_search.return_value = [SearchFlightsViewTest.flight]
+
+        with self.assertLogs('flights.timing', 'INFO'):
+            response = self.client.post(reverse('search_flights'), self.search)
+
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(FLIGHT_SEARCH_TIMINGS='response')
+    async def test_stream_done_event_has_timings(self):
+        async def fake_stream(self, origin, destination, departure_date, flexibility, limit=None):
+            with span('parse'):
+                yield departure_date, [SearchFlightsViewTest.flight]
+
+        with patch.object(FlightService, 'stream_flights', fake_stream), self.assertLogs('flights.timing', 'INFO'):
+            response = await self.async_client.get(reverse('stream_flights'), self.search)
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        done = json.loads(body.split('event: done\ndata: ')[1])
+        self.assertEqual(done['total'], 1)
+        self.assertEqual(done['timings']['spans']['parse']['count'], 1)
+
+
+class ReplayServerTest(TestCase):
+    def setUp(self):
+        FlightAPIClient.reset_rate_limiter()
+        self.addCleanup(FlightAPIClient.reset_rate_limiter)
+
+    def search(self, server, searches, retry_policy=None):
+        async def run():
+            url = await server.start()
+            client = FlightAPIClient(
+                api_key='dummy', telemetry='dummy', base_url=url, retry_policy=retry_policy
+            )
+            try:
+                return await client.search_flights_bulk(searches)
+            finally:
+                await FlightAPIClient.close_session()
+                await server.close()
+        return asyncio.run(run())
+
+    def test_replays_the_same_response_per_search(self):
+        server = ReplayServer(profile=ReplayProfile(latency=0))
+        day = date.today() + timedelta(days=5)
+        searches = [{'origin': 'CNF', 'destination': 'GRU', 'departure_date': day}] * 2 + [
+            {'origin': 'CNF', 'destination': 'LIS', 'departure_date': day + timedelta(days=days)}
+            for days in range(6)
+        ]
+
+        results = self.search(server, searches)
+
+        self.assertEqual(results[0], results[1])
+        self.assertTrue(all('requestedFlightSegmentList' in result for result in results))
+        self.assertGreater(len({json.dumps(result, sort_keys=True) for result in results}), 1)
+        self.assertEqual(server.stats['ok'], server.stats['requests'])
+
+    def test_client_retries_throttling_bursts(self):
+        server = ReplayServer(profile=ReplayProfile(
+            latency=0, throttle_every=100, throttle_length=2, retry_after=0.01
+        ))
+        search = {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today()}
+
+        results = self.search(server, [search], RetryPolicy(retry_statuses={429: 3}, backoff=0.01))
+
+        self.assertNotIn('error', results[0])
+        self.assertEqual(results[0].attempts, 3)
+        self.assertEqual(server.stats['throttled'], 2)
+
+    def test_errors_are_replayed(self):
+        server = ReplayServer(profile=ReplayProfile(latency=0, error_rate=1, seed=1))
+        search = {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today()}
+
+        results = self.search(server, [search], RetryPolicy(retry_statuses={503: 1}))
+
+        self.assertIn('error', results[0])
+        self.assertEqual(server.stats['errors'], 1)
+
+    def test_latencies_follow_the_profile(self):
+        fixed = ReplayServer(profile=ReplayProfile(latency=0.2))
+        spread = ReplayServer(profile=ReplayProfile(latency=0.2, jitter=0.5, seed=7))
+        latencies = sorted(spread.draw_latency() for _ in range(1001))
+
+        self.assertEqual(fixed.draw_latency(), 0.2)
+        self.assertAlmostEqual(latencies[500], 0.2, delta=0.02)
+        self.assertGreater(latencies[990], 0.5)
+
+    def test_invalid_profiles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            ReplayProfile(error_rate=2)
+        with self.assertRaises(ValueError):
+            ReplayProfile(latency=-1)
+
+    @override_settings(FLIGHT_API_BASE_URL='http://localhost:1/search')
+    def test_base_url_comes_from_settings(self):
+        self.assertEqual(FlightAPIClient(api_key='dummy', telemetry='dummy').base_url, 'http://localhost:1/search')
+        self.assertEqual(
+            FlightAPIClient(api_key='dummy', telemetry='dummy', base_url='http://other/').base_url, 'http://other/'
+        )
+
+
+class LoadTestTest(TestCase):
+    def test_percentiles(self):
+        values = [float(value) for value in range(1, 101)]
+
+        self.assertEqual(percentile(values, 0.5), 50.0)
+        self.assertEqual(percentile(values, 0.95), 95.0)
+        self.assertEqual(percentile(values, 0.99), 99.0)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_report_summary(self):
+        report = LoadReport('client', 2, elapsed=2.0, latencies=[0.1, 0.3, 0.2], errors=1)
+
+        summary = report.summary()
+
+        self.assertEqual(summary['operations'], 4)
+        self.assertEqual(summary['throughput'], 2.0)
+        self.assertEqual((summary['p50_ms'], summary['p99_ms'], summary['max_ms']), (200.0, 300.0, 300.0))
+
+    def test_runs_at_the_target_concurrency(self):
+        in_flight = peak = 0
+
+        async def operation():
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+            return in_flight % 2 == 0
+
+        load_test = LoadTest('client', concurrency=4, operations=20)
+        with patch.object(load_test, 'operation', return_value=operation):
+            report = asyncio.run(load_test.run())
+
+        self.assertEqual(peak, 4)
+        self.assertEqual(report.operations, 20)
+        self.assertGreater(report.errors, 0)
+
+    def test_rejects_unknown_layers(self):
+        with self.assertRaises(ValueError):
+            LoadTest('database', 1, 1)
+
+    def test_command_reports_percentiles(self):
+        out = StringIO()
+
+        call_command(
+            'load_test', 'service', requests=6, concurrency=3, flexibility=3, latency=0, rate_limit=1000,
+            no_cache=True, seed=1, stdout=out,
+        )
+
+        output = out.getvalue()
+        self.assertIn('service: 6 searches, concurrency 3, 0 failed', output)
+        self.assertIn('p99', output)
+        self.assertIn("Replay server: {'requests': ", output)
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        metrics.REGISTRY.reset()
+        self.addCleanup(metrics.REGISTRY.reset)
+
+    def test_counters_add_up_every_thread(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests_total', 'Requests.', ('outcome',))
+
+        def work():
+            for _ in range(1000):
+                counter.inc('ok')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc('503', amount=2)
+
+        self.assertEqual(counter.value('ok'), 4000)
+        # The shards of the threads that ended were folded into the base one.
+        self.assertEqual(len(counter._shards), 2)
+        self.assertIn('requests_total{outcome="503"} 2', registry.expose())
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_histogram_exposition(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value)
+
+        lines = registry.expose().splitlines()
+
+        self.assertEqual(lines[:2], ['# HELP latency_seconds Latency.', '# TYPE latency_seconds histogram'])
+        self.assertEqual(lines[2:], [
+            'latency_seconds_bucket{le="0.1"} 2',
+            'latency_seconds_bucket{le="1"} 3',
+            'latency_seconds_bucket{le="+Inf"} 4',
+            'latency_seconds_sum 3.65',
+            'latency_seconds_count 4',
+        ])
+
+    def test_histograms_keep_the_observations_of_ended_threads(self):
+        histogram = MetricsRegistry().histogram('latency_seconds', 'Latency.', buckets=(0.1, 1))
+
+        for value in (0.05, 0.5):
+            thread = threading.Thread(target=histogram.observe, args=(value,))
+            thread.start()
+            thread.join()
+        histogram.observe(3)
+
+        self.assertEqual(len(histogram._shards), 2)
+        self.assertEqual(histogram.totals(), {(): [1, 1, 1, 3.55]})
+
+    def test_gauge_goes_down(self):
+        gauge = MetricsRegistry().gauge('in_flight', 'In flight.')
+        gauge.inc()
+        gauge.inc()
+        gauge.dec()
+
+        self.assertEqual(gauge.value(), 1)
+
+    def test_names_are_unique(self):
+        registry = MetricsRegistry()
+        registry.counter('requests_total', 'Requests.')
+
+        with self.assertRaises(ValueError):
+            registry.gauge('requests_total', 'Requests.')
+
+    def test_flexibility_buckets(self):
+        self.assertEqual(
+            [flexibility_bucket(days) for days in (None, 0, 3, 7, 15, 30)],
+            ['0', '0', '1-3', '4-7', '8-15', '16+'],
+        )
+
+    @patch('aiohttp.ClientSession.get')
+    def test_client_counts_requests_retries_and_failures(self, mock_get):
+        error = ClientResponseError(request_info=MagicMock(), history=(), status=503)
+        mock_get.side_effect = [
+            MockAiohttpResponse(raise_exc=error),
+            MockAiohttpResponse({'ok': True}),
+            MockAiohttpResponse(raise_exc=ClientConnectionError('reset')),
+        ]
+        client = FlightAPIClient(
+            api_key='dummy', telemetry='dummy', retry_policy=RetryPolicy(max_attempts=1, backoff=0)
+        )
+        self.addCleanup(FlightAPIClient.close_all_sessions)
+
+        asyncio.run(client.search_flights('CNF', 'GRU', date.today()))
+        result = asyncio.run(client.search_flights('CNF', 'GRU', date.today() + timedelta(days=1)))
+
+        self.assertIn('error', result)
+        self.assertEqual(metrics.UPSTREAM_REQUESTS.totals(), {('503',): 1, ('ok',): 1, ('connection_error',): 1})
+        self.assertEqual(metrics.UPSTREAM_RETRIES.value(), 1)
+        self.assertEqual(metrics.UPSTREAM_FAILURES.value(), 1)
+        self.assertEqual(metrics.UPSTREAM_IN_FLIGHT.value(), 0)
+        self.assertEqual(metrics.UPSTREAM_LATENCY.count(), 3)
+
+    def test_service_counts_parsed_flights(self):
+        service = FlightService(client=object())
+        response = {'requestedFlightSegmentList': [{'flightList': [
+            {'fareList': [{'type': 'SMILES', 'miles': 15000}]},
+            {'fareList': [{'type': 'SMILES', 'miles': 9000}]},
+        ]}]}
+
+        service.extract_search_flights(
+            {'origin': 'CNF', 'destination': 'GRU', 'departure_date': date.today()}, response
+        )
+
+        self.assertEqual(metrics.FLIGHTS_PARSED.value(), 2)
+        self.assertEqual(metrics.PARSE_LATENCY.count(), 1)
+
+
+class MetricsViewTest(DjangoTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for iata_code in ('CNF', 'GRU'):
+            Airport.objects.create(
+                name=iata_code, iata_code=iata_code, state_code='MG', country_code='BR', country_name='Brasil'
+            )
+
+    def setUp(self):
+        metrics.REGISTRY.reset()
+        self.addCleanup(metrics.REGISTRY.reset)
+
+    @override_settings(FLIGHT_METRICS_ENABLED=True)
+    @patch.object(FlightService, 'get_flights_internal', new_callable=AsyncMock)
+    def test_search_latency_is_exposed(self, mock_search):
+        mock_search.return_value = [SearchFlightsViewTest.flight]
+        self.client.post(reverse('search_flights'), {
+            'origin': 'CNF',
+            'destination': 'GRU',
+            'date': (date.today() + timedelta(days=10)).isoformat(),
+            'flexibility': 7,
+        })
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        content = response.content.decode()
+        self.assertIn('flights_view_seconds_count{view="search",flexibility="4-7"} 1', content)
+        self.assertIn('# TYPE flights_upstream_requests_total counter', content)
+        self.assertIn('flights_search_cache_hit_ratio', content)
+
+    def test_metrics_are_disabled_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class FareHistoryTest(DjangoTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.recorder = FareHistoryRecorder(batch_size=2, background=False)
+        self.service = FlightService(
+            FlightAPIClient(api_key='dummy', telemetry='dummy', fare_history=self.recorder), fare_history=self.recorder,
+        )
+        self.day = date.today() + timedelta(days=10)
+        self.now = timezone.now()
+
+    def search(self, day=None):
+        return self.service.build_search('CNF', 'GRU', day or self.day)
+
+    def observe(self, miles, day=None, stops=0, airline='GOL', age=timedelta()):
+        FareObservation.objects.create(
+            origin='CNF', destination='GRU', flight_date=day or self.day, airline=airline, stops=stops,
+            miles=miles, observed_at=self.now - age,
+        )
+
+    def test_flush_writes_queued_fares(self):
+        self.recorder.record('CNF', 'GRU', self.day, self.now, [('GOL', 0, 9000), (None, None, 12000)])
+        self.recorder.record('CNF', 'GRU', self.day, self.now, [])
+        self.recorder.record('CNF', 'SDU', self.day, self.now, [('AZUL', 1, 15000)])
+
+        self.assertEqual(FareObservation.objects.count(), 0)
+        self.assertEqual(self.recorder.flush(), 3)
+        self.assertEqual(self.recorder.flush(), 0)
+        self.assertEqual(
+            list(FareObservation.objects.order_by('miles').values_list('destination', 'airline', 'stops', 'miles')),
+            [('GRU', 'GOL', 0, 9000), ('GRU', None, None, 12000), ('SDU', 'AZUL', 1, 15000)],
+        )
+
+    def test_failed_batch_is_retried_once_then_dropped(self):
+        for miles in (9000, 9500, 10000):
+            self.recorder.record('CNF', 'GRU', self.day, self.now, [('GOL', 0, miles)])
+        create = FareObservation.objects.bulk_create
+
+        with patch.object(FareObservation.objects, 'bulk_create', side_effect=DatabaseError('locked')), \
+                self.assertLogs('flights.fare_history', 'WARNING'):
+            self.assertEqual(self.recorder.flush(), 0)
+        # Every fare is still queued, the failed batch first.
+        self.assertEqual(self.recorder._pending, 3)
+
+        failures = iter([DatabaseError('bad row')])
+
+        def fail_once(observations):
+            error = next(failures, None)
+            if error is not None:
+                raise error
+            return create(observations)
+
+        with patch.object(FareObservation.objects, 'bulk_create', side_effect=fail_once):
+            with self.assertLogs('flights.fare_history', 'ERROR'):
+                self.assertEqual(self.recorder.flush(), 0)
+            self.assertEqual(self.recorder.flush(), 1)
+
+        self.assertEqual(self.recorder.dropped, 2)
+        self.assertEqual(list(FareObservation.objects.values_list('miles', flat=True)), [10000])
+
+    def test_fares_beyond_max_pending_are_dropped(self):
+        recorder = FareHistoryRecorder(max_pending=2, background=False)
+        recorder.record('CNF', 'GRU', self.day, self.now, [('GOL', 0, 9000)])
+        recorder.record('CNF', 'GRU', self.day, self.now, [('GOL', 0, 9000), ('GOL', 0, 9500)])
+
+        self.assertEqual(recorder.dropped, 2)
+        self.assertEqual(recorder.flush(), 1)
+
+    def tearDown(self):
+        FlightAPIClient.close_all_sessions()
+
+    @patch('aiohttp.ClientSession.get')
+    def test_fetched_responses_are_recorded_once(self, mock_get):
+        with open(FlightParserTest.RESPONSES_PATH, 'r', encoding='utf-8') as file:
+            mock_get.return_value = MockAiohttpResponse(json.load(file)[0])
+        # Two processes, each with its own memory, sharing the Django cache.
+        services = [
+            FlightService(FlightAPIClient(
+                api_key='dummy', telemetry='dummy', fare_history=self.recorder,
+                cache=SearchCache(ttl=60, maxsize=10, backend=DjangoCacheBackend('default')),
+            ), fare_history=self.recorder)
+            for _ in range(2)
+        ]
+
+        async def search(service):
+            response = (await service.client.search_flights_bulk([self.search()]))[0]
+            return service.extract_search_flights(self.search(), response)
+
+        with patch.object(self.recorder, 'record_flights', wraps=self.recorder.record_flights) as record:
+            flights = asyncio.run(search(services[0]))
+            asyncio.run(search(services[0]))
+            asyncio.run(search(services[1]))
+            self.recorder.flush()
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(services[1].client.cache.stats()['backend_hits'], 1)
+        self.assertEqual(record.call_count, 1)
+        self.assertTrue(flights)
+        self.assertEqual(FareObservation.objects.count(), len(flights))
+        self.assertEqual(
+            FareObservation.objects.aggregate(Min('miles'))['miles__min'], min(f.miles_cost for f in flights)
+        )
+
+    @patch('aiohttp.ClientSession.get')
+    def test_calendar_records_every_fare(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse({'requestedFlightSegmentList': [{'flightList': [
+            {'fareList': [{'type': 'SMILES', 'miles': miles}], 'airline': {'name': airline}, 'stops': stops}
+            for miles, airline, stops in ((12000, 'GOL', 0), (9000, 'AZUL', 1), (0, 'TAP', 0))
+        ] + [{'fareList': [{'type': 'SMILES', 'miles': 15000}]}]}]})
+        days = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.day, 1))
+        self.recorder.flush()
+
+        self.assertEqual(days, [FareCalendarDay(self.day, 9000, 'AZUL', 1)])
+        self.assertEqual(
+            sorted(FareObservation.objects.values_list('airline', 'stops', 'miles'), key=lambda row: row[2]),
+            [('AZUL', 1, 9000), ('GOL', 0, 12000), (None, None, 15000)],
+        )
+
+    @patch('aiohttp.ClientSession.get')
+    def test_round_trip_fares_are_recorded_by_direction(self, mock_get):
+        flight = {'fareList': [{'type': 'SMILES', 'miles': 9000}], 'airline': {'name': 'GOL'}, 'stops': 0}
+        mock_get.return_value = MockAiohttpResponse({'requestedFlightSegmentList': [
+            {'flightList': [flight]}, {'flightList': [flight, flight]},
+        ]})
+        back = self.day + timedelta(days=5)
+        asyncio.run(self.service.client.search_flights('CNF', 'GRU', self.day, return_date=back))
+        self.recorder.flush()
+
+        self.assertEqual(
+            sorted(FareObservation.objects.values_list('origin', 'destination', 'flight_date')),
+            [('CNF', 'GRU', self.day), ('GRU', 'CNF', back), ('GRU', 'CNF', back)],
+        )
+
+    def test_flight_fares(self):
+        self.assertEqual(flight_fares([
+            {'fareList': [{'type': 'SMILES', 'miles': 9000}, {'type': 'SMILES_CLUB', 'miles': 8000}],
+             'airline': {'name': 'GOL'}, 'stops': 1},
+            {'fareList': [{'type': 'MONEY', 'miles': 1000}], 'airline': {'name': 'TAP'}},
+            {'fareList': [{'type': 'SMILES', 'miles': 12000}]},
+            {'fareList': None},
+        ]), [('GOL', 1, 8000), (None, None, 12000)])
+
+    def test_cheapest_by_day(self):
+        other_day = self.day + timedelta(days=1)
+        self.observe(12000)
+        self.observe(9000, age=timedelta(days=3))
+        self.observe(15000, day=other_day)
+
+        self.assertEqual(
+            cheapest_by_day('CNF', 'GRU', self.day, other_day), {self.day: 9000, other_day: 15000}
+        )
+        self.assertEqual(
+            cheapest_by_day('CNF', 'GRU', self.day, self.day, since=self.now - timedelta(days=1)), {self.day: 12000}
+        )
+
+    def test_price_history(self):
+        self.observe(12000, age=timedelta(days=2))
+        self.observe(11000, age=timedelta(days=2))
+        self.observe(9000)
+
+        self.assertEqual(price_history('CNF', 'GRU', self.day), [
+            ((self.now - timedelta(days=2)).date(), 11000), (self.now.date(), 9000),
+        ])
+
+    def test_recent_cheapest_prefers_fewest_stops(self):
+        self.observe(9000, stops=2, airline='AZUL')
+        self.observe(9000, stops=1, airline='LATAM')
+        self.observe(5000, age=timedelta(hours=2))
+
+        self.assertEqual(
+            recent_cheapest('CNF', 'GRU', [self.day, self.day + timedelta(days=1)], max_age=3600),
+            {self.day: FareCalendarDay(self.day, 9000, 'LATAM', 1)},
+        )
+
+    @override_settings(FLIGHT_FARE_HISTORY_MAX_AGE=3600)
+    def test_calendar_serves_recent_days_from_history(self):
+        known = FareCalendarDay(self.day, 9000, 'LATAM', 1)
+        bulk = AsyncMock(return_value=[{'error': 'timeout'}])
+        with patch('flights.services.recent_cheapest', return_value={self.day: known}) as history, \
+                patch.object(self.service.client, 'search_flights_bulk', bulk):
+            days = asyncio.run(self.service.fare_calendar('CNF', 'GRU', self.day, 2))
+
+        self.assertEqual(days, [known, FareCalendarDay(self.day + timedelta(days=1))])
+        history.assert_called_once_with('CNF', 'GRU', [self.day, self.day + timedelta(days=1)], 3600)
+        searched = [search['departure_date'] for search in bulk.await_args.args[0]]
+        self.assertEqual(searched, [self.day + timedelta(days=1)])
+
+    def test_load_test_records_no_fares(self):
+        self.addCleanup(reset_fare_history)
+        with override_settings(FLIGHT_FARE_HISTORY_ENABLED=True), \
+                patch.object(FareHistoryRecorder, 'record_flights') as record:
+            call_command(
+                'load_test', 'service', requests=4, concurrency=2, latency=0, rate_limit=1000, no_cache=True,
+                seed=1, stdout=StringIO(),
+            )
+            reset_fare_history()
+
+        record.assert_not_called()
+        self.assertFalse(FareObservation.objects.exists())
+
+    def test_process_wide_recorder(self):
+        self.addCleanup(reset_fare_history)
+        self.assertIsNone(get_fare_history())
+        with override_settings(FLIGHT_FARE_HISTORY_ENABLED=True):
+            recorder = get_fare_history()
+            self.assertIs(get_fare_history(), recorder)
+            reset_fare_history()
+            self.assertIsNot(get_fare_history(), recorder)
+
+
+class FareAnalyticsTest(DjangoTestCase):
+    def setUp(self):
+        self.monday = date(2026, 11, 2)
+        self.now = timezone.now()
+        fares = [
+            ('CNF', 'GRU', 'GOL', self.monday, 0, 9000),
+            ('CNF', 'GRU', 'GOL', self.monday + timedelta(days=7), 1, 12000),
+            ('CNF', 'GRU', 'AZUL', self.monday, 0, 10000),
+            ('CNF', 'GRU', 'AZUL', self.monday + timedelta(days=1), 2, 20000),
+            ('GRU', 'SDU', 'GOL', self.monday, 0, 5000),
+        ]
+        FareObservation.objects.bulk_create([
+            FareObservation(
+                origin=origin, destination=destination, airline=airline, flight_date=flight_date, stops=stops,
+                miles=miles, observed_at=self.now,
+            )
+            for origin, destination, airline, flight_date, stops, miles in fares
+        ])
+
+    def test_requires_numpy(self):
+        with patch.object(fare_analytics, 'np', None):
+            with self.assertRaisesRegex(ValueError, 'numpy'):
+                FareColumns.from_observations()
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_grouped_reduction_matches_numpy(self):
+        np = fare_analytics.np
+        rng = np.random.default_rng(1)
+        keys = rng.integers(0, 20, 5000)
+        values = rng.integers(1000, 90000, 5000)
+
+        reduced = grouped_reduction(keys, values, (10, 50, 90))
+
+        self.assertEqual(reduced['key'].tolist(), sorted(set(keys.tolist())))
+        for index, key in enumerate(reduced['key']):
+            group = values[keys == key]
+            self.assertEqual(reduced['count'][index], len(group))
+            self.assertEqual(reduced['min'][index], group.min())
+            self.assertEqual(reduced['max'][index], group.max())
+            self.assertAlmostEqual(reduced['mean'][index], group.mean())
+            for percentile in (10, 50, 90):
+                self.assertAlmostEqual(reduced[f'p{percentile}'][index], np.percentile(group, percentile))
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_summarize_by_route_and_weekday(self):
+        rows = summarize(FareColumns.from_observations(chunk_size=2), ('route', 'weekday'), (50,))
+
+        self.assertEqual(rows, [
+            {'route': 'CNF-GRU', 'weekday': 0, 'count': 3, 'min': 9000, 'mean': 10333.3, 'max': 12000, 'p50': 10000.0},
+            {'route': 'CNF-GRU', 'weekday': 1, 'count': 1, 'min': 20000, 'mean': 20000.0, 'max': 20000, 'p50': 20000.0},
+            {'route': 'GRU-SDU', 'weekday': 0, 'count': 1, 'min': 5000, 'mean': 5000.0, 'max': 5000, 'p50': 5000.0},
+        ])
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_summarize_by_airline_and_stops(self):
+        columns = FareColumns.from_observations().filter(route='CNF-GRU')
+
+        rows = summarize(columns, ('airline', 'stops'), ())
+
+        self.assertEqual(
+            [(row['airline'], row['stops'], row['count'], row['min']) for row in rows],
+            [('GOL', 0, 1, 9000), ('GOL', 1, 1, 12000), ('AZUL', 0, 1, 10000), ('AZUL', 2, 1, 20000)],
+        )
+        with self.assertRaises(ValueError):
+            summarize(columns, ('price',))
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_unknown_stops_and_airlines(self):
+        FareObservation.objects.create(
+            origin='GRU', destination='SDU', flight_date=self.monday, miles=4000, observed_at=self.now,
+        )
+        columns = FareColumns.from_observations().filter(route='GRU-SDU')
+
+        self.assertEqual(
+            [(row['stops'], row['min']) for row in summarize(columns, ('stops',), ())], [(None, 4000), (0, 5000)]
+        )
+        self.assertEqual(
+            [(row['airline'], row['min']) for row in summarize(columns, ('airline',), ())], [('GOL', 5000), (None, 4000)]
+        )
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_saved_columns_are_memory_mapped(self):
+        columns = FareColumns.from_observations()
+        with tempfile.TemporaryDirectory() as directory:
+            columns.save(directory)
+            loaded = FareColumns.load(directory)
+
+            self.assertIsInstance(loaded.miles, fare_analytics.np.memmap)
+            self.assertEqual(summarize(loaded, ('airline',)), summarize(columns, ('airline',)))
+            self.assertEqual(len(loaded.filter(since=self.now + timedelta(minutes=1))), 0)
+            del loaded
+
+    @skipUnless(fare_analytics.np, 'numpy is not installed')
+    def test_command(self):
+        out = StringIO()
+        call_command('fare_summary', '--by', 'route', '--percentiles', '50', '--csv', stdout=out, stderr=StringIO())
+
+        self.assertEqual(out.getvalue().splitlines(), [
+            'route,count,min,mean,max,p50',
+            'CNF-GRU,4,9000,12750.0,20000,11000.0',
+            'GRU-SDU,1,5000,5000.0,5000,5000.0',
+        ])
+        with self.assertRaises(CommandError):
+            call_command('fare_summary', '--percentiles', '120', stdout=StringIO())
+
+
+class WatchCheckerTest(DjangoTestCase):
+    def setUp(self):
+        self.today = date.today()
+        self.day = self.today + timedelta(days=20)
+        self.service = FlightService(FlightAPIClient(api_key='dummy', telemetry='dummy'))
+        self.checker = WatchChecker(self.service, budget=10)
+        self.watchers = [
+            Watch.objects.create(
+                email=f'user{max_miles}@example.com', origin='GRU', destination='LIS', flight_date=self.day,
+                max_miles=max_miles,
+            )
+            for max_miles in (10000, 9000, 8000)
+        ]
+        self.other = Watch.objects.create(
+            email='other@example.com', origin='CNF', destination='GRU', flight_date=self.day + timedelta(days=1),
+            max_miles=5000,
+        )
+        self.past = Watch.objects.create(
+            email='past@example.com', origin='GRU', destination='LIS', flight_date=self.today - timedelta(days=1),
+            max_miles=99999,
+        )
+        self.fares = {'GRU': 9000, 'CNF': 7000}
+
+    def response(self, miles):
+        return {'requestedFlightSegmentList': [{'flightList': [
+            {'fareList': [{'type': 'SMILES', 'miles': miles}], 'airline': {'name': 'TAP'}, 'stops': 0},
+            {'fareList': [{'type': 'SMILES', 'miles': miles + 5000}], 'airline': {'name': 'LATAM'}, 'stops': 1},
+        ]}]}
+
+    def fake_bulk(self, searches, time_budget=None):
+        return [self.response(self.fares[search['origin']]) for search in searches]
+
+    def check(self):
+        bulk = AsyncMock(side_effect=self.fake_bulk)
+        with patch.object(self.service.client, 'search_flights_bulk', bulk):
+            counts = self.checker.check(self.today)
+        return counts, bulk
+
+    def test_plan_groups_watches_by_route_and_date(self):
+        groups = self.checker.plan(self.today)
+
+        self.assertEqual(
+            [(group['origin'], group['watchers'], group['max_miles']) for group in groups],
+            [('GRU', 3, 10000), ('CNF', 1, 5000)],
+        )
+        self.past.refresh_from_db()
+        self.assertFalse(self.past.active)
+
+    def test_watches_are_normalized_and_validated(self):
+        for iata_code in ('CNF', 'GRU'):
+            Airport.objects.create(
+                name=iata_code, iata_code=iata_code, state_code='SP', country_code='BR', country_name='Brasil'
+            )
+        invalidate_airport_index()
+        self.addCleanup(invalidate_airport_index)
+
+        watch = Watch(email='a@example.com', origin=' cnf', destination='gru ', flight_date=self.day, max_miles=1)
+        watch.full_clean()
+        watch.save()
+        self.assertEqual((watch.origin, watch.destination), ('CNF', 'GRU'))
+
+        for destination in ('SAO', 'BR-SP', 'GRU,GRU', 'XXX', 'cnf'):
+            watch = Watch(email='a@example.com', origin='CNF', destination=destination, flight_date=self.day, max_miles=1)
+            with self.assertRaises(ValidationError, msg=destination) as error:
+                watch.full_clean()
+            self.assertIn('destination', error.exception.message_dict)
+
+    def test_bulk_created_watches_are_grouped_with_the_others(self):
+        Watch.objects.bulk_create([
+            Watch(email='lower@example.com', origin='gru', destination='lis', flight_date=self.day, max_miles=9500),
+        ])
+
+        groups = self.checker.plan(self.today)
+
+        self.assertEqual([(group['origin'], group['watchers']) for group in groups], [('GRU', 4), ('CNF', 1)])
+        self.assertFalse(Watch.objects.filter(origin='gru').exists())
+
+    def test_each_route_and_date_is_searched_once(self):
+        counts, bulk = self.check()
+
+        bulk.assert_awaited_once()
+        self.assertEqual(
+            [(search['origin'], search['departure_date']) for search in bulk.await_args.args[0]],
+            [('GRU', self.day), ('CNF', self.day + timedelta(days=1))],
+        )
+        self.assertEqual(counts, {'checked': 2, 'failed': 0, 'alerts': 2, 'groups': 2})
+        self.assertEqual(
+            sorted(PriceAlert.objects.values_list('watch__max_miles', 'miles', 'airline', 'stops')),
+            [(9000, 9000, 'TAP', 0), (10000, 9000, 'TAP', 0)],
+        )
+        self.assertFalse(Watch.objects.filter(active=True, last_checked_at__isnull=True).exists())
+
+    def test_watchers_are_alerted_again_only_if_the_price_drops(self):
+        self.check()
+        counts, _ = self.check()
+        self.assertEqual(counts['alerts'], 0)
+
+        self.fares['GRU'] = 8000
+        counts, _ = self.check()
+
+        self.assertEqual(counts['alerts'], 3)
+        self.assertEqual(
+            sorted(self.watchers[0].alerts.values_list('miles', flat=True)), [8000, 9000]
+        )
+        self.assertEqual(list(self.watchers[2].alerts.values_list('miles', flat=True)), [8000])
+
+    def test_failed_searches_record_no_alert(self):
+        bulk = AsyncMock(return_value=[{'error': 'timeout'}, self.response(7000)])
+        with patch.object(self.service.client, 'search_flights_bulk', bulk):
+            counts = self.checker.check(self.today)
+
+        self.assertEqual(counts, {'checked': 1, 'failed': 1, 'alerts': 0, 'groups': 2})
+        self.assertFalse(PriceAlert.objects.exists())
+
+    def test_failed_searches_are_retried_first(self):
+        self.checker.budget = 1
+        bulk = AsyncMock(return_value=[{'error': 'timeout'}])
+        with patch.object(self.service.client, 'search_flights_bulk', bulk):
+            self.checker.check(self.today)
+
+        self.assertFalse(Watch.objects.filter(last_checked_at__isnull=False).exists())
+        _, retry = self.check()
+        self.assertEqual(retry.await_args.args[0][0]['origin'], 'GRU')
+
+    def test_budget_rotates_through_the_groups(self):
+        self.checker.budget = 1
+
+        _, first = self.check()
+        _, second = self.check()
+
+        self.assertEqual(first.await_args.args[0][0]['origin'], 'GRU')
+        self.assertEqual(second.await_args.args[0][0]['origin'], 'CNF')
+
+    def test_command(self):
+        out, err = StringIO(), StringIO()
+        with patch.object(FlightAPIClient, 'search_flights_bulk', AsyncMock(side_effect=self.fake_bulk)):
+            call_command('check_watches', stdout=out, stderr=err)
+
+        self.assertIn('Searched 2 routes and dates. Checked: 2, failed: 0, alerts: 2.', out.getvalue())
+        self.assertIn('FLIGHT_API_RATE_LIMIT_CACHE', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('check_watches', '--budget', '0', stdout=StringIO())
+
+    @override_settings(FLIGHT_API_RATE_LIMIT=10, FLIGHT_API_RATE_LIMIT_BURST=10, FLIGHT_WATCH_RATE_SHARE=0.1)
+    @patch('aiohttp.ClientSession.get')
+    def test_checks_use_only_their_share_of_the_rate(self, mock_get):
+        mock_get.return_value = MockAiohttpResponse(self.response(9000))
+        client = WatchChecker().service.client
+
+        self.assertEqual((client.share_limiter.rate, client.share_limiter.capacity), (1, 1))
+        with patch.object(client.share_limiter, 'acquire', new_callable=AsyncMock) as acquire, \
+                patch.object(TokenBucket, 'acquire_spare', new_callable=AsyncMock) as acquire_spare:
+            asyncio.run(client.search_flights_bulk([
+                {'origin': 'GRU', 'destination': 'LIS', 'departure_date': self.day},
+                {'origin': 'CNF', 'destination': 'GRU', 'departure_date': self.day},
+            ]))
+        FlightAPIClient.close_all_sessions()
+
+        self.assertEqual(acquire.await_count, 2)
+        self.assertEqual(acquire_spare.await_count, 2)
@@ -0,0 +1,196 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that paces calls to a given rate.
+
+    The bucket is not bound to any event loop, so a single instance can be shared
+    by every search in the process regardless of which loop issues it.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the bucket full.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens the bucket holds (burst size).
+            clock: Monotonic clock returning seconds.
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("Rate and capacity must be positive.")
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """
+        Takes tokens from the bucket, borrowing against future refills if needed.
+
+        Args:
+            tokens: Number of tokens to take.
+
+        Returns:
+            How many seconds the caller must wait before the tokens are available.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """
+        Waits until the requested tokens are available.
+
+        Args:
+            tokens: Number of tokens to take.
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def reserve_spare(self, tokens: float = 1, keep: float = 0) -> float:
+        """
+        Takes tokens only if at least `keep` tokens remain in the bucket afterwards.
+
+        Unlike `reserve`, it never borrows, so callers using it yield to those using
+        `reserve`, whose borrowing leaves no spare tokens until it is paid back.
+
+        Args:
+            tokens: Number of tokens to take.
+            keep: Tokens left for other callers, capped so the request fits the bucket.
+
+        Returns:
+            0 if the tokens were taken, otherwise how many seconds to wait before trying again.
+        """
+        keep = min(keep, self.capacity - tokens)
+        with self._lock:
+            self._refill()
+            missing = tokens + keep - self._tokens
+            # Ignores rounding errors, which would otherwise have callers sleep for nothing.
+            if missing <= 1e-9:
+                self._tokens -= tokens
+                return 0.0
+            return missing / self.rate
+
+    async def acquire_spare(self, tokens: float = 1, keep: float = 0) -> None:
+        """
+        Waits until the requested tokens can be taken while leaving `keep` in the bucket.
+
+        Args:
+            tokens: Number of tokens to take.
+            keep: Tokens left for other callers.
+        """
+        while True:
+            delay = self.reserve_spare(tokens, keep)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+
+class SharedRateLimiter:
+    """
+    Rate limiter whose budget is kept in one of Django's caches, shared by every process using it.
+
+    Requests are counted per window of wall-clock time in a counter the cache increments
+    atomically, so the web server, `prefetch_routes` and `check_watches` draw from a
+    single budget instead of each pacing itself. The cache must be shared by those
+    processes and increment atomically, such as Redis or Memcached.
+    """
+
+    KEY_PREFIX = 'flights:rate_limit'
+
+    def __init__(
+        self,
+        alias: str,
+        rate: float,
+        window: float = 1.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            alias: The alias from CACHES holding the counters.
+            rate: Requests allowed per second, across every process.
+            window: Seconds each counter covers, lengthened so it allows at least one request.
+            clock: Wall-clock time in seconds, the same in every process.
+        """
+        if rate <= 0 or window <= 0:
+            raise ValueError("Rate and window must be positive.")
+        self.alias = alias
+        self.rate = rate
+        self.window = max(window, 1 / rate)
+        self.limit = self.rate * self.window
+        self.clock = clock
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def reserve(self, keep: float = 0) -> float:
+        """
+        Takes a request from the current window if at least `keep` requests remain in it afterwards.
+
+        Args:
+            keep: Requests left for other callers, capped so one request fits the window.
+
+        Returns:
+            0 if the request was taken, otherwise how many seconds to wait for the next window.
+        """
+        keep = min(keep, self.limit - 1)
+        now = self.clock()
+        window = math.floor(now / self.window)
+        key = f'{self.KEY_PREFIX}:{window}'
+        cache = self.cache
+        timeout = math.ceil(self.window) + 1
+        # The async methods of Django's caches don't increment atomically, unlike `incr`.
+        cache.add(key, 0, timeout=timeout)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # The counter expired since it was added, so this is the first request.
+            cache.add(key, 1, timeout=timeout)
+            return 0.0
+        if count + keep <= self.limit:
+            return 0.0
+        # Given back, so refused requests don't eat into the budget of the others.
+        cache.decr(key)
+        return (window + 1) * self.window - now
+
+    async def acquire(self, keep: float = 0) -> None:
+        """
+        Waits until a request can be taken while leaving `keep` in its window.
+
+        The cache is called from a worker thread, so the event loop never waits on it.
+        """
+        reserve = sync_to_async(self.reserve, thread_sensitive=False)
+        while True:
+            delay = await reserve(keep)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
@@ -0,0 +1,216 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional['SearchTimings']] = ContextVar('flights_search_timings', default=None)
+
+
+class SearchTimings:
+    """
+    Durations of the phases of one search, such as DNS, connecting, waiting on the
+    upstream server, decoding and parsing.
+
+    Each span name accumulates its total time, number of occurrences and longest
+    occurrence. Spans of concurrent requests overlap, so their totals may add up to
+    more than the search's wall-clock time.
+    """
+
+    def __init__(self, name: str, clock: Callable[[], float] = time.perf_counter):
+        """
+        Start timing a search.
+
+        Args:
+            name: What is searched, such as 'search' or 'calendar', shown in the logs.
+            clock: Clock returning seconds.
+        """
+        self.name = name
+        self.clock = clock
+        self.started = clock()
+        self.finished: Optional[float] = None
+        # span name: [total seconds, count, longest seconds]
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, span: str, seconds: float) -> None:
+        """
+        Records one occurrence of a span.
+        """
+        entry = self.spans.get(span)
+        if entry is None:
+            self.spans[span] = [seconds, 1, seconds]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] = max(entry[2], seconds)
+
+    def finish(self) -> None:
+        """
+        Stops the search's wall-clock time.
+        """
+        if self.finished is None:
+            self.finished = self.clock()
+
+    @property
+    def total(self) -> float:
+        return (self.finished if self.finished is not None else self.clock()) - self.started
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns the timings as a JSON-serializable dictionary, in milliseconds.
+        """
+        return {
+            'search': self.name,
+            'total_ms': round(self.total * 1000, 3),
+            'spans': {
+                span: {'ms': round(total * 1000, 3), 'count': count, 'max_ms': round(longest * 1000, 3)}
+                for span, (total, count, longest) in self.spans.items()
+            },
+        }
+
+    def format(self) -> str:
+        """
+        Returns the timings on one line, for the logs.
+        """
+        spans = ' '.join(
+            f'{span}={total * 1000:.1f}ms/{count}' for span, (total, count, _) in self.spans.items()
+        )
+        return f'{self.name} total={self.total * 1000:.1f}ms {spans}'.rstrip()
+
+    def server_timing(self) -> str:
+        """
+        Returns the timings as the value of a Server-Timing header.
+        """
+        metrics = [f'total;dur={self.total * 1000:.1f}']
+        metrics.extend(f'{span};dur={total * 1000:.1f}' for span, (total, _, _) in self.spans.items())
+        return ', '.join(metrics)
+
+
+def timing_mode() -> Optional[str]:
+    """
+    Returns the FLIGHT_SEARCH_TIMINGS setting: None (off), 'log' or 'response'.
+    """
+    return getattr(settings, 'FLIGHT_SEARCH_TIMINGS', None) or None
+
+
+def current_timings() -> Optional[SearchTimings]:
+    """
+    Returns the timings of the search running in the current context, if timed.
+    """
+    return _current.get()
+
+
+@contextmanager
+def collect_timings(name: str) -> Iterator[Optional[SearchTimings]]:
+    """
+    Times the search run inside the block, if FLIGHT_SEARCH_TIMINGS is set, and logs it.
+
+    Spans recorded anywhere in the block, including in tasks it starts, are added
+    to the search's timings.
+
+    Args:
+        name: What is searched, shown in the logs.
+
+    Yields:
+        The SearchTimings, or None if timing is off.
+    """
+    if timing_mode() is None:
+        yield None
+        return
+    timings = SearchTimings(name)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from another context, as when an abandoned stream is finalized.
+            pass
+        timings.finish()
+        logger.info(timings.format())
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Adds the duration of the block to the current search's timings, if it is timed.
+    """
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = timings.clock()
+    try:
+        yield
+    finally:
+        timings.add(name, timings.clock() - started)
+
+
+def count(name: str) -> None:
+    """
+    Records an event without duration, such as a cache hit, in the current search's timings.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, 0.0)
+
+
+def timed(name: str, function: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Returns the function wrapped so that each call is a span of the current search.
+    """
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def build_trace_config() -> aiohttp.TraceConfig:
+    """
+    Returns aiohttp tracing hooks adding each request's phases to the current search's timings.
+
+    The spans are 'queued' (waiting for a free connection), 'dns', 'connect' (TCP and
+    TLS handshakes of new connections, which aiohttp doesn't time apart), 'server'
+    (from the request sent to the response headers received) and 'request' (the
+    whole request, up to the response headers). Reused connections are counted as
+    'reused_connection'.
+    """
+    def start(name: str):
+        async def hook(session: aiohttp.ClientSession, context: SimpleNamespace, params: Any) -> None:
+            timings = _current.get()
+            if timings is not None:
+                setattr(context, name, timings.clock())
+        return hook
+
+    def end(name: str, started: Optional[str] = None):
+        async def hook(session: aiohttp.ClientSession, context: SimpleNamespace, params: Any) -> None:
+            timings = _current.get()
+            start_time = getattr(context, started or name, None)
+            if timings is not None and start_time is not None:
+                timings.add(name, timings.clock() - start_time)
+        return hook
+
+    async def on_reuse(session: aiohttp.ClientSession, context: SimpleNamespace, params: Any) -> None:
+        count('reused_connection')
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(start('request'))
+    trace_config.on_request_end.append(end('request'))
+    trace_config.on_request_exception.append(end('request'))
+    trace_config.on_connection_queued_start.append(start('queued'))
+    trace_config.on_connection_queued_end.append(end('queued'))
+    trace_config.on_dns_resolvehost_start.append(start('dns'))
+    trace_config.on_dns_resolvehost_end.append(end('dns'))
+    trace_config.on_connection_create_start.append(start('connect'))
+    trace_config.on_connection_create_end.append(end('connect'))
+    trace_config.on_connection_reuseconn.append(on_reuse)
+    trace_config.on_request_headers_sent.append(start('server'))
+    trace_config.on_request_end.append(end('server'))
+    return trace_config
@@ -3,4 +3,9 @@ from . import views
 
 urlpatterns = [
     path('', views.search_flights, name='search_flights'),
+    path('results/<uuid:search_id>/', views.search_results, name='search_results'),
+    path('stream/', views.stream_flights, name='stream_flights'),
+    path('calendar/', views.fare_calendar, name='fare_calendar'),
+    path('airports/autocomplete/', views.airport_autocomplete, name='airport_autocomplete'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
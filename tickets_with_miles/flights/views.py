@@ -1,58 +1,397 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect
-from django.http import HttpRequest, HttpResponse
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib import messages
+from django.template.loader import render_to_string
 from django.urls import reverse
-from .forms import FlightSearchForm
+from django.utils.cache import patch_cache_control
+from datetime import date
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+from .autocomplete import get_airport_autocomplete
+from .forms import FareCalendarForm, FlightSearchForm
+from .metrics import REGISTRY, VIEW_LATENCY, flexibility_bucket, metrics_enabled
+from .results import SearchResultStore
 from .services import FlightService
+from .timing import SearchTimings, collect_timings, timing_mode
+import json
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 
-def search_flights(request: HttpRequest) -> HttpResponse:
+AIRPORT_AUTOCOMPLETE_MAX_AGE = 3600  # seconds
+
+async def search_flights(request: HttpRequest) -> HttpResponse:
     """
     Handles flight search requests and renders the search results.
 
+    The view is asynchronous so the upstream searches are awaited on the server's
+    event loop instead of blocking a worker thread. Successful searches are stored
+    under a search ID and the user is redirected to their results page.
+
     Args:
         request: The HttpRequest object.
 
     Returns:
         An HttpResponse object with the rendered template.
     """
-    form = FlightSearchForm(request.POST or None)
-    flights = request.session.pop('flights', [])
+    started = perf_counter()
+    # The form of the results page submits without JavaScript as a GET, filling this one in.
+    form = FlightSearchForm(request.POST or None, initial=request.GET.dict())
+    flights = []
+    timings = None
 
     if request.method == 'POST':
-        if form.is_valid():
+        # Validation queries the Airport table, which must run outside the event loop.
+        if await sync_to_async(form.is_valid)():
             origin = form.cleaned_data['origin'].upper()
             destination = form.cleaned_data['destination'].upper()
             departure_date = form.cleaned_data['date']
             flexibility = int(form.cleaned_data['flexibility'])
+            return_date = form.cleaned_data.get('return_date')
+            return_flexibility = form.cleaned_data.get('return_flexibility') or 0
+            limit = results_limit(form)
 
             flight_service = FlightService()
 
-            try:
-                flights = flight_service.get_flights(origin, destination, departure_date, flexibility)
-                if not flights:
-                    messages.warning(request, 'Nenhum voo encontrado.')
-                else:
-                    request.session['flights'] = flights
-                    return redirect(reverse('search_flights'))
-            except Exception as e:
-                logger.error(f"Erro ao buscar voos: {e}")
-                messages.error(request, 'Ocorreu um erro ao pesquisar pelos voos.')
+            with collect_timings('search') as timings:
+                try:
+                    if return_date:
+                        flights = await flight_service.get_round_trips(
+                            origin, destination, departure_date, flexibility,
+                            return_date, return_flexibility, limit=limit,
+                        )
+                    else:
+                        flights = await flight_service.get_flights_internal(
+                            origin, destination, departure_date, flexibility, limit=limit
+                        )
+                    if not flights:
+                        messages.warning(request, 'Nenhum voo encontrado.')
+                    else:
+                        search = {
+                            'origin': origin,
+                            'destination': destination,
+                            'date': departure_date.isoformat(),
+                            'flexibility': flexibility,
+                        }
+                        if return_date:
+                            search['return_date'] = return_date.isoformat()
+                            search['return_flexibility'] = return_flexibility
+                        search_id = await SearchResultStore().save(search, flights)
+                        response = redirect(reverse('search_results', args=[search_id]))
+                        return attach_timings(response, timings)
+                except Exception as e:
+                    logger.error(f"Erro ao buscar voos: {e}")
+                    messages.error(request, 'Ocorreu um erro ao pesquisar pelos voos.')
+                finally:
+                    VIEW_LATENCY.observe(perf_counter() - started, 'search', flexibility_bucket(flexibility))
         else:
             if form.errors:
                 logger.warning(f"Form validation failed: {form.errors}")
-                unique_messages = set()
-                for field, errors in form.errors.items():
-                    for error in errors:
-                        unique_message = f"{field.capitalize()}: {error}"
-                        if unique_message not in unique_messages:
-                            unique_messages.add(unique_message)
-                            messages.error(request, unique_message)
+                for message in form_error_messages(form):
+                    messages.error(request, message)
 
     context = {
         'form': form,
         'flights': flights,
     }
-    return render(request, 'flights/search.html', context)
\ No newline at end of file
+    return attach_timings(render(request, 'flights/search.html', context), timings)
+
+
+async def search_results(request: HttpRequest, search_id: uuid.UUID) -> HttpResponse:
+    """
+    Renders the stored results of a previous search.
+
+    Args:
+        request: The HttpRequest object.
+        search_id: The ID the results were stored under.
+
+    Returns:
+        An HttpResponse with the results, or a redirect to the search page if they expired.
+    """
+    store = SearchResultStore()
+    stored = await store.load(search_id)
+    if stored is None:
+        messages.warning(request, 'Esta busca expirou. Faça uma nova pesquisa.')
+        return redirect(reverse('search_flights'))
+
+    context = {
+        'form': FlightSearchForm(initial=stored['search']),
+        'flights': stored['flights'],
+        'round_trips': stored['round_trips'],
+        # The page is cached, so it carries no CSRF token: its form searches with GET requests.
+        'cacheable': True,
+    }
+    response = render(request, 'flights/search.html', context)
+    # The results under an ID never change, so the browser may reuse them until they expire.
+    patch_cache_control(response, private=True, max_age=stored['expires_in'])
+    return response
+
+
+async def stream_flights(request: HttpRequest) -> StreamingHttpResponse:
+    """
+    Streams the results of a flight search as server-sent events.
+
+    Each upstream response is sent as soon as it arrives, as a 'flights' event with
+    the rendered cards of that date, so the page can show the fastest dates first
+    and keep its list sorted by miles. A 'done' event closes the stream, with the
+    search's timings when FLIGHT_SEARCH_TIMINGS is 'response'.
+
+    Args:
+        request: The HttpRequest object, with the search form fields in the query string.
+
+    Returns:
+        A StreamingHttpResponse with content type text/event-stream.
+    """
+    form = FlightSearchForm(request.GET)
+    if await sync_to_async(form.is_valid)():
+        if form.cleaned_data.get('return_date'):
+            events = stream_round_trip_events(
+                form.cleaned_data['origin'].upper(),
+                form.cleaned_data['destination'].upper(),
+                form.cleaned_data['date'],
+                int(form.cleaned_data['flexibility']),
+                form.cleaned_data['return_date'],
+                form.cleaned_data.get('return_flexibility') or 0,
+                results_limit(form),
+            )
+        else:
+            events = stream_search_events(
+                form.cleaned_data['origin'].upper(),
+                form.cleaned_data['destination'].upper(),
+                form.cleaned_data['date'],
+                int(form.cleaned_data['flexibility']),
+                results_limit(form),
+            )
+    else:
+        logger.warning(f"Form validation failed: {form.errors}")
+        events = stream_error_events(form_error_messages(form))
+
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def stream_search_events(
+    origin: str,
+    destination: str,
+    departure_date: date,
+    flexibility: int,
+    limit: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """
+    Yields the server-sent events of a search, one per searched date.
+
+    With a limit, each event only carries the flights entering the cheapest `limit`
+    found so far, and the page drops the cards pushed past the limit.
+    """
+    started = perf_counter()
+    flight_service = FlightService()
+    total = 0
+    with collect_timings('stream') as timings:
+        try:
+            async for search_date, flights in flight_service.stream_flights(
+                origin, destination, departure_date, flexibility, limit=limit
+            ):
+                total += len(flights)
+                yield format_event('flights', {
+                    'date': search_date.isoformat(),
+                    'limit': limit,
+                    'flights': [
+                        {
+                            'miles_cost': flight['miles_cost'],
+                            'html': render_to_string('flights/flight_card.html', {'flight': flight}),
+                        }
+                        for flight in flights
+                    ],
+                })
+        except Exception as e:
+            logger.error(f"Erro ao buscar voos: {e}")
+            yield format_event('search-error', {'messages': ['Ocorreu um erro ao pesquisar pelos voos.']})
+        else:
+            if not total:
+                yield format_event('search-error', {'messages': ['Nenhum voo encontrado.']})
+        if limit is not None:
+            total = min(total, limit)
+        VIEW_LATENCY.observe(perf_counter() - started, 'stream', flexibility_bucket(flexibility))
+        yield format_event('done', done_event(total, timings))
+
+
+async def stream_round_trip_events(
+    origin: str,
+    destination: str,
+    departure_date: date,
+    flexibility: int,
+    return_date: date,
+    return_flexibility: int,
+    limit: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """
+    Yields the server-sent events of a round-trip search.
+
+    Round trips can only be paired once both ways arrived, so they are sent in a
+    single 'flights' event, cheapest first.
+    """
+    started = perf_counter()
+    with collect_timings('stream') as timings:
+        try:
+            round_trips = await FlightService().get_round_trips(
+                origin, destination, departure_date, flexibility, return_date, return_flexibility, limit=limit
+            )
+        except Exception as e:
+            logger.error(f"Erro ao buscar voos: {e}")
+            yield format_event('search-error', {'messages': ['Ocorreu um erro ao pesquisar pelos voos.']})
+            round_trips = []
+        else:
+            if round_trips:
+                yield format_event('flights', {
+                    'date': departure_date.isoformat(),
+                    'limit': limit,
+                    'flights': [
+                        {
+                            'miles_cost': trip.miles_cost,
+                            'html': render_to_string('flights/round_trip_card.html', {'trip': trip}),
+                        }
+                        for trip in round_trips
+                    ],
+                })
+            else:
+                yield format_event('search-error', {'messages': ['Nenhum voo encontrado.']})
+        VIEW_LATENCY.observe(perf_counter() - started, 'stream', flexibility_bucket(flexibility))
+        yield format_event('done', done_event(len(round_trips), timings))
+
+
+async def stream_error_events(error_messages: List[str]) -> AsyncIterator[str]:
+    """
+    Yields the server-sent events of a search rejected by validation.
+    """
+    yield format_event('search-error', {'messages': error_messages})
+    yield format_event('done', {'total': 0})
+
+
+async def fare_calendar(request: HttpRequest) -> JsonResponse:
+    """
+    Returns the cheapest fare of each day of a window, for a route.
+
+    Args:
+        request: The HttpRequest object, with 'origin', 'destination', 'date' (the first
+            day) and optionally 'days' in the query string.
+
+    Returns:
+        A JsonResponse with one entry per day under 'days', or the validation
+        errors under 'errors' with status 400.
+    """
+    started = perf_counter()
+    form = FareCalendarForm(request.GET)
+    if not await sync_to_async(form.is_valid)():
+        return JsonResponse({'errors': form_error_messages(form)}, status=400)
+
+    origin = form.cleaned_data['origin']
+    destination = form.cleaned_data['destination']
+    with collect_timings('calendar') as timings:
+        try:
+            days = await FlightService().fare_calendar(
+                origin, destination, form.cleaned_data['date'], form.cleaned_data['days']
+            )
+        except Exception as e:
+            logger.error(f"Erro ao montar o calendário de tarifas: {e}")
+            response = JsonResponse({'errors': ['Ocorreu um erro ao pesquisar pelos voos.']}, status=502)
+        else:
+            response = JsonResponse({
+                'origin': origin,
+                'destination': destination,
+                'days': [day.to_dict() for day in days],
+            })
+        # The calendar's window of days plays the part of the flexibility.
+        VIEW_LATENCY.observe(perf_counter() - started, 'calendar', flexibility_bucket(form.cleaned_data['days']))
+        return attach_timings(response, timings)
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    """
+    Exposes the metrics of this process in the Prometheus text format.
+
+    Each process keeps its own metrics, so with several workers every one of them
+    must be scraped, for example on its own port.
+
+    Args:
+        request: The HttpRequest object.
+
+    Returns:
+        An HttpResponse with the metrics.
+
+    Raises:
+        Http404: If FLIGHT_METRICS_ENABLED is off.
+    """
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(REGISTRY.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+async def airport_autocomplete(request: HttpRequest) -> JsonResponse:
+    """
+    Suggests airports matching the text typed in the origin or destination fields.
+
+    Args:
+        request: The HttpRequest object, with the typed text in the 'q' query parameter.
+
+    Returns:
+        A JsonResponse with the best matching airports under 'results'.
+    """
+    query = request.GET.get('q', '')
+    # The first call builds the index from the Airport table, outside the event loop.
+    autocomplete = await sync_to_async(get_airport_autocomplete)()
+    response = JsonResponse({'results': autocomplete.search(query)})
+    patch_cache_control(response, public=True, max_age=AIRPORT_AUTOCOMPLETE_MAX_AGE)
+    return response
+
+
+def format_event(event: str, data: Any) -> str:
+    """
+    Formats a server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def done_event(total: int, timings: Optional[SearchTimings]) -> Dict[str, Any]:
+    """
+    Returns the data of a stream's 'done' event, with the search's timings when
+    FLIGHT_SEARCH_TIMINGS is 'response'.
+    """
+    data = {'total': total}
+    if timings is not None and timing_mode() == 'response':
+        data['timings'] = timings.summary()
+    return data
+
+
+def attach_timings(response: HttpResponse, timings: Optional[SearchTimings]) -> HttpResponse:
+    """
+    Adds the search's timings to the response as a Server-Timing header, shown by the
+    browser's developer tools, when FLIGHT_SEARCH_TIMINGS is 'response'.
+    """
+    if timings is not None and timing_mode() == 'response':
+        response['Server-Timing'] = timings.server_timing()
+    return response
+
+
+def results_limit(form: FlightSearchForm) -> Optional[int]:
+    """
+    Returns the number of flights to show: the one requested, or FLIGHT_SEARCH_RESULTS_LIMIT.
+    """
+    return form.cleaned_data.get('limit') or getattr(settings, 'FLIGHT_SEARCH_RESULTS_LIMIT', None)
+
+
+def form_error_messages(form: FlightSearchForm) -> List[str]:
+    """
+    Returns the form errors as unique messages prefixed by the field name.
+    """
+    unique_messages = []
+    for field, errors in form.errors.items():
+        for error in errors:
+            unique_message = f"{field.capitalize()}: {error}"
+            if unique_message not in unique_messages:
+                unique_messages.append(unique_message)
+    return unique_messages
@@ -0,0 +1,186 @@
+import asyncio
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.db.models.functions import Trim, Upper
+from django.utils import timezone
+
+from .api_client import FlightAPIClient
+from .cache import get_search_cache
+from .fare_history import get_fare_history
+from .models import PriceAlert, Watch
+from .records import FareCalendarDay
+from .services import FlightService
+
+class WatchChecker:
+    """
+    Re-checks the active watches and records an alert for each one whose fare dropped enough.
+
+    Watches are grouped by route and date in the database, and each group is searched
+    once, however many users watch it, so a run costs one upstream search per
+    distinct route and date. Groups checked least recently go first, up to the budget,
+    so every group is checked in turn when there are more than a run can search, and
+    groups whose search failed are retried first in the next run.
+    Like the cache prefetcher, the client only takes spare tokens from the rate limiter,
+    and never more than its share of the rate. Since `check_watches` runs in a process
+    of its own, the budget is only shared with the web server through the cache named by
+    FLIGHT_API_RATE_LIMIT_CACHE.
+    """
+
+    DEFAULT_BUDGET = 200  # upstream searches per run
+    DEFAULT_RATE_LIMIT_KEEP = 5  # tokens of the rate limiter left for interactive searches
+    DEFAULT_RATE_LIMIT_SHARE = 0.2  # fraction of the rate limit checking uses at most
+
+    def __init__(self, service: Optional[FlightService] = None, budget: Optional[int] = None):
+        """
+        Initialize the checker.
+
+        Args:
+            service: Service searching the fares, by default one whose client is backed
+                by the process-wide search cache and fare history, leaves tokens to
+                interactive searches and is limited to FLIGHT_WATCH_RATE_SHARE of the rate limit.
+            budget: Maximum number of groups searched per run.
+        """
+        self.service = service or FlightService(FlightAPIClient(
+            cache=get_search_cache(),
+            rate_limit_keep=getattr(settings, 'FLIGHT_WATCH_RATE_LIMIT_KEEP', self.DEFAULT_RATE_LIMIT_KEEP),
+            rate_limit_share=getattr(settings, 'FLIGHT_WATCH_RATE_SHARE', self.DEFAULT_RATE_LIMIT_SHARE),
+            fare_history=get_fare_history(),
+        ))
+        self.budget = budget if budget is not None else getattr(settings, 'FLIGHT_WATCH_BUDGET', self.DEFAULT_BUDGET)
+
+    def plan(self, today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Returns the groups of active watches to search in this run, least recently checked first.
+
+        Watches of past dates are deactivated first, and airport codes not yet
+        uppercased are, so each route is searched as one group.
+
+        Args:
+            today: The current date, by default today.
+
+        Returns:
+            One dictionary per group, with its 'origin', 'destination', 'flight_date',
+            number of 'watchers' and largest 'max_miles'.
+        """
+        today = today or timezone.localdate()
+        Watch.objects.filter(active=True, flight_date__lt=today).update(active=False)
+        # Watches saved one by one are normalized by Watch.save, but not those bulk created.
+        origin, destination = Upper(Trim('origin')), Upper(Trim('destination'))
+        Watch.objects.filter(active=True).exclude(origin=origin, destination=destination).update(
+            origin=origin, destination=destination
+        )
+        groups = (
+            Watch.objects.filter(active=True)
+            .values('origin', 'destination', 'flight_date')
+            .annotate(watchers=Count('id'), max_miles=Max('max_miles'), last_checked_at=Min('last_checked_at'))
+            # Never checked first, then the least recently checked, then the nearest dates.
+            .order_by(F('last_checked_at').asc(nulls_first=True), 'flight_date', 'origin', 'destination')
+        )
+        return list(groups[:self.budget])
+
+    async def search(self, groups: List[Dict[str, Any]]) -> List[Optional[FareCalendarDay]]:
+        """
+        Searches the groups in one bulk search and reduces each response to its cheapest fare.
+
+        Returns:
+            The cheapest fare of each group, in order, without fare if no flight has one,
+            or None if the search failed.
+        """
+        searches = [
+            self.service.build_search(group['origin'], group['destination'], group['flight_date']) for group in groups
+        ]
+        responses = await self.service.client.search_flights_bulk(searches)
+        days = []
+        for search, response in zip(searches, responses):
+            if 'error' in response:
+                days.append(None)
+                continue
+            days.append(self.service.summarize_day(search['departure_date'], response))
+        return days
+
+    def record(
+        self,
+        groups: List[Dict[str, Any]],
+        days: List[Optional[FareCalendarDay]],
+        now: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """
+        Records the alerts of the groups' watchers whose threshold the cheapest fare meets.
+
+        A watcher is alerted when the fare is at or below its `max_miles` and cheaper
+        than the fare of its previous alert, if any. Only the watchers of groups whose
+        fare is at or below the group's largest threshold are read from the database.
+        Groups whose search failed aren't marked as checked, so the next run retries them first.
+
+        Args:
+            groups: The groups searched, as returned by `plan`.
+            days: The cheapest fare of each group, as returned by `search`.
+            now: Time of the check, by default now.
+
+        Returns:
+            The number of groups 'checked' and 'failed', and of 'alerts' recorded.
+        """
+        now = now or timezone.now()
+        counts = dict.fromkeys(('checked', 'failed', 'alerts'), 0)
+        with transaction.atomic():
+            for group, day in zip(groups, days):
+                watches = Watch.objects.filter(
+                    active=True,
+                    origin=group['origin'],
+                    destination=group['destination'],
+                    flight_date=group['flight_date'],
+                )
+                if day is None:
+                    counts['failed'] += 1
+                    continue
+                watches.update(last_checked_at=now)
+                counts['checked'] += 1
+                if day.miles_cost is None or day.miles_cost > group['max_miles']:
+                    continue
+
+                triggered = list(
+                    watches.filter(max_miles__gte=day.miles_cost)
+                    .filter(Q(alerted_miles__isnull=True) | Q(alerted_miles__gt=day.miles_cost))
+                    .values_list('id', flat=True)
+                )
+                if not triggered:
+                    continue
+                PriceAlert.objects.bulk_create([
+                    PriceAlert(
+                        watch_id=watch_id,
+                        miles=day.miles_cost,
+                        airline=day.airline or '',
+                        stops=day.number_of_stops,
+                        triggered_at=now,
+                    )
+                    for watch_id in triggered
+                ])
+                Watch.objects.filter(id__in=triggered).update(alerted_miles=day.miles_cost)
+                counts['alerts'] += len(triggered)
+        return counts
+
+    def check(self, today: Optional[date] = None) -> Dict[str, int]:
+        """
+        Runs one round of checks: plans the groups, searches them and records the alerts.
+
+        Args:
+            today: The current date, by default today.
+
+        Returns:
+            The counts of `record`, plus the number of 'groups' searched.
+        """
+        groups = self.plan(today)
+        days = asyncio.run(self.run_search(groups)) if groups else []
+        counts = self.record(groups, days)
+        counts['groups'] = len(groups)
+        return counts
+
+    async def run_search(self, groups: List[Dict[str, Any]]) -> List[Optional[FareCalendarDay]]:
+        try:
+            return await self.search(groups)
+        finally:
+            await FlightAPIClient.close_session()
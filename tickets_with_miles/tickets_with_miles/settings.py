@@ -127,3 +127,95 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Keys to flights api call
 FLIGHT_API_KEY = 'aJqPU7xNHl9qN3NVZnPaJ208aPo2Bh2p2ZV844tw'
 AKAMAI_TELEMETRY = 'a=&&&e=cGw5cDZYcVY5b2Vib1Nmc3pSOVpwTkoveXFkL3hQdkM3UWMwcUNGd2JaMmtDN3J6N3JIZ3l2YThCeW5lcjRqT29GVFRzRkM3L25BUU9iL2NFRFF3Qy9ibGJWSFJUdHZhbWxjc0hQc3Mrd1J6b1gvRUNPTEQ5NmtkNzN4UnFLNVZqZzJaejRMemt1cE44b2QvUlFsM2gzZDgxck1OMHpsVWlkUnJrdjRRV3JCd0ZYcXhvV291bXBacnZxcStDRzBLT2w=&&&sensor_data=Mjs4ODg4ODg4Ozc3Nzc3Nzc7MzAsMSwwLDAsNCwzNTtdJlosWm4mMXEzOGgqbEkqQzpfNzNQMSM9dGQjM1I1KDVlZkB9Nk8yJVtJI1RSXUReP0BzI0E7QjpXMHBuV1tWXj1JIF8rOTN+PHktOislJXlDeFheJSMrL1E1bSV2cGsjdChJM19CfHs9S29qaDUtc3A/dDJhV15+UDF9cFJaLTEgM3NpL3RQVnk5I21aNzclJFU4WjU9OV5WUUdIe1kzd35Kb2k6KXJgZChPVEMpW2tqRix4b0lSRzwvKEwjeGxsfT5aIT8lLThoP0MhOHQ3ei9sZD1ib25BSF1lZnVOdkw2TjYzZy5xU1J9Zk4/a0JzeGVmKWggOXJBSU4jaDRUdDNCbyFkeH4uaE1dLUJAUVNjT1ErcXlAe2RuZzZHaStSeWlwe2dYXiBbPTMhSj9gYzdwYkxIWmpVVVddfktofWt7a3B+dXVzcFs3c18jIz9Fb3FmYEhvKHhxJSZecU5uP14+RGM/R1opfSNmcC5fWHAmL0RKc0ZselRxJFZHJCA0JVNBLyAmRGdeU2c7N0lBJXNQP1Z7TFFvd1lwR01eVkFBRl17RHtNRj1gWFIrQ21UJFtNd293SkVFQ1U6WVElKDt0RHhWZztsaWdKMmAsYyNYX34mdVUzRUA+W2pAPXUuQUVwOEFMYDU5OGJFUHVPSUVlVyxmdHNXaTFkQHpDJHZdaTNod15rVi1XIUxJdCZPZFB8fC9wVGBuQXZkTkR7e2BOe15sdnBPaGA/ZlFpUSNpKV1jLGROb3JaL3hpY2pRQz1aPFl6YENlbz8uMHFOK201M0xaSC1NViBqc1ZVeGV3I2F0d3sodzo9QjklLSx0LChTX3psWDwoIWUhPU14U3p0biRGc19HIC9hU09HPndxRStCa2RTfGhQP0I3JkF3aHRUPyVyPDN9OXd6OiNxZ25gfkZjICtZKnIvTj5YYTkyOzIoRSApJlR0aEc+Kj9BcllSMENDQn5HVjE/RWNtLjFDMjJ1MjlJNkA0fXxsIzJqV0wjSWJlO31yWnl9SUtydj4sLFY/WHcxbmdNSlFXTFZDQG9EUWlKKCpFPUZ9R1RVfnV8U0FTZ0MhdnJMPmEqN1tLJkRRZig4Zzhja3JXUTxRYjtMXVBdTVZ+UF46eiVlWTRKemoyfTI4b3UmVXBIWlc7QCpKXllDe116NkNobzV+LW5hfkhbfWU7PSZlVS50RFhtYlZHcSlASHxIc3F1PDl8a1NJUURXSCwsJWQoYigufWAwJHVncCozRi1BeCFCT19JTnc+Oy1RZz9oVSliMmIjSVYwaDUzITpJICptb0hUelVrO2lhXitndykqRzo4ayRTTVMrY1NbenpafWhbQE8uWmRFISktTndUKXNQUnBXIElSVz1wcXEwSy9VeytLbj5XaDwrMi9bMm1JUz58WEJkPVByNiAlLWFnSHNuemEgSFVNOiQyM3k7OX0wTU8pc0UmQUMwai8xaSluPXVJMlcrL0wgciY1I1VJISZre3hGLGh0NnRrJCtfLm51cnZMcSw/UG5bcSl4ZzcwMngla3Q+LT1nWEZrOlMhdkY2Z0pocys/PTVKd1k1OyYxLEB4JmpoYzYveEhkOHNyPzh5fUZ6O3N3XSpNN28gLCAlOH00aGAsWWBNfEF+YEg4JltDM3E+WGBxRHJqWFFmQ0RnYC19cVppZlBzOCB3PElKPEE1JHxfcHg8dG90KzFJVWgzaUpLdEV0IVQ8dGJrOH1wflhiKio5OnVMTzFXY30qTEtlV18/c3sobTghen4xIHgtbWY7JD5OOWRFQn5WKCxRfUA7RTBjeyNeQTw2PTBPQUtHQHZecy5zQ0tbJiVTazlQamp8V1NtcjoodDlMSGVxeGprWEBKalk0REcgL2Qwb2o2MUw5IEpeQCw9N0VJdCA/Nzd2aylGOCYtMDppSWNed1hxZVlbLjIzb3QgOkdmeT42SDokanBnYG8xXnZSelYvXmMyfHQ5ZGc8XmQtPlZ1Mz9RP0dpNyUrRVIwVTdvWylQZk5lbypgcjMqMXZifEMqYk8+ak0yZylEazhrWDA2aklTNi84YEZPOl9ZK2JdL0tZJURSeFJNQnBzKzFHfVQwZVpNfSlhdHpNY3VaeXh4UGE1NDpsTmdiK1ZDd21XTzlkOnM3cmJDSU4gMHU2c0wrOWl2eWFBbFY6ZVQyJWVkUDBqS15nST49QnYydE1NVT5xUzdDTSZWSChXYSMhWXhpVTRzJFUubzM/Zj5QW0AtZ2BdcENLRHx7cnpSPEUqNHkkKF12TUJVNHBdUnFfZjVKSyFPd2ZLXnNJNDkhLXg2IHtfSWI4eXM9djdrVzYuaFtJIU5YTD92UWVPQUNNXzdUTVg+Z2AgKjRgXlF+YVZYLHZhc05rWi09PXVCfC0xTjhOWXxUL0h6X0RlPERTMyR7aVRlQ1pLZ0pOJj86WjQzKi0mY1szIWMzRSFtZk9YUyw7L100R0RUJjspdlp4MFNacFVvQHckbGhENXclKVZYYlAlMXAgLnJUYkpoRDRObk9pYmFDMj1LI1hbPU5SUT1FREB0WThwZT50YzNFaClTYCgrKXNfaiBBfTR2OjEjb3JUVDt8NF4+KGlWcHNDYyZNISVXPyUwPCR0aGdlOFZSQF51VTdVe2xibTpHYDFfLFYwMnFRO0tsMz1KQm5nO0Y9YmhhWG9dPjJFTntAV0c0Y0tIVU49Zy59Si01T2oyRzF5dF9mMlJadl8oZE18JnNFICpNfUh6RD85UyY6PWh5R01vOGE5Y2BlLnx7dzJ1I3ZQIEM6WnZET1BYeDBgL1shbFFNVCZmckA2fT5vISV0VD9UPS89TUxKUWZ1W3Ywb1JgajAuYUdXV15VPndyPmB4XyVgakE0cyFjaDloLV0vYTVRYVBHOURbW0g+eX5eTWg+Wy5CV1ErIz50LG4lckpGVns0SVF3JTpvYjF9bmI4aGQrJCM+LSEuQ3NHKks+eFYqV2Ajd114OHtKUUhRQUBfaWFwJTsxSGJ8bHBlSit2WXxhfjExcUNnPCEhZ310IGp6UDBeKGxtfDstKyRkJmY6aktVRXp3QFlxKzMvJlZrZ1pMdzVmVC1JaFV8e15EfXFIW09sd31AOSFzdGUoKV03Szg+UXckKFd1Yj5FJSt5bEEwSXRrQWI6Ln4xMUFNaG8qZGJIOHMlRXtmSk9GR0RCJmpAbnYwaTMzJjExbHhFOU1MRHBPZTdCcGJeX1hlVmBDQm1MYG5LKi96SFNkIUVafmp2Vjc7VzBkY1ZZVXZqNmlAOiAwfGFzS3wxSW9fWGdXN3F7XXhWdHpUclIqd29WIVBacSh5ZEdMLiA5bC9VPD10IGErTGlKU1gqQUZkPTB6JGRMe1V7diYlV3ZPalZpOEV0OzthMl5JXld0M0xVc3QqayF6TDs9SWB+TyVSPFM='
+
+# Search endpoint of the flights api; point it to `manage.py replay_server` to work offline
+FLIGHT_API_BASE_URL = 'https://api-air-flightsearch-blue.smiles.com.br/v1/airlines/search'
+
+# Connection pool shared by the flights api client
+FLIGHT_API_CONNECTOR_LIMIT = 100
+FLIGHT_API_KEEPALIVE_TIMEOUT = 30  # seconds
+FLIGHT_API_DNS_CACHE_TTL = 300  # seconds
+
+# Throttling of requests to the flights api
+FLIGHT_API_MAX_CONCURRENCY = 10
+FLIGHT_API_RATE_LIMIT = 10.0  # requests per second, shared by the whole process
+FLIGHT_API_RATE_LIMIT_BURST = 10
+# Alias from CACHES counting the requests of every process, so the web server workers,
+# prefetch_routes and check_watches share FLIGHT_API_RATE_LIMIT instead of each using all of
+# it. Needs a cache shared by the processes with atomic increments, such as Redis or Memcached.
+FLIGHT_API_RATE_LIMIT_CACHE = None
+
+# Retries of failed requests to the flights api
+FLIGHT_API_RETRY_STATUSES = {429: 5, 500: 3, 502: 3, 503: 3, 504: 3}  # status: max attempts
+FLIGHT_API_RETRY_ATTEMPTS = 3  # max attempts on connection errors and timeouts
+FLIGHT_API_RETRY_BACKOFF = 0.5  # seconds, doubled on every attempt
+FLIGHT_API_RETRY_MAX_BACKOFF = 8.0  # seconds
+FLIGHT_API_RETRY_MAX_RETRY_AFTER = 30.0  # seconds; a longer Retry-After fails the request instead
+FLIGHT_API_RETRY_BUDGET = 20  # seconds of retrying allowed per search or bulk search
+
+# Decoder of flights api responses: 'auto' (msgspec, then orjson, then json), 'msgspec', 'orjson' or 'json'
+FLIGHT_API_JSON_DECODER = 'auto'
+
+# Cache of flights api responses used by the search service
+FLIGHT_SEARCH_CACHE_TTL = 300  # seconds, 0 disables the cache
+FLIGHT_SEARCH_CACHE_MAXSIZE = 1024  # responses kept in memory
+FLIGHT_SEARCH_CACHE_BACKEND = None  # optional alias from CACHES used as a shared tier
+FLIGHT_SEARCH_CACHE_STALE_TTL = 60  # seconds an expired response is served while it refreshes
+
+# Warming of the search cache by `manage.py prefetch_routes`
+FLIGHT_PREFETCH_ROUTES = []  # e.g. [{'origin': 'CNF', 'destination': 'GRU', 'days': 14, 'weight': 3}]
+FLIGHT_PREFETCH_BUDGET = 200  # searches fetched per run
+FLIGHT_PREFETCH_CONCURRENCY = 2
+FLIGHT_PREFETCH_RATE_LIMIT_KEEP = 5  # rate limiter tokens always left for interactive searches
+FLIGHT_PREFETCH_RATE_SHARE = 0.2  # fraction of FLIGHT_API_RATE_LIMIT warming uses at most
+
+# Timings of each search (DNS, connecting, upstream server, decoding, parsing, ranking):
+# None disables them, 'log' logs them to flights.timing and 'response' also sends them
+# in a Server-Timing header, or in the 'done' event of streamed searches.
+FLIGHT_SEARCH_TIMINGS = None
+
+# Prometheus metrics of searches and of the flights api, served at /metrics. The view has no
+# authentication, so only enable it where the endpoint isn't reachable from outside.
+FLIGHT_METRICS_ENABLED = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'flights.timing': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Number of cheapest flights shown per search, None shows them all
+FLIGHT_SEARCH_RESULTS_LIMIT = 50
+
+# Storage of finished searches, shown at /results/<search id>/
+FLIGHT_SEARCH_RESULTS_CACHE = 'default'  # alias from CACHES; use a shared cache with several workers
+FLIGHT_SEARCH_RESULTS_TTL = 3600  # seconds
+
+# Cache of the cheapest fare per route and day, used by the fare calendar at /calendar/
+FLIGHT_FARE_CALENDAR_CACHE = 'default'  # alias from CACHES
+FLIGHT_FARE_CALENDAR_TTL = 1800  # seconds
+
+# History of every fare fetched from the flights api, stored as FareObservation rows by a
+# background thread, in batches, so searches never wait on the database
+FLIGHT_FARE_HISTORY_ENABLED = True
+FLIGHT_FARE_HISTORY_BATCH_SIZE = 500  # fares per insert
+FLIGHT_FARE_HISTORY_FLUSH_INTERVAL = 5.0  # seconds between writes
+FLIGHT_FARE_HISTORY_MAX_PENDING = 50000  # fares waiting to be written; more are dropped
+FLIGHT_FARE_HISTORY_MAX_AGE = None  # seconds; if set, the fare calendar serves days observed since from the history
+
+# Price watches re-checked by `manage.py check_watches`
+FLIGHT_WATCH_BUDGET = 200  # routes and dates searched per run
+FLIGHT_WATCH_RATE_LIMIT_KEEP = 5  # rate limiter tokens always left for interactive searches
+FLIGHT_WATCH_RATE_SHARE = 0.2  # fraction of FLIGHT_API_RATE_LIMIT the checks use at most
+
+# City groups searched as a single origin or destination, e.g. {'SAO': ('GRU', 'CGH', 'VCP')}.
+# Defaults to flights.airport_groups.DEFAULT_AIRPORT_GROUPS.
+# FLIGHT_AIRPORT_GROUPS = {}
+
+# Source of the in-memory index of valid airports: 'database' or 'csv'
+FLIGHT_AIRPORT_INDEX_SOURCE = 'database'